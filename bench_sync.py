@@ -0,0 +1,153 @@
+# bench_sync.py
+# SPDX-License-Identifier: MIT
+"""
+Banc de débit de la partie Calendar contre la doublure locale (gcal_standin.py), sans compte
+Google : agendas synthétiques de 1k à 50k évènements ; pour chaque opération, appels API,
+requêtes batch, erreurs injectées, durée et évènements/s.
+    python bench_sync.py [1000 10000 50000]
+Latence et erreurs : variables STANDIN_* (voir gcal_standin.py). Le limiteur de débit local
+est coupé (GCAL_MAX_QPS=0) sauf s'il est défini explicitement.
+"""
+from __future__ import annotations
+
+import json, os, random, sys, tempfile, time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Callable
+
+from gcal_standin import GcalStandin, standin_service
+
+BENCH_SIZES      = os.getenv("BENCH_SIZES", "1000,10000,50000")
+BENCH_SAMPLE     = int(os.getenv("BENCH_SAMPLE", "200"))      # recherches unitaires (_find_existing_event)
+BENCH_SINK_WEEKS = int(os.getenv("BENCH_SINK_WEEKS", "10"))   # semaines passées par GoogleCalendarSink
+BENCH_OUT        = os.getenv("BENCH_OUT", "bench_results.json")
+
+SUBJECTS = ["MATHEMATIQUES", "FRANCAIS", "HISTOIRE-GEOGRAPHIE", "ANGLAIS LV1", "ESPAGNOL LV2",
+            "PHYSIQUE-CHIMIE", "SVT", "EPS", "TECHNOLOGIE", "ARTS PLASTIQUES"]
+FIRST_MONDAY = datetime(2025, 9, 1)
+
+def synthetic_lessons(n: int, Lesson) -> List[Any]:
+    """n cours : 8 par jour, lundi-vendredi, semaines consécutives."""
+    out = []
+    for i in range(n):
+        week, rest = divmod(i, 40)
+        day, slot = divmod(rest, 8)
+        start = FIRST_MONDAY + timedelta(weeks=week, days=day, hours=8 + slot)
+        out.append(Lesson(SUBJECTS[(i * 7) % len(SUBJECTS)], f"S{100 + (i % 37)}", start, start + timedelta(minutes=55)))
+    return out
+
+class Bench:
+    def __init__(self, standin: GcalStandin):
+        self.standin = standin
+        self.rows: List[Dict[str, Any]] = []
+
+    def measure(self, size: int, op: str, fn: Callable[[], int]) -> None:
+        before = self.standin.snapshot()
+        t0 = time.perf_counter()
+        events = fn()
+        wall = time.perf_counter() - t0
+        after = self.standin.snapshot()
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+        row = {"size": size, "op": op, "events": events,
+               "api_calls": sum(v for k, v in delta.items() if k.startswith("calendar.")),
+               "batches": delta.get("batch", 0),
+               "injected": sum(v for k, v in delta.items() if k.startswith("injected.")),
+               "wall_s": round(wall, 3), "events_per_s": round(events / wall, 1) if wall > 0 else 0.0,
+               "by_method": {k: v for k, v in delta.items() if v}}
+        self.rows.append(row)
+        print(f"{size:>6} {op:<16} {events:>7} {row['api_calls']:>8} {row['batches']:>7} "
+              f"{row['injected']:>8} {wall:>9.2f} {row['events_per_s']:>10.1f}", flush=True)
+
+def bench_size(bench: Bench, n: int, m, eng) -> None:
+    svc = standin_service(bench.standin.url)
+    cal = f"bench{n}@group.calendar.google.com"
+    rng = random.Random(n)
+    lessons = synthetic_lessons(n, eng.Lesson)
+    desired = {d.key: d for d in (m.build_event_body(t) for t in lessons)}
+    bodies = [dict(d.body(), created="2025-01-01T00:00:00.000Z") for d in desired.values()]
+    # bruit : 1 % de doublons (ids aléatoires, plus récents), 1 % de préfixes doublés
+    dups = [{k: v for k, v in b.items() if k != "id"} for b in rng.sample(bodies, max(1, n // 100))]
+    for b in dups: b["created"] = "2025-06-01T00:00:00.000Z"
+    for b in rng.sample(bodies, max(1, n // 100)): b["summary"] = m.TITLE_PREFIX + b["summary"]
+    bench.standin.seed(cal, bodies + dups)
+    tmin = FIRST_MONDAY - timedelta(days=1)
+    tmax = lessons[-1].end_dt + timedelta(days=1)
+
+    bench.measure(n, "list_window", lambda: len(m._list_events_window(svc, cal, tmin, tmax, True)))
+
+    sample = rng.sample(list(desired.values()), min(BENCH_SAMPLE, n))
+    def _find() -> int:
+        for d in sample: m._find_existing_event(svc, cal, d.body(), d.summary, d.location, d.key)
+        return len(sample)
+    bench.measure(n, "find_existing", _find)
+
+    def _strip() -> int:
+        total, _changed = m.strip_calendar_prefixes(svc, cal, tmin, tmax, regex=r"^\s*\[Mo\]\s*(?=\[Mo\])")
+        return total
+    bench.measure(n, "strip_prefixes", _strip)
+
+    bench.measure(n, "purge_dedup", lambda: m.purge_calendar_events(
+        svc, cal, tmin, tmax, only_source=True, dedup=True, tol_min=10)["scanned"])
+
+    def _reconcile(batch: bool) -> int:
+        # run suivant : 2 % de salles changées, 1 % de cours disparus, 1 % de nouveaux
+        want = dict(desired)
+        for k in rng.sample(list(want), max(1, n // 50)):
+            d = want[k]
+            want[k] = eng.DesiredEvent(d.key, d.summary, d.location + "b", d.start, d.end, d.time_zone,
+                                       color_id=d.color_id, event_id=d.event_id, private=d.private)
+        for k in rng.sample(list(want), max(1, n // 100)): del want[k]
+        last = lessons[-1].start_dt
+        for i in range(max(1, n // 100)):
+            d = m.build_event_body(eng.Lesson("ETUDE", "CDI", last + timedelta(days=1 + i // 8, hours=i % 8),
+                                              last + timedelta(days=1 + i // 8, hours=i % 8, minutes=55)))
+            want[d.key] = d
+        owned = {ev["extendedProperties"]["private"]["dedupe"]: ev
+                 for ev in m._list_events_window(svc, cal, tmin, tmax + timedelta(days=30), True)}
+        rec = eng.CalendarReconciler(svc, cal, lookup=lambda k, _d: owned.get(k), owned=owned, delete_missing=True)
+        rec.apply(rec.diff(want), batch=batch)
+        desired.clear(); desired.update(want)
+        return len(want)
+    bench.measure(n, "diff_loop", lambda: _reconcile(batch=False))
+    bench.measure(n, "diff_batched", lambda: _reconcile(batch=True))
+
+    def _sink() -> int:
+        weeks: Dict[datetime, List[Any]] = {}
+        for t in lessons[:BENCH_SINK_WEEKS * 40]:
+            mon = datetime.combine(t.start_dt.date() - timedelta(days=t.start_dt.weekday()), datetime.min.time())
+            weeks.setdefault(mon, []).append(t)
+        target = m.parse_targets([{"calendar_id": cal}])[0]
+        sink = m.GoogleCalendarSink(target, 0, "sync", datetime.now(), (tmin, tmax))
+        sink.open()
+        try:
+            for mon, ls in sorted(weeks.items()):
+                sink.consume(eng.ScrapedWeek(mon.date().isoformat(), mon, mon + timedelta(days=7), ls, complete=True))
+            sink.finish()
+        finally:
+            sink.close()
+        return sum(len(ls) for ls in weeks.values())
+    bench.measure(n, "sink_weeks", _sink)
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or [int(s) for s in BENCH_SIZES.split(",") if s.strip()]
+    work = tempfile.mkdtemp(prefix="bench_sync_")
+    os.environ.setdefault("GCAL_MAX_QPS", "0")
+    os.environ.setdefault("STATE_DIR", os.path.join(work, "state"))
+    os.environ.setdefault("LEGACY_ID_MIGRATION", "0")   # régime établi : pas de recherche par cours
+    with GcalStandin() as standin:
+        os.environ["GCAL_STANDIN_URL"] = standin.url
+        import sync_engine as eng
+        import pronote_playwright_to_family_mo as m
+        eng.LOG_CTX.screen_dir = os.path.join(work, "artifacts")
+        print(f"[BENCH] doublure {standin.url} latence={standin.latency_ms}ms erreurs={standin.error_rate:.0%} "
+              f"GCAL_MAX_QPS={os.environ['GCAL_MAX_QPS']}")
+        print(f"{'taille':>6} {'opération':<16} {'évts':>7} {'appels':>8} {'batchs':>7} {'injectés':>8} {'durée s':>9} {'évts/s':>10}")
+        bench = Bench(standin)
+        for n in sizes:
+            bench_size(bench, n, m, eng)
+    with open(BENCH_OUT, "w", encoding="utf-8") as f:
+        json.dump({"sizes": sizes, "latency_ms": standin.latency_ms, "error_rate": standin.error_rate,
+                   "rows": bench.rows}, f, ensure_ascii=False, indent=2)
+    print(f"[BENCH] résultats -> {BENCH_OUT}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
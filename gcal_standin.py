@@ -0,0 +1,385 @@
+# gcal_standin.py
+# SPDX-License-Identifier: MIT
+"""
+Doublure locale de l'API Google Calendar v3, limitée à ce que la synchro utilise : events
+list (timeMin/timeMax, privateExtendedProperty, pageToken, syncToken), get, insert, patch,
+update, delete, calendars.get et requêtes batch (multipart/mixed). Séries : le maître est listé
+sur toute sa durée (jusqu'à UNTIL) et le patch d'une instance (<id>_<début UTC>) crée son
+exception ; pas d'expansion singleEvents. Latence, erreurs de quota 403/429 et expiration de
+syncToken (410) injectables ; compteurs d'appels par méthode.
+    python gcal_standin.py [port]   puis   GCAL_STANDIN_URL=http://127.0.0.1:<port>/
+"""
+from __future__ import annotations
+
+import bisect, itertools, json, os, random, re, socket, sys, threading, time, uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:   # Python < 3.9 : dateTime sans offset lus en UTC
+    ZoneInfo = None
+
+# ===== Défauts (surchargeables à la construction) =====
+STANDIN_LATENCY_MS     = int(os.getenv("STANDIN_LATENCY_MS", "0"))      # par requête HTTP
+STANDIN_JITTER_MS      = int(os.getenv("STANDIN_JITTER_MS", "0"))       # + aléa uniforme [0, jitter]
+STANDIN_BATCH_ITEM_MS  = int(os.getenv("STANDIN_BATCH_ITEM_MS", "0"))   # + par sous-requête d'un batch
+STANDIN_ERROR_RATE     = float(os.getenv("STANDIN_ERROR_RATE", "0"))    # probabilité 403/429 par appel
+STANDIN_ERROR_CODES    = os.getenv("STANDIN_ERROR_CODES", "403,429")
+STANDIN_SYNC_EXPIRY    = float(os.getenv("STANDIN_SYNC_EXPIRY", "0"))   # probabilité 410 sur un list syncToken
+STANDIN_SEED           = os.getenv("STANDIN_SEED", "")
+
+_EVENTS_RE = re.compile(r"^/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?$")
+_CAL_RE    = re.compile(r"^/calendar/v3/calendars/([^/]+)$")
+_ID_RE     = re.compile(r"^[a-v0-9]{5,1024}$")   # base32hex, comme l'API
+_INST_RE   = re.compile(r"^([a-v0-9]+)_(\d{8}T\d{6}Z)$")   # instance d'une série
+_UNTIL_RE  = re.compile(r"UNTIL=(\d{8}T\d{6})Z")
+_NO_SYNC_WITH = ("timeMin", "timeMax", "privateExtendedProperty", "sharedExtendedProperty", "q", "orderBy", "updatedMin")
+_REASONS = {403: ("usageLimits", "rateLimitExceeded", "Rate Limit Exceeded"),
+            429: ("usageLimits", "rateLimitExceeded", "Too Many Requests"),
+            410: ("global", "fullSyncRequired", "Sync token is no longer valid, a full sync is required.")}
+
+def _error(code: int, reason: str = "", message: str = "") -> Tuple[int, Dict[str, Any]]:
+    domain, r, msg = _REASONS.get(code, ("global", reason or "invalid", message or "Error"))
+    return code, {"error": {"errors": [{"domain": domain, "reason": reason or r, "message": message or msg}],
+                            "code": code, "message": message or msg}}
+
+def _now_rfc3339() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+def _tz(name: str):
+    if ZoneInfo and name:
+        try: return ZoneInfo(name)
+        except Exception: pass
+    return timezone.utc
+
+def _parse_dt(v: Dict[str, str]) -> Optional[datetime]:
+    """start/end d'un évènement -> datetime aware (dateTime sans offset : dans son timeZone)."""
+    s = (v or {}).get("dateTime") or (v or {}).get("date")
+    if not s: return None
+    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=_tz(v.get("timeZone", "")))
+
+def _render_dt(v: Dict[str, str]) -> Dict[str, str]:
+    """Comme l'API : dateTime toujours avec offset, dans le timeZone de l'évènement."""
+    if "dateTime" not in v: return dict(v)
+    dt = _parse_dt(v)
+    if v.get("timeZone"): dt = dt.astimezone(_tz(v["timeZone"]))
+    return dict(v, dateTime=dt.isoformat())
+
+def _merge(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    """Sémantique patch : objets fusionnés récursivement, listes et scalaires remplacés."""
+    for k, v in src.items():
+        if isinstance(v, dict) and isinstance(dst.get(k), dict): _merge(dst[k], v)
+        else: dst[k] = v
+
+class _Calendar:
+    """Évènements d'un agenda, indexés par début (bisect) pour les listings fenêtrés."""
+    def __init__(self, cal_id: str):
+        self.id = cal_id
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.by_start: List[Tuple[float, str]] = []
+        self.max_len = 0.0
+        self.seq = 0   # numéro de modification : base des syncToken
+
+    def _index(self, ev: Dict[str, Any], add: bool) -> None:
+        if "_end" not in ev: return
+        item = (ev["_start"], ev["id"])
+        if add:
+            bisect.insort(self.by_start, item); self.max_len = max(self.max_len, ev["_end"] - ev["_start"])
+        else:
+            i = bisect.bisect_left(self.by_start, item)
+            if i < len(self.by_start) and self.by_start[i] == item: del self.by_start[i]
+
+    def put(self, ev: Dict[str, Any], old: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if old is not None: self._index(old, add=False)
+        self.seq += 1
+        ev["updated"] = _now_rfc3339(); ev["etag"] = f'"{self.seq}"'; ev["_seq"] = self.seq
+        s, e = _parse_dt(ev.get("start", {})), _parse_dt(ev.get("end", {}))
+        if s and e: ev["_start"], ev["_end"] = s.timestamp(), e.timestamp()   # bornes pré-calculées (listings)
+        m = s and e and _UNTIL_RE.search(" ".join(ev.get("recurrence") or []))
+        if m:   # série : jusqu'à la fin de sa dernière instance
+            until = datetime.strptime(m.group(1), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+            ev["_end"] = max(ev["_end"], until.timestamp() + (e - s).total_seconds())
+        self.events[ev["id"]] = ev
+        self._index(ev, add=True)
+        return ev
+
+    def window(self, tmin: Optional[float], tmax: Optional[float]) -> List[Dict[str, Any]]:
+        if tmin is None and tmax is None:
+            return [self.events[i] for _s, i in self.by_start]
+        lo = 0 if tmin is None else bisect.bisect_left(self.by_start, (tmin - self.max_len, ""))
+        hi = len(self.by_start) if tmax is None else bisect.bisect_left(self.by_start, (tmax, ""))
+        out = []
+        for _s, i in self.by_start[lo:hi]:
+            ev = self.events[i]
+            if tmin is None or ev["_end"] > tmin: out.append(ev)
+        return out
+
+def _public(ev: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in ev.items() if not k.startswith("_")}
+    for k in ("start", "end"):
+        if k in out: out[k] = _render_dt(out[k])
+    return out
+
+class GcalStandin:
+    """
+    Serveur HTTP local (thread démon). Un agenda est créé au premier accès ; seed() remplit
+    un agenda sans passer par HTTP ni compter d'appels. counters : appels par méthode.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: int = STANDIN_LATENCY_MS,
+                 jitter_ms: int = STANDIN_JITTER_MS, batch_item_ms: int = STANDIN_BATCH_ITEM_MS,
+                 error_rate: float = STANDIN_ERROR_RATE, error_codes: str = STANDIN_ERROR_CODES,
+                 sync_expiry: float = STANDIN_SYNC_EXPIRY, seed: str = STANDIN_SEED):
+        self.host, self.port = host, port
+        self.latency_ms, self.jitter_ms, self.batch_item_ms = latency_ms, jitter_ms, batch_item_ms
+        self.error_rate, self.sync_expiry = error_rate, sync_expiry
+        self.error_codes = [int(c) for c in str(error_codes).split(",") if c.strip()]
+        self.rng = random.Random(seed or None)
+        self.calendars: Dict[str, _Calendar] = {}
+        self.counters: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._cursors: Dict[str, Tuple[List[str], int]] = {}
+        self._lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    # ----- état -----
+    def calendar(self, cal_id: str) -> _Calendar:
+        cal = self.calendars.get(cal_id)
+        if cal is None: cal = self.calendars[cal_id] = _Calendar(cal_id)
+        return cal
+
+    def seed(self, cal_id: str, bodies: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            cal = self.calendar(cal_id)
+            for b in bodies:
+                ev = json.loads(json.dumps(b))
+                ev.setdefault("id", uuid.uuid4().hex[:26])
+                ev.setdefault("status", "confirmed"); ev.setdefault("created", _now_rfc3339())
+                cal.put(ev)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock: return dict(self.counters)
+
+    # ----- API -----
+    def call(self, method: str, path: str, query: Dict[str, List[str]], body: Optional[Dict[str, Any]]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Une requête API (hors batch) -> (statut, JSON)."""
+        m = _EVENTS_RE.match(path)
+        if m:
+            cal_id, ev_id = unquote(m.group(1)), unquote(m.group(2)) if m.group(2) else None
+            name = {("GET", False): "list", ("POST", False): "insert", ("GET", True): "get",
+                    ("PATCH", True): "patch", ("PUT", True): "update", ("DELETE", True): "delete"}.get((method, bool(ev_id)))
+        else:
+            m = _CAL_RE.match(path)
+            if not (m and method == "GET"): return _error(404, "notFound", f"{method} {path}")
+            cal_id, ev_id, name = unquote(m.group(1)), None, "calendars.get"
+        if name is None: return _error(405, "methodNotAllowed", f"{method} {path}")
+        method_id = name if name.startswith("calendars") else f"events.{name}"
+        with self._lock:
+            self._count(f"calendar.{method_id}")
+            if self.error_codes and self.rng.random() < self.error_rate:
+                code = self.rng.choice(self.error_codes); self._count(f"injected.{code}")
+                return _error(code)
+            if name == "calendars.get":
+                return 200, {"kind": "calendar#calendar", "id": "standin@local" if cal_id == "primary" else cal_id,
+                             "summary": "standin" if cal_id == "primary" else f"standin {cal_id}", "timeZone": "Europe/Paris"}
+            return getattr(self, f"_{name}")(self.calendar(cal_id), ev_id, query, body or {})
+
+    def _list(self, cal: _Calendar, _ev_id, q: Dict[str, List[str]], _body) -> Tuple[int, Dict[str, Any]]:
+        one = lambda k, d=None: (q.get(k) or [d])[0]
+        page_size = max(1, min(2500, int(one("maxResults", "250"))))
+        token = one("pageToken")
+        if token and token in self._cursors:
+            # suite d'un listing : résultat figé au 1er appel (curseur), état courant des évènements
+            ids, start = self._cursors.pop(token)
+            items = [cal.events[i] for i in ids if i in cal.events]
+            return self._page(cal, items, start, page_size, ids)
+        sync = one("syncToken")
+        if sync is not None:
+            if any(k in q for k in _NO_SYNC_WITH):
+                return _error(400, "invalid", "syncToken ne se combine pas avec les filtres")
+            if not sync.isdigit() or int(sync) > cal.seq or self.rng.random() < self.sync_expiry:
+                self._count("sync.410"); return _error(410)
+            items = sorted((e for e in cal.events.values() if e["_seq"] > int(sync)), key=lambda e: e["_seq"])
+        else:
+            tmin = _parse_dt({"dateTime": one("timeMin")}) if one("timeMin") else None
+            tmax = _parse_dt({"dateTime": one("timeMax")}) if one("timeMax") else None
+            items = cal.window(tmin and tmin.timestamp(), tmax and tmax.timestamp())
+            if one("showDeleted", "false") != "true":
+                items = [e for e in items if e.get("status") != "cancelled"]
+            for prop in q.get("privateExtendedProperty", []):
+                k, _, v = prop.partition("=")
+                items = [e for e in items if e.get("extendedProperties", {}).get("private", {}).get(k) == v]
+        if token: return _error(400, "invalid", "Invalid page token")
+        return self._page(cal, items, 0, page_size, [e["id"] for e in items])
+
+    def _page(self, cal: _Calendar, items: List[Dict[str, Any]], start: int, page_size: int,
+              ids: List[str]) -> Tuple[int, Dict[str, Any]]:
+        res: Dict[str, Any] = {"kind": "calendar#events", "summary": cal.id, "timeZone": "Europe/Paris",
+                               "items": [_public(e) for e in items[start:start + page_size]]}
+        if start + page_size < len(items):
+            token = f"p{next(self._ids)}"
+            self._cursors[token] = (ids, start + page_size)
+            while len(self._cursors) > 256: self._cursors.pop(next(iter(self._cursors)))   # listings abandonnés
+            res["nextPageToken"] = token
+        else:
+            res["nextSyncToken"] = str(cal.seq)
+        return 200, res
+
+    def _get(self, cal: _Calendar, ev_id: str, _q, _body):
+        ev = cal.events.get(ev_id)
+        return (200, _public(ev)) if ev else _error(404, "notFound", "Not Found")
+
+    def _insert(self, cal: _Calendar, _ev_id, _q, body: Dict[str, Any]):
+        ev_id = body.get("id") or f"standin{next(self._ids):08d}"
+        if not _ID_RE.match(ev_id): return _error(400, "invalid", "Invalid resource id value.")
+        if ev_id in cal.events: return _error(409, "duplicate", "The requested identifier already exists.")
+        if not (_parse_dt(body.get("start", {})) and _parse_dt(body.get("end", {}))):
+            return _error(400, "required", "Missing time.")
+        now = _now_rfc3339()
+        ev = dict(json.loads(json.dumps(body)), id=ev_id, kind="calendar#event", created=now,
+                  status=body.get("status", "confirmed"), iCalUID=f"{ev_id}@google.com", sequence=0,
+                  htmlLink=f"http://standin.local/event?eid={ev_id}")
+        return 200, _public(cal.put(ev))
+
+    def _exception(self, cal: _Calendar, ev_id: str) -> Optional[Dict[str, Any]]:
+        """Instance <id maître>_<début UTC> d'une série -> nouvelle exception (copie du maître à cette date)."""
+        m = _INST_RE.match(ev_id)
+        master = cal.events.get(m.group(1)) if m else None
+        if not master or not master.get("recurrence") or master.get("status") == "cancelled": return None
+        orig = datetime.strptime(m.group(2), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        tz_name = master.get("start", {}).get("timeZone", "")
+        length = _parse_dt(master["end"]) - _parse_dt(master["start"])
+        ev = {k: json.loads(json.dumps(v)) for k, v in master.items()
+              if not k.startswith("_") and k not in ("recurrence", "etag", "updated", "sequence")}
+        return dict(ev, id=ev_id, recurringEventId=master["id"], iCalUID=master.get("iCalUID"),
+                    originalStartTime={"dateTime": orig.isoformat(), "timeZone": tz_name},
+                    start={"dateTime": orig.astimezone(_tz(tz_name)).isoformat(), "timeZone": tz_name},
+                    end={"dateTime": (orig + length).astimezone(_tz(tz_name)).isoformat(), "timeZone": tz_name})
+
+    def _patch(self, cal: _Calendar, ev_id: str, _q, body: Dict[str, Any]):
+        old = cal.events.get(ev_id)
+        base = old or self._exception(cal, ev_id)
+        if base is None: return _error(404, "notFound", "Not Found")
+        ev = json.loads(json.dumps(base)); _merge(ev, json.loads(json.dumps(body)))
+        ev["id"] = ev_id; ev["sequence"] = base.get("sequence", 0) + 1
+        return 200, _public(cal.put(ev, old))
+
+    def _update(self, cal: _Calendar, ev_id: str, _q, body: Dict[str, Any]):
+        old = cal.events.get(ev_id)
+        if old is None: return _error(404, "notFound", "Not Found")
+        keep = {k: old[k] for k in ("kind", "created", "iCalUID", "htmlLink") if k in old}
+        ev = dict(json.loads(json.dumps(body)), **keep, id=ev_id, sequence=old.get("sequence", 0) + 1)
+        ev.setdefault("status", "confirmed")
+        return 200, _public(cal.put(ev, old))
+
+    def _delete(self, cal: _Calendar, ev_id: str, _q, _body):
+        old = cal.events.get(ev_id)
+        if old is None: return _error(404, "notFound", "Not Found")
+        if old.get("status") == "cancelled": return _error(410, "deleted", "Resource has been deleted")
+        cal.put(dict(old, status="cancelled"), old)   # comme l'API : l'id reste pris (insert -> 409)
+        return 204, None
+
+    def batch(self, content_type: str, raw: bytes) -> Tuple[str, bytes]:
+        """Requête batch multipart/mixed -> réponse multipart/mixed (Content-ID: response-...)."""
+        with self._lock: self._count("batch")
+        msg = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + raw)
+        boundary = "batch_" + uuid.uuid4().hex
+        out: List[bytes] = []
+        for part in msg.get_payload():
+            payload = part.get_payload(decode=True) or b""
+            head, _, body = payload.replace(b"\r\n", b"\n").partition(b"\n\n")
+            lines = head.decode("utf-8").split("\n")
+            method, target = lines[0].split(" ")[:2]
+            url = urlsplit(target)
+            if self.batch_item_ms: time.sleep(self.batch_item_ms / 1000)
+            status, res = self.call(method, url.path, parse_qs(url.query), json.loads(body) if body.strip() else None)
+            data = json.dumps(res).encode() if res is not None else b""
+            cid = (part.get("Content-ID") or "").strip("<>")
+            out.append(b"--" + boundary.encode() + b"\r\nContent-Type: application/http\r\n"
+                       + f"Content-ID: <response-{cid}>\r\n\r\n".encode()
+                       + f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n".encode()
+                       + b"Content-Type: application/json; charset=UTF-8\r\n"
+                       + f"Content-Length: {len(data)}\r\n\r\n".encode() + data + b"\r\n")
+        out.append(b"--" + boundary.encode() + b"--\r\n")
+        return f"multipart/mixed; boundary={boundary}", b"".join(out)
+
+    # ----- serveur -----
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive : httplib2 réutilise la connexion
+
+            def setup(self) -> None:
+                super().setup()
+                # en-têtes et corps partent en deux écritures : sans TCP_NODELAY, ~40 ms d'ACK retardé par appel
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _reply(self, status: int, ctype: str, data: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if data: self.wfile.write(data)
+
+            def _handle(self) -> None:
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                delay = standin.latency_ms + (standin.rng.uniform(0, standin.jitter_ms) if standin.jitter_ms else 0)
+                if delay: time.sleep(delay / 1000)
+                url = urlsplit(self.path)
+                if url.path.startswith("/batch"):
+                    ctype, data = standin.batch(self.headers.get("Content-Type", ""), raw)
+                    self._reply(200, ctype, data); return
+                status, res = standin.call(self.command, url.path, parse_qs(url.query),
+                                           json.loads(raw) if raw.strip() else None)
+                self._reply(status, "application/json; charset=UTF-8", json.dumps(res).encode() if res is not None else b"")
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+            def log_message(self, fmt, *args): pass
+
+        return Handler
+
+    def start(self) -> "GcalStandin":
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="gcal-standin", daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown(); self.server.server_close(); self.server = None
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc): self.stop()
+
+def standin_service(url: str):
+    """Service googleapiclient pointé sur la doublure (sans OAuth), batch compris."""
+    import httplib2
+    from googleapiclient.discovery import build
+    from googleapiclient.http import BatchHttpRequest
+    url = url.rstrip("/") + "/"
+    svc = build("calendar", "v3", http=httplib2.Http(timeout=60), static_discovery=True,
+                client_options={"api_endpoint": url + "calendar/v3/"})
+    # l'URI batch vient du document de découverte (rootUrl), pas de api_endpoint
+    svc.new_batch_http_request = lambda callback=None: BatchHttpRequest(callback=callback, batch_uri=url + "batch/calendar/v3")
+    return svc
+
+if __name__ == "__main__":
+    standin = GcalStandin(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8770).start()
+    print(f"[STANDIN] {standin.url}  (GCAL_STANDIN_URL={standin.url})", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
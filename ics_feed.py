@@ -0,0 +1,212 @@
+# ics_feed.py
+# SPDX-License-Identifier: MIT
+"""
+Sink ICS (RFC 5545) : alternative sans quota ni latence à l'API Google Calendar.
+Les cours voulus sont écrits dans un fichier .ics (UID stable = clé dedupe) ; seuls les
+VEVENT modifiés sont réécrits, le fichier est remplacé atomiquement. Un petit serveur HTTP
+(optionnel) le publie pour un abonnement en lecture seule depuis Google / Apple / Outlook.
+"""
+from __future__ import annotations
+
+import os, sys
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, List, Callable
+
+from sync_engine import EventSink, ScrapedWeek, DesiredEvent, Lesson, log
+
+PRODID     = "-//pronote-sync//ICS feed//FR"
+UID_DOMAIN = "pronote-sync"
+
+# Europe/Paris (règles UE depuis 1996) : le TZID des DTSTART doit être défini dans le fichier
+VTIMEZONE_PARIS = [
+    "BEGIN:VTIMEZONE", "TZID:Europe/Paris",
+    "BEGIN:DAYLIGHT", "TZOFFSETFROM:+0100", "TZOFFSETTO:+0200", "TZNAME:CEST",
+    "DTSTART:19700329T020000", "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU", "END:DAYLIGHT",
+    "BEGIN:STANDARD", "TZOFFSETFROM:+0200", "TZOFFSETTO:+0100", "TZNAME:CET",
+    "DTSTART:19701025T030000", "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU", "END:STANDARD",
+    "END:VTIMEZONE",
+]
+
+# champs propres au VEVENT qui ne comptent pas comme une modification
+_VOLATILE = ("DTSTAMP:", "SEQUENCE:")
+
+def _esc(text: str) -> str:
+    return (text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _fold(line: str) -> str:
+    """Lignes de 75 octets max, continuation par CRLF + espace, sans couper un caractère UTF-8."""
+    out, cur, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            out.append(cur); cur, size = " ", 1
+        cur += ch; size += n
+    out.append(cur)
+    return "\r\n".join(out)
+
+def _unfold(text: str) -> List[str]:
+    lines: List[str] = []
+    for raw in text.splitlines():
+        if raw[:1] in (" ", "\t") and lines: lines[-1] += raw[1:]
+        elif raw: lines.append(raw)
+    return lines
+
+def _ics_dt(iso: str) -> str:
+    return datetime.fromisoformat(iso).strftime("%Y%m%dT%H%M%S")
+
+def _utc_stamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def render_vevent(d: DesiredEvent, stamp: str, sequence: int = 0, cancelled: bool = False) -> List[str]:
+    """VEVENT (lignes dépliées) d'un évènement voulu ; UID = clé dedupe."""
+    lines = ["BEGIN:VEVENT", f"UID:{d.key}@{UID_DOMAIN}", f"DTSTAMP:{stamp}", f"SEQUENCE:{sequence}",
+             f"DTSTART;TZID={d.time_zone}:{_ics_dt(d.start)}", f"DTEND;TZID={d.time_zone}:{_ics_dt(d.end)}",
+             f"SUMMARY:{_esc(d.summary)}"]
+    if d.location: lines.append(f"LOCATION:{_esc(d.location)}")
+    if d.description: lines.append(f"DESCRIPTION:{_esc(d.description)}")
+    if cancelled: lines.append("STATUS:CANCELLED")
+    lines.append("END:VEVENT")
+    return lines
+
+def _content(lines: List[str]) -> List[str]:
+    return [l for l in lines if not l.startswith(_VOLATILE)]
+
+def _field(lines: List[str], prefix: str) -> str:
+    return next((l.split(":", 1)[1] for l in lines if l.startswith(prefix)), "")
+
+class IcsFeed:
+    """
+    Contenu d'un fichier .ics géré par la synchro : un VEVENT par UID, conservé tel quel
+    (DTSTAMP compris) tant qu'il ne change pas. save() ne réécrit le fichier que si besoin.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.events: Dict[str, List[str]] = {}
+        self.dirty = False
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                cur: Optional[List[str]] = None
+                for line in _unfold(f.read()):
+                    if line == "BEGIN:VEVENT": cur = [line]
+                    elif cur is not None:
+                        cur.append(line)
+                        if line == "END:VEVENT":
+                            uid = _field(cur, "UID:")
+                            if uid: self.events[uid] = cur
+                            cur = None
+
+    def upsert(self, d: DesiredEvent, cancelled: bool = False) -> Optional[str]:
+        """'created' / 'updated' / None (inchangé)."""
+        uid = f"{d.key}@{UID_DOMAIN}"
+        old = self.events.get(uid)
+        seq = int(_field(old, "SEQUENCE:") or 0) if old else 0
+        new = render_vevent(d, _utc_stamp(), seq, cancelled)
+        if old is not None and _content(old) == _content(new):
+            return None
+        if old is not None:
+            new = render_vevent(d, _utc_stamp(), seq + 1, cancelled)
+        self.events[uid] = new; self.dirty = True
+        return "updated" if old is not None else "created"
+
+    def uids_between(self, start: datetime, end: datetime) -> List[str]:
+        out = []
+        for uid, lines in self.events.items():
+            dtstart = next((l.split(":", 1)[1] for l in lines if l.startswith("DTSTART")), "")
+            try: st = datetime.strptime(dtstart[:15], "%Y%m%dT%H%M%S")
+            except ValueError: continue
+            if start <= st < end: out.append(uid)
+        return out
+
+    def remove(self, uid: str) -> None:
+        if self.events.pop(uid, None) is not None: self.dirty = True
+
+    def save(self, name: str = "PRONOTE") -> bool:
+        if not self.dirty and os.path.exists(self.path): return False
+        lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN",
+                 f"X-WR-CALNAME:{_esc(name)}", "X-WR-TIMEZONE:Europe/Paris", *VTIMEZONE_PARIS]
+        for uid in sorted(self.events, key=lambda u: (_field(self.events[u], "DTSTART;"), u)):
+            lines.extend(self.events[uid])
+        lines.append("END:VCALENDAR")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write("\r\n".join(_fold(l) for l in lines) + "\r\n")
+        os.replace(tmp, self.path)   # un client abonné ne lit jamais un fichier partiel
+        self.dirty = False
+        return True
+
+class IcsFeedSink(EventSink):
+    """
+    Sink .ics : mêmes évènements voulus (build) que le sink Google, même balayage des semaines
+    complètes ; le fichier est écrit une fois, à la fin du scrape.
+    """
+    def __init__(self, path: str, build: Callable[[Lesson], DesiredEvent], cal_name: str = "PRONOTE",
+                 sweep: bool = True):
+        self.path = path; self.build = build; self.cal_name = cal_name; self.sweep = sweep
+        self.name = "ics"; self.tag = "[ics] "
+        self.res = {"created": 0, "updated": 0, "deleted": 0, "errors": 0, "unchanged": 0}
+        self.keys: set = set()
+
+    def open(self) -> None:
+        self.feed = IcsFeed(self.path)
+        log(f"{self.tag}{self.path}: {len(self.feed.events)} évènements existants")
+
+    def consume(self, week: ScrapedWeek) -> None:
+        uids = set()
+        for t in week.lessons:
+            d = self.build(t)
+            self.keys.add(d.key); uids.add(f"{d.key}@{UID_DOMAIN}")
+            action = self.feed.upsert(d, cancelled=t.canceled)
+            self.res[action or "unchanged"] += 1
+        if self.sweep and week.complete and uids and week.start and week.end:
+            for uid in self.feed.uids_between(week.start, week.end):
+                if uid not in uids:
+                    self.feed.remove(uid); self.res["deleted"] += 1
+
+    def finish(self) -> Dict[str, Any]:
+        written = self.feed.save(self.cal_name)
+        log(f"{self.tag}{self.path}: {len(self.feed.events)} évènements" + ("" if written else " (inchangé)"))
+        return dict(self.res, found=len(self.keys), keys=len(self.keys))
+
+# ===================== Serveur d'abonnement =====================
+def serve_ics(path: str, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """Publie le fichier en lecture seule (GET/HEAD, ETag + 304) ; Ctrl+C pour arrêter."""
+    route = "/" + os.path.basename(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body: bool) -> None:
+            if self.path.split("?", 1)[0] not in ("/", route):
+                self.send_error(404); return
+            try:
+                st = os.stat(path)
+                with open(path, "rb") as f: data = f.read()
+            except OSError:
+                self.send_error(503, "flux pas encore généré"); return
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304); self.send_header("ETag", etag); self.end_headers(); return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/calendar; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(st.st_mtime, usegmt=True))
+            self.send_header("Cache-Control", "max-age=300")
+            self.end_headers()
+            if body: self.wfile.write(data)
+
+        def do_GET(self): self._send(True)
+        def do_HEAD(self): self._send(False)
+        def log_message(self, fmt, *args): log(f"[ICS] {self.address_string()} {fmt % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    log(f"[ICS] http://{host}:{port}{route} -> {path}")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+if __name__ == "__main__":
+    # python ics_feed.py [fichier.ics] [port]
+    serve_ics(sys.argv[1] if len(sys.argv) > 1 else os.getenv("ICS_FILE", "pronote.ics"),
+              os.getenv("ICS_HOST", "127.0.0.1"), int(sys.argv[2]) if len(sys.argv) > 2 else int(os.getenv("ICS_PORT", "8765")))
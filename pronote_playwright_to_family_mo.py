@@ -2,7 +2,8 @@
 # SPDX-License-Identifier: MIT
 from __future__ import annotations
 
-import os, re, sys, time, json, hashlib, unicodedata, random, math
+import os, re, sys, time, json, hashlib, unicodedata, shutil, socket
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List, Union, Tuple
 
@@ -12,6 +13,15 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from sync_engine import (LessonSource, CalendarReconciler, open_first_available, log, backoff_sleep,
+                         apply_ops_batched, iter_events, JsonlWriter, Lesson, DesiredEvent, ScrapedWeek, sweep_ops,
+                         canonical_status, compact_event, write_plan, read_plan,
+                         EventSink, fan_out, LOG_CTX, PACER, PacingStop, is_pronote_alert,
+                         RunCheckpoint, WriteJournal, BUDGET, BudgetExceeded, ChangeProbe, settle_resume,
+                         to_rfc3339_local, paris_wall, epoch_min)
+from run_metrics import METRICS
+from ics_feed import IcsFeedSink, serve_ics
+
 # ===================== Variables d'env (inchangées) =====================
 ENT_URL       = os.getenv("ENT_URL", "https://ent77.seine-et-marne.fr/welcome")
 PRONOTE_URL   = os.getenv("PRONOTE_URL", "")
@@ -23,6 +33,11 @@ TITLE_PREFIX  = os.getenv("TITLE_PREFIX", "[Mo] ")
 COLOR_ID      = os.getenv("COLOR_ID", "6")
 HEADFUL       = os.getenv("HEADFUL", "0") == "1"
 
+# Plusieurs agendas alimentés par UN scrape : liste JSON (ou chemin d'un fichier JSON) de
+# {"calendar_id", "title_prefix", "color_id", "namespace"}. Vide = CALENDAR_ID / TITLE_PREFIX / COLOR_ID.
+# namespace "" = clés dedupe historiques ; obligatoire et distinct si deux cibles partagent un agenda.
+CALENDAR_TARGETS = os.getenv("CALENDAR_TARGETS", "").strip()
+
 TIMETABLE_PRE_SELECTOR = os.getenv("TIMETABLE_PRE_SELECTOR", "").strip()
 TIMETABLE_SELECTOR     = os.getenv("TIMETABLE_SELECTOR", "").strip()
 TIMETABLE_FRAME        = os.getenv("TIMETABLE_FRAME", "").strip()  # ex: 'parent.html'
@@ -36,17 +51,68 @@ WAIT_AFTER_NAV_MS      = int(os.getenv("WAIT_AFTER_NAV_MS", "1000"))
 # Bornes anti-hang
 MAX_TILES_PER_WEEK     = int(os.getenv("MAX_TILES_PER_WEEK", "120"))
 MAX_CLICK_PER_SELECTOR = int(os.getenv("MAX_CLICK_PER_SELECTOR", "120"))
-WEEK_HARD_TIMEOUT_MS   = int(os.getenv("WEEK_HARD_TIMEOUT_MS", "120000"))
+WEEK_HARD_TIMEOUT_MS   = int(os.getenv("WEEK_HARD_TIMEOUT_MS", "120000"))   # attente max du changement d'en-tête après une navigation
 PANEL_WAIT_MS          = int(os.getenv("PANEL_WAIT_MS", "350"))
 PANEL_RETRIES          = int(os.getenv("PANEL_RETRIES", "8"))
+# Lecture statique d'abord (aria-label + texte des cases, une seule évaluation) ; clic seulement sur
+# les cases ambiguës (date / horaires / matière manquants, statut signalé). 0 = clic sur chaque case.
+STATIC_FIRST           = os.getenv("STATIC_FIRST", "0") == "1"
+
+# Profil Chromium persistant : cache HTTP + cache de code JS conservés entre runs ("" = profil jetable)
+BROWSER_PROFILE_DIR    = os.getenv("BROWSER_PROFILE_DIR", "").strip()
+BROWSER_CACHE_MAX_MB   = int(os.getenv("BROWSER_CACHE_MAX_MB", "300"))
+
+# Diagnostic navigateur (opt-in) : métriques Performance DevTools + timings navigation/ressources
+# après chaque phase et chaque semaine (browser_perf.jsonl) ; trace Playwright d'UNE semaine (0 = aucune)
+BROWSER_PERF           = os.getenv("BROWSER_PERF", "0") == "1"
+TRACE_WEEK             = int(os.getenv("TRACE_WEEK", "0"))
+
+# Mark-and-sweep : dans chaque semaine entièrement relue, supprime les évènements de la source
+# dont la clé n'a pas été produite (cours déplacés / supprimés dans PRONOTE)
+SWEEP_MISSING          = os.getenv("SWEEP_MISSING", "1") == "1"
+
+# Flux .ics (RFC 5545) en plus (ou à la place) de Google Calendar : aucun quota, écrit dès la fin
+# du scrape ; servi en lecture seule par la commande serve-ics (abonnement depuis un agenda)
+ICS_FILE               = os.getenv("ICS_FILE", "").strip()
+ICS_ONLY               = os.getenv("ICS_ONLY", "0") == "1"   # pas d'API Google du tout
+ICS_HOST               = os.getenv("ICS_HOST", "127.0.0.1")
+ICS_PORT               = int(os.getenv("ICS_PORT", "8765"))
+
+# Plusieurs comptes (enfants) dans un seul Chromium : fichier JSON, un contexte isolé par compte.
+# [{"name", "user" | "user_env", "password" | "password_env", "calendar_id", "title_prefix", "color_id",
+#   "namespace", "calendar_targets", "pronote_url", "ics_file"}] ; seuls user/password et un agenda sont requis.
+ACCOUNTS_FILE          = os.getenv("ACCOUNTS_FILE", "").strip()
+ACCOUNTS_PARALLEL      = int(os.getenv("ACCOUNTS_PARALLEL", "2"))   # comptes traités en même temps
+
+# Source API (pronotepy) essayée avant le navigateur ; repli Playwright si login KO / IP suspendue
+USE_API_SOURCE         = os.getenv("USE_API_SOURCE", "1") == "1"
 
 CREDENTIALS_FILE = "credentials.json"
 TOKEN_FILE       = "token.json"
 SCOPES           = ["https://www.googleapis.com/auth/calendar"]
+GCAL_STANDIN_URL = os.getenv("GCAL_STANDIN_URL", "")   # doublure locale (gcal_standin.py) : pas d'OAuth ni de compte Google
 TIMEZONE         = "Europe/Paris"
 
+SOURCE_TAG       = "pronote_playwright"   # extendedProperties.private.source des évènements créés
+
 TIMEOUT_MS  = 120_000
 SCREEN_DIR  = "screenshots"
+STATE_DIR   = os.getenv("STATE_DIR", ".state")   # état persistant entre runs (hors artefacts)
+PLAN_FILE   = os.getenv("PLAN_FILE", os.path.join(STATE_DIR, "gcal_plan.json"))   # commandes plan / apply
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(SCREEN_DIR, "metrics.prom"))   # OpenMetrics, un fichier par run
+# Reprise d'un run interrompu (mode sync) : semaines déjà lues + journal des écritures Calendar
+RESUME_RUNS          = os.getenv("RESUME_RUNS", "1") == "1"
+CHECKPOINT_MAX_AGE_H = float(os.getenv("CHECKPOINT_MAX_AGE_H", "12"))   # au-delà, on repart de zéro
+# Échéance globale (RUN_DEADLINE_S, RUN_RESERVE_S : voir sync_engine) : part maximale pour la connexion,
+# le reste est réparti entre les semaines ; chaque timeout Playwright est pris dans la tranche en cours
+CONNECT_BUDGET_SHARE = float(os.getenv("CONNECT_BUDGET_SHARE", "0.3"))
+# Sonde de changement : empreinte de la grille de chaque semaine (sans clic) ; semaine inchangée = pas d'extraction
+CHANGE_PROBE            = os.getenv("CHANGE_PROBE", "1") == "1"
+FORCE_FULL_SCRAPE_HOURS = float(os.getenv("FORCE_FULL_SCRAPE_HOURS", "24"))   # tout relire au moins à cet intervalle
+
+# Ids d'évènements déterministes : la recherche (_find_existing_event) ne sert plus qu'à migrer
+# les évènements hérités à id aléatoire. auto = jusqu'à un run sans aucun hérité trouvé.
+LEGACY_ID_MIGRATION = os.getenv("LEGACY_ID_MIGRATION", "auto").strip().lower()
 
 # ====== Nettoyage titres (retrait de préfixes comme [Mo]) ======
 CLEAN_PREFIX_BEFORE_RUN = os.getenv("CLEAN_PREFIX_BEFORE_RUN","0") == "1"
@@ -73,10 +139,9 @@ try:
 except Exception:
     pass
 
-def log(msg: str) -> None:
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    try: print(f"[{ts}] {msg}")
-    except UnicodeEncodeError: print(f"[{ts}] {msg}".encode("ascii","replace").decode("ascii"))
+def _screen_dir() -> str:
+    """Dossier d'artefacts du thread courant (sous-dossier par compte en mode multi-comptes)."""
+    return getattr(LOG_CTX, "screen_dir", SCREEN_DIR)
 
 def _safe_mkdir(p: str) -> None:
     try: os.makedirs(p, exist_ok=True)
@@ -85,8 +150,8 @@ def _safe_mkdir(p: str) -> None:
 def _safe_shot(page_or_frame: Union[Page, Frame], name: str) -> None:
     try:
         page = page_or_frame if isinstance(page_or_frame, Page) else page_or_frame.page
-        _safe_mkdir(SCREEN_DIR)
-        page.screenshot(path=f"{SCREEN_DIR}/{name}.png", full_page=True)
+        _safe_mkdir(_screen_dir())
+        page.screenshot(path=f"{_screen_dir()}/{name}.png", full_page=True)
     except Exception:
         pass
 
@@ -97,23 +162,14 @@ def _safe_write(path: str, data: str, enc: str = "utf-8") -> None:
     except Exception as e:
         log(f"[DEBUG] write fail {path}: {e}")
 
-# ===================== Utils: RFC3339 Europe/Paris =====================
-def _last_sunday(year: int, month: int) -> datetime:
-    d = datetime(year, month, 31)
-    while d.weekday() != 6:
-        d -= timedelta(days=1)
-    return d
-
-def _paris_offset(dt: datetime) -> str:
-    start = _last_sunday(dt.year, 3); end = _last_sunday(dt.year, 10)
-    return "+02:00" if start <= dt <= end else "+01:00"
-
-def to_rfc3339_local(dt: datetime) -> str:
-    return dt.strftime("%Y-%m-%dT%H:%M:%S") + _paris_offset(dt)
-
 # ===================== GCAL =====================
-def get_gcal_service():
-    if not CALENDAR_ID: raise SystemExit("CALENDAR_ID manquant.")
+_CREDS = None
+
+def _gcal_credentials():
+    """OAuth (token.json, refresh) une seule fois, dans le thread principal ; partagé par les sinks."""
+    global _CREDS
+    if GCAL_STANDIN_URL: return None
+    if _CREDS is not None and _CREDS.valid: return _CREDS
     creds = None
     if os.path.exists(TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
@@ -128,24 +184,42 @@ def get_gcal_service():
         except Exception as e:
             log(f"[Google OAuth] {e}"); raise
         with open(TOKEN_FILE, "w", encoding="utf-8") as f: f.write(creds.to_json())
-    return build("calendar", "v3", credentials=creds)
+    _CREDS = creds
+    return creds
+
+def get_gcal_service():
+    """Un service par thread : le transport httplib2 n'est pas thread-safe."""
+    if GCAL_STANDIN_URL:
+        from gcal_standin import standin_service
+        return standin_service(GCAL_STANDIN_URL)
+    return build("calendar", "v3", credentials=_gcal_credentials())
+
+def load_targets(spec: str = CALENDAR_TARGETS) -> List[Dict[str, str]]:
+    """Cibles Calendar : CALENDAR_TARGETS, sinon la cible unique CALENDAR_ID."""
+    if not spec:
+        if not CALENDAR_ID: raise SystemExit("CALENDAR_ID manquant.")
+        return [{"calendar_id": CALENDAR_ID, "title_prefix": TITLE_PREFIX, "color_id": COLOR_ID, "namespace": ""}]
+    if not spec.startswith("["):
+        with open(spec, encoding="utf-8") as f: spec = f.read()
+    return parse_targets(json.loads(spec))
+
+def parse_targets(items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    targets, seen = [], set()
+    for i, t in enumerate(items):
+        cal = (t.get("calendar_id") or "").strip()
+        if not cal: raise SystemExit(f"CALENDAR_TARGETS[{i}]: calendar_id manquant.")
+        tgt = {"calendar_id": cal, "title_prefix": t.get("title_prefix", TITLE_PREFIX),
+               "color_id": str(t.get("color_id", COLOR_ID)), "namespace": (t.get("namespace") or "").strip()}
+        if (cal, tgt["namespace"]) in seen:
+            raise SystemExit(f"CALENDAR_TARGETS[{i}]: même agenda et même namespace qu'une autre cible.")
+        seen.add((cal, tgt["namespace"])); targets.append(tgt)
+    if not targets: raise SystemExit("CALENDAR_TARGETS vide.")
+    return targets
 
 def _norm(s: str) -> str:
     s = unicodedata.normalize("NFKD", s or "").encode("ascii","ignore").decode()
     return re.sub(r"\s+"," ",s).strip().lower()
 
-_STATUS_CANON = {
-    "prof. absent": "Prof. absent",
-    "prof absent": "Prof. absent",
-    "absence professeur": "Prof. absent",
-    "absence du professeur": "Prof. absent",
-    "cours annulé": "Cours annulé",
-    "cours annule": "Cours annulé",
-    "annulation": "Cours annulé",
-    "changement de salle": "Changement de salle",
-    "cours modifié": "Cours modifié",
-    "cours modifie": "Cours modifié",
-}
 _STATUS_RE = re.compile(r'\((?:prof\.?\s*absent|cours\s+annul[eé]|changement\s+de\s+salle|cours\s+modifi[eé])\)\s*$', re.I)
 
 def _title_core(title: str) -> str:
@@ -155,16 +229,30 @@ def _title_core(title: str) -> str:
     return t.strip()
 
 def make_dedupe_key(start: datetime, end: datetime, title: str, location: str) -> str:
+    """Clé stable : heures murales de Paris (format inchangé, les clés déjà écrites restent valides)."""
+    start, end = paris_wall(start), paris_wall(end)
     key = f"{start.isoformat()}|{end.isoformat()}|{_norm(_title_core(title))}|{_norm(location)}"
     return hashlib.sha1(key.encode()).hexdigest()
 
-def _backoff_sleep(i: int): time.sleep(min(30, (2 ** i) + random.uniform(0, 0.5)))
+def namespaced_key(dedupe_key: str, namespace: str) -> str:
+    """Clé dedupe d'une cible : inchangée pour le namespace par défaut ("")."""
+    return f"{namespace}|{dedupe_key}" if namespace else dedupe_key
+
+_EVENT_ID_RE = re.compile(r"^[a-v0-9]{5,1024}$")
+
+def event_id_from_dedupe(dedupe_key: str) -> str:
+    """Id Calendar valide (base32hex : a-v, 0-9) dérivé de la clé dedupe (sha1 hex)."""
+    ev_id = dedupe_key.lower()
+    if not _EVENT_ID_RE.match(ev_id):
+        ev_id = hashlib.sha1(dedupe_key.encode()).hexdigest()
+    return ev_id
 
 def _parse_gcal_dt(ev_dt: Dict[str, str]) -> Optional[datetime]:
+    """start/end Calendar -> heure murale naïve de Paris (converti depuis l'offset écrit)."""
     s = ev_dt.get("dateTime") or ev_dt.get("date")
     if not s: return None
     try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00")).replace(tzinfo=None)
+        return paris_wall(s)
     except Exception:
         try: return datetime.strptime(s[:19], "%Y-%m-%dT%H:%M:%S")
         except Exception: return None
@@ -176,16 +264,52 @@ def _strip_prefix_for_compare(summary: str, rx_prefix: Optional[re.Pattern]) ->
     s = re.sub(r"\s{2,}", " ", s).strip()
     return _title_core(s)
 
-def _round_min(dt: datetime, tol_min: int) -> datetime:
-    if tol_min <= 0: return dt
-    q = tol_min * 60
-    epoch = int(dt.timestamp())
-    r = int(round(epoch / q) * q)
-    return datetime.fromtimestamp(r)
+MATCH_TOL_MIN = 10   # tolérance début/fin (minutes) pour reconnaître un cours sans clé dedupe
+
+def _ev_minutes(ev: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """(début, fin) d'un évènement en minutes UTC depuis l'epoch, None sans dateTime lisible."""
+    st = _parse_gcal_dt(ev.get("start", {})); en = _parse_gcal_dt(ev.get("end", {}))
+    return (epoch_min(st), epoch_min(en)) if st and en else None
+
+def find_duplicate_clusters(events: List[Dict[str, Any]], rx_prefix: Optional[re.Pattern], tol_min: int) -> List[List[Dict[str, Any]]]:
+    """
+    Doublons = même cœur de titre + même salle, début ET fin à ±tol_min de l'ancre du groupe.
+    Tri par (titre, salle, début) puis balayage : O(n log n), sans effet de frontière de tranche.
+    """
+    tol = max(0, tol_min)
+    rows = []
+    for ev in events:
+        span = _ev_minutes(ev)
+        if span is None:
+            continue
+        kcore = _norm(_strip_prefix_for_compare(ev.get("summary",""), rx_prefix))
+        kloc  = _norm(ev.get("location",""))
+        rows.append((kcore, kloc, span[0], span[1], ev))
+    rows.sort(key=lambda r: (r[0], r[1], r[2]))
+
+    clusters: List[List[Dict[str, Any]]] = []
+    active: List[Tuple[int, int, List[Dict[str, Any]]]] = []   # (début ancre, fin ancre, membres)
+    group = None
+    for kcore, kloc, s, e, ev in rows:
+        if (kcore, kloc) != group:
+            group, active = (kcore, kloc), []
+        # les ancres sont triées par début : on retire celles sorties de la fenêtre
+        drop = 0
+        while drop < len(active) and active[drop][0] < s - tol:
+            drop += 1
+        if drop: del active[:drop]
+        for a_start, a_end, members in active:
+            if abs(a_end - e) <= tol:
+                members.append(ev); break
+        else:
+            members = [ev]
+            active.append((s, e, members))
+            clusters.append(members)
+    return [c for c in clusters if len(c) > 1]
 
 def _find_existing_event(svc, cal_id: str, body: Dict[str, Any], title: str, location: str, dedupe_key: str):
-    start = datetime.fromisoformat(body["start"]["dateTime"])
-    end   = datetime.fromisoformat(body["end"]["dateTime"])
+    start = paris_wall(body["start"]["dateTime"])
+    end   = paris_wall(body["end"]["dateTime"])
     try:
         res = svc.events().list(
             calendarId=cal_id,
@@ -200,7 +324,7 @@ def _find_existing_event(svc, cal_id: str, body: Dict[str, Any], title: str, loc
     try:
         res = svc.events().list(
             calendarId=cal_id,
-            privateExtendedProperty="source=pronote_playwright",
+            privateExtendedProperty=f"source={SOURCE_TAG}",
             timeMin=to_rfc3339_local(start - timedelta(hours=6)),
             timeMax=to_rfc3339_local(end + timedelta(hours=6)),
             maxResults=50, singleEvents=True, showDeleted=False
@@ -209,52 +333,54 @@ def _find_existing_event(svc, cal_id: str, body: Dict[str, Any], title: str, loc
     except HttpError:
         cand = []
     core = _norm(_title_core(title)); locn = _norm(location)
+    st, en = epoch_min(start), epoch_min(end)
     for ev in cand:
         escore = _norm(_title_core(ev.get("summary",""))); eloc = _norm(ev.get("location",""))
-        estart = _parse_gcal_dt(ev.get("start", {}));     eend = _parse_gcal_dt(ev.get("end", {}))
-        if not (estart and eend): continue
-        if abs((estart - start).total_seconds()) <= 600 and abs((eend - end).total_seconds()) <= 600 and escore == core and eloc == locn:
+        span = _ev_minutes(ev)
+        if span is None: continue
+        if abs(span[0] - st) <= MATCH_TOL_MIN and abs(span[1] - en) <= MATCH_TOL_MIN and escore == core and eloc == locn:
             return ev
     return None
 
-def upsert_event_by_dedupe(svc, cal_id: str, body: Dict[str, Any], dedupe_key: str) -> Tuple[str, Dict[str, Any]]:
-    existing = _find_existing_event(svc, cal_id, body, body["summary"], body.get("location",""), dedupe_key)
-    ext = body.setdefault("extendedProperties", {}).setdefault("private", {})
-    ext["source"] = "pronote_playwright"
-    ext["dedupe"] = dedupe_key
-    for i in range(4):
-        try:
-            if existing:
-                ev = svc.events().patch(calendarId=cal_id, eventId=existing["id"], body=body, sendUpdates="none").execute()
-                return "updated", ev
-            else:
-                ev = svc.events().insert(calendarId=cal_id, body=body, sendUpdates="none").execute()
-                return "created", ev
-        except HttpError as e:
-            if getattr(e, "res", None) and e.res.status in (403, 429) and "Rate Limit" in str(e):
-                log("[GCAL] Rate limit — retry..."); _backoff_sleep(i); continue
-            raise
-
 # ===================== PURGE GCAL =====================
 def _list_events_window(svc, cal_id: str, time_min: datetime, time_max: datetime, only_source: bool) -> List[Dict[str,Any]]:
-    items: List[Dict[str,Any]] = []
-    page_token = None
-    while True:
-        params = dict(
-            calendarId=cal_id,
-            timeMin=to_rfc3339_local(time_min),
-            timeMax=to_rfc3339_local(time_max),
-            singleEvents=True, showDeleted=False, maxResults=250
-        )
-        if only_source:
-            params["privateExtendedProperty"] = "source=pronote_playwright"
-        if page_token:
-            params["pageToken"] = page_token
-        resp = svc.events().list(**params).execute()
-        items.extend(resp.get("items", []))
-        page_token = resp.get("nextPageToken")
-        if not page_token: break
-    return items
+    params = dict(timeMin=to_rfc3339_local(time_min), timeMax=to_rfc3339_local(time_max),
+                  singleEvents=True, showDeleted=False)
+    if only_source:
+        params["privateExtendedProperty"] = f"source={SOURCE_TAG}"
+    return list(iter_events(svc, cal_id, **params))
+
+def plan_purge_deletions(events: List[Dict[str, Any]], rx_prefix: Optional[re.Pattern],
+                         delete_if_contains: str, dedup: bool, tol_min: int) -> Tuple[set, List[List[Dict[str, Any]]]]:
+    """Ids à supprimer (mot-clé puis doublons) sur un listing déjà chargé."""
+    motif = delete_if_contains.lower().strip()
+
+    # 1) Suppression par mot-clé
+    to_delete_ids: set[str] = set()
+    if motif:
+        for ev in events:
+            core = _strip_prefix_for_compare(ev.get("summary",""), rx_prefix).lower()
+            if motif in core:
+                to_delete_ids.add(ev["id"])
+
+    # 2) Déduplication (tri + balayage, fenêtre ±tol_min réelle)
+    clusters: List[List[Dict[str, Any]]] = []
+    if dedup:
+        candidates = [ev for ev in events if ev["id"] not in to_delete_ids]  # hors suppressions déjà prévues
+        clusters = find_duplicate_clusters(candidates, rx_prefix, tol_min)
+        for lst in clusters:
+            # garde le plus ancien (created) et supprime le reste
+            lst_sorted = sorted(lst, key=lambda e: e.get("created","") or e.get("updated",""))
+            for ev in lst_sorted[1:]:
+                to_delete_ids.add(ev["id"])
+        if clusters:
+            log(f"[PURGE] {len(clusters)} groupes de doublons ({sum(len(c) - 1 for c in clusters)} copies en trop)")
+            _safe_write(f"{_screen_dir()}/purge_duplicate_clusters.json", json.dumps([
+                [{"id": ev.get("id"), "summary": ev.get("summary"), "start": ev.get("start"),
+                  "end": ev.get("end"), "created": ev.get("created")} for ev in c]
+                for c in clusters
+            ], ensure_ascii=False, indent=2))
+    return to_delete_ids, clusters
 
 def purge_calendar_events(svc, cal_id: str,
                           time_min: datetime, time_max: datetime,
@@ -266,48 +392,14 @@ def purge_calendar_events(svc, cal_id: str,
                           clean_prefix_regex: str = r"\s*\[Mo\]\s*") -> Dict[str,int]:
     """
     - delete_if_contains: si non vide, supprime les events dont le titre (après retrait du préfixe) contient ce motif (insensible à la casse)
-    - dedup: si True, supprime les doublons (même cœur de titre + salle + horaire ± tolérance), en conservant 1 exemplaire
+    - dedup: si True, supprime les doublons (même cœur de titre + salle + début/fin ± tolérance), en conservant 1 exemplaire
     """
     rx_prefix = re.compile(clean_prefix_regex, re.I) if clean_prefix_regex else None
-    motif = delete_if_contains.lower().strip()
     events = _list_events_window(svc, cal_id, time_min, time_max, only_source)
 
     deleted = 0
     scanned = len(events)
-
-    # 1) Suppression par mot-clé
-    to_delete_ids: set[str] = set()
-    if motif:
-        for ev in events:
-            core = _strip_prefix_for_compare(ev.get("summary",""), rx_prefix).lower()
-            if motif in core:
-                to_delete_ids.add(ev["id"])
-
-    # 2) Déduplication
-    if dedup:
-        groups: Dict[Tuple[str,str,datetime,datetime], List[Dict[str,Any]]] = {}
-        for ev in events:
-            if ev["id"] in to_delete_ids:  # déjà prévu à suppression
-                continue
-            start = _parse_gcal_dt(ev.get("start", {}))
-            end   = _parse_gcal_dt(ev.get("end", {}))
-            if not (start and end): 
-                continue
-            kcore = _norm(_strip_prefix_for_compare(ev.get("summary",""), rx_prefix))
-            kloc  = _norm(ev.get("location",""))
-            kstart = _round_min(start, tol_min)
-            kend   = _round_min(end, tol_min)
-            key = (kcore, kloc, kstart, kend)
-            groups.setdefault(key, []).append(ev)
-
-        for key, lst in groups.items():
-            if len(lst) <= 1: 
-                continue
-            # garde le plus ancien (created) et supprime le reste
-            lst_sorted = sorted(lst, key=lambda e: e.get("created","") or e.get("updated",""))
-            keep = lst_sorted[0]["id"]
-            for ev in lst_sorted[1:]:
-                to_delete_ids.add(ev["id"])
+    to_delete_ids, clusters = plan_purge_deletions(events, rx_prefix, delete_if_contains, dedup, tol_min)
 
     # 3) Exécution suppressions
     for ev_id in to_delete_ids:
@@ -322,12 +414,15 @@ def purge_calendar_events(svc, cal_id: str,
                 break
             except HttpError as e:
                 if getattr(e, "res", None) and e.res.status in (403,429):
-                    _backoff_sleep(tries); tries += 1; continue
+                    backoff_sleep(tries); tries += 1; continue
                 raise
 
-    return {"scanned": scanned, "deleted": deleted}
+    return {"scanned": scanned, "deleted": deleted, "clusters": len(clusters)}
 
 # ===================== Nettoyage GCAL (retirer préfixe dans titres) =====================
+def _strip_prefix(summary: str, rx: re.Pattern) -> str:
+    return re.sub(r"\s{2,}", " ", rx.sub(" ", summary)).strip()
+
 def strip_calendar_prefixes(svc, cal_id: str,
                             time_min: datetime, time_max: datetime,
                             regex: str, only_source: bool = True,
@@ -346,7 +441,7 @@ def strip_calendar_prefixes(svc, cal_id: str,
             maxResults=250
         )
         if only_source:
-            params["privateExtendedProperty"] = "source=pronote_playwright"
+            params["privateExtendedProperty"] = f"source={SOURCE_TAG}"
         if page_token:
             params["pageToken"] = page_token
 
@@ -354,8 +449,7 @@ def strip_calendar_prefixes(svc, cal_id: str,
         for ev in resp.get("items", []):
             total += 1
             old = ev.get("summary", "") or ""
-            new = rx.sub(" ", old)
-            new = re.sub(r"\s{2,}", " ", new).strip()
+            new = _strip_prefix(old, rx)
             if new != old:
                 changed += 1
                 if dry_run:
@@ -373,7 +467,7 @@ def strip_calendar_prefixes(svc, cal_id: str,
                             break
                         except HttpError as e:
                             if getattr(e, "res", None) and e.res.status in (403, 429):
-                                _backoff_sleep(tries); tries += 1; continue
+                                backoff_sleep(tries); tries += 1; continue
                             raise
 
         page_token = resp.get("nextPageToken")
@@ -382,6 +476,157 @@ def strip_calendar_prefixes(svc, cal_id: str,
 
     return total, changed
 
+# ===================== Maintenance en une passe =====================
+def _ev_source(ev: Dict[str, Any]) -> str:
+    return ev.get("extendedProperties", {}).get("private", {}).get("source", "")
+
+def _ev_owned(ev: Dict[str, Any], namespace: str) -> bool:
+    """Évènement de cette synchro ET de cette cible (namespace) : une autre cible du même agenda n'est pas touchée."""
+    priv = ev.get("extendedProperties", {}).get("private", {})
+    return priv.get("source") == SOURCE_TAG and priv.get("ns", "") == namespace
+
+def _ev_in_window(ev: Dict[str, Any], tmin: datetime, tmax: datetime) -> bool:
+    st = _parse_gcal_dt(ev.get("start", {}))
+    return bool(st and tmin <= st <= tmax)
+
+class SnapshotIndex:
+    """
+    Index d'un listing Calendar pour retrouver l'évènement d'un cours sans requête :
+    par clé dedupe, puis (comme _find_existing_event) même titre/salle à ±MATCH_TOL_MIN minutes UTC.
+    """
+    def __init__(self, events: List[Dict[str, Any]], namespace: str = ""):
+        self.by_dedupe: Dict[str, Dict[str, Any]] = {}
+        self.by_core: Dict[Tuple[str, str], List[Tuple[int, int, Dict[str, Any]]]] = {}
+        self.matched: set = set()
+        for ev in events:
+            if not _ev_owned(ev, namespace): continue
+            key = ev.get("extendedProperties", {}).get("private", {}).get("dedupe")
+            if key: self.by_dedupe.setdefault(key, ev)
+            span = _ev_minutes(ev)
+            if span is None: continue
+            k = (_norm(_title_core(ev.get("summary",""))), _norm(ev.get("location","")))
+            self.by_core.setdefault(k, []).append((span[0], span[1], ev))
+
+    def find(self, dedupe_key: str, d: DesiredEvent) -> Optional[Dict[str, Any]]:
+        ev = self.by_dedupe.get(dedupe_key)
+        if ev is None:
+            st, en = epoch_min(d.start), epoch_min(d.end)
+            k = (_norm(_title_core(d.summary)), _norm(d.location))
+            ev = next((e for s0, e0, e in self.by_core.get(k, [])
+                       if abs(s0 - st) <= MATCH_TOL_MIN and abs(e0 - en) <= MATCH_TOL_MIN), None)
+        if ev is not None: self.matched.add(ev["id"])
+        return ev
+
+def plan_maintenance(svc, cal_id: str, desired: Dict[str, DesiredEvent], now: datetime,
+                     swept: Optional[List[Tuple[datetime, datetime]]] = None,
+                     namespace: str = "") -> Tuple[List[Dict[str, Any]], int]:
+    """
+    PURGE + CLEAN + upsert (+ balayage) sur UN SEUL listing de la fenêtre union :
+    suppressions, réécritures de préfixe et upserts calculés sur le même instantané,
+    sans patch pour un évènement déjà voué à suppression. Retourne (ops, nb réécritures).
+    """
+    windows: List[Tuple[datetime, datetime, bool]] = []
+    if PURGE_BEFORE_RUN:
+        windows.append((now - timedelta(days=PURGE_PAST_DAYS), now + timedelta(days=PURGE_FUTURE_DAYS), PURGE_SOURCE_ONLY))
+    if CLEAN_PREFIX_BEFORE_RUN:
+        windows.append((now - timedelta(days=CLEAN_PAST_DAYS), now + timedelta(days=CLEAN_FUTURE_DAYS), CLEAN_ONLY_SOURCE))
+    if desired:
+        starts = [paris_wall(d.start) for d in desired.values()]
+        ends   = [paris_wall(d.end) for d in desired.values()]
+        windows.append((min(starts) - timedelta(days=1), max(ends) + timedelta(days=1), True))
+    windows.extend((wmin, wmax, True) for wmin, wmax in (swept or []))
+    if not windows: return [], 0
+    tmin = min(w[0] for w in windows); tmax = max(w[1] for w in windows)
+    only_source = all(w[2] for w in windows)
+    events = _list_events_window(svc, cal_id, tmin, tmax, only_source)
+    log(f"[MAINT] 1 listing {tmin.date()} -> {tmax.date()} (ONLY_SOURCE={only_source}) : {len(events)} évènements")
+
+    def _scope(wmin: datetime, wmax: datetime, src_only: bool) -> List[Dict[str, Any]]:
+        return [ev for ev in events if _ev_in_window(ev, wmin, wmax) and (not src_only or _ev_owned(ev, namespace))]
+
+    rx_prefix = re.compile(CLEAN_PREFIX_REGEX, re.I) if CLEAN_PREFIX_REGEX else None
+    deletes: set = set()
+    if PURGE_BEFORE_RUN:
+        deletes, _clusters = plan_purge_deletions(
+            _scope(now - timedelta(days=PURGE_PAST_DAYS), now + timedelta(days=PURGE_FUTURE_DAYS), PURGE_SOURCE_ONLY),
+            rx_prefix, PURGE_DELETE_IF_CONTAINS, PURGE_DUPLICATES, DEDUP_TOLERANCE_MIN)
+        if PURGE_DRY_RUN:
+            for ev_id in deletes: log(f"[PURGE DRY] delete {ev_id}")
+            deletes = set()
+
+    for wmin, wmax in (swept or []):
+        # mark-and-sweep sur le même instantané : pas de lecture supplémentaire
+        for op in sweep_ops(_scope(wmin, wmax - timedelta(seconds=1), True), set(desired), SOURCE_TAG, namespace):
+            deletes.add(op["event_id"])
+
+    kept = [ev for ev in events if ev["id"] not in deletes]
+    index = SnapshotIndex(kept, namespace)
+    upserts = CalendarReconciler(svc, cal_id, lookup=index.find).diff(desired)
+
+    rewrites: List[Dict[str, Any]] = []
+    if CLEAN_PREFIX_BEFORE_RUN and rx_prefix:
+        for ev in _scope(now - timedelta(days=CLEAN_PAST_DAYS), now + timedelta(days=CLEAN_FUTURE_DAYS), CLEAN_ONLY_SOURCE):
+            # supprimé ou réécrit de toute façon par l'upsert : pas de patch séparé
+            if ev["id"] in deletes or ev["id"] in index.matched: continue
+            old = ev.get("summary", "") or ""
+            new = _strip_prefix(old, rx_prefix)
+            if new == old: continue
+            if CLEAN_DRY_RUN:
+                log(f"[CLEAN DRY] {ev['id']} '{old}' -> '{new}'"); continue
+            rewrites.append({"op": "patch", "key": None, "event_id": ev["id"], "body": {"summary": new}, "before": compact_event(ev)})
+
+    by_id = {ev["id"]: ev for ev in events}
+    ops = [{"op": "delete", "key": None, "event_id": ev_id, "before": compact_event(by_id[ev_id])} for ev_id in sorted(deletes)]
+    ops += rewrites + upserts
+    log(f"[MAINT] suppressions={len(deletes)}, préfixes={len(rewrites)}, upserts={len(upserts)}")
+    return ops, len(rewrites)
+
+def run_maintenance(svc, cal_id: str, desired: Dict[str, DesiredEvent], now: datetime,
+                    on_write=None, swept: Optional[List[Tuple[datetime, datetime]]] = None,
+                    namespace: str = "", journal: Optional[WriteJournal] = None) -> Dict[str, int]:
+    """plan_maintenance puis envoi groupé (batch) des opérations."""
+    ops, n_rewrites = plan_maintenance(svc, cal_id, desired, now, swept, namespace)
+    counts = apply_ops_batched(svc, cal_id, ops, on_write=on_write, journal=journal)
+    counts["updated"] -= min(counts["updated"], n_rewrites)
+    counts["unchanged"] = len(desired) - sum(1 for op in ops if op["op"] != "delete" and op.get("key"))
+    return counts
+
+# ===================== Vérification post-run =====================
+def _merge_ranges(ranges: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    out: List[Tuple[datetime, datetime]] = []
+    for lo, hi in sorted(ranges):
+        if out and lo <= out[-1][1]: out[-1] = (out[-1][0], max(out[-1][1], hi))
+        else: out.append((lo, hi))
+    return out
+
+def verify_calendar(svc, cal_id: str, ranges: List[Tuple[datetime, datetime]],
+                    desired_keys: set, dump_path: str, namespace: str = "") -> Dict[str, int]:
+    """
+    Relit les plages (semaines réellement produites : pas celles sautées par la sonde) page par
+    page et compare aux clés désirées. Un enregistrement JSONL par évènement (ok / extra) puis un par manquant.
+    """
+    seen: set = set(); ids: set = set()
+    found = extra = 0
+    listing = (ev for lo, hi in _merge_ranges(ranges)
+               for ev in iter_events(svc, cal_id, timeMin=to_rfc3339_local(lo), timeMax=to_rfc3339_local(hi),
+                                     singleEvents=True, showDeleted=False,
+                                     privateExtendedProperty=f"source={SOURCE_TAG}"))
+    with JsonlWriter(dump_path) as out:
+        for ev in listing:
+            if not _ev_owned(ev, namespace) or ev.get("id") in ids: continue   # à cheval sur deux plages
+            ids.add(ev.get("id"))
+            key = ev.get("extendedProperties", {}).get("private", {}).get("dedupe", "")
+            ok = key in desired_keys and key not in seen
+            if ok: seen.add(key); found += 1
+            else: extra += 1
+            out.write({"status": "ok" if ok else "extra", "id": ev.get("id"), "dedupe": key,
+                       "summary": ev.get("summary"), "start": ev.get("start"), "end": ev.get("end")})
+        missing = 0
+        for key in desired_keys:
+            if key not in seen:
+                out.write({"status": "missing", "dedupe": key}); missing += 1
+    return {"found": found, "extra": extra, "missing": missing}
+
 # ===================== Parsing PRONOTE =====================
 H_PATTERNS = [
     re.compile(r'(?P<h>\d{1,2})\s*[hH:]\s*(?P<m>\d{2})'),
@@ -427,7 +672,16 @@ def parse_date_from_text(text: str, fallback_year: int) -> Optional[datetime]:
 def to_dt(date_base: datetime, hm: tuple[int,int]) -> datetime:
     return date_base.replace(hour=hm[0], minute=hm[1], second=0, microsecond=0)
 
-def parse_panel(panel: Dict[str, Any], year: int) -> Optional[Dict[str, Any]]:
+def _times_to_range(times: Dict[str, Optional[tuple[int,int]]], dt_date: datetime) -> Optional[Tuple[datetime, datetime]]:
+    start_hm = times["start"]; end_hm = times["end"]
+    if start_hm and end_hm:
+        return to_dt(dt_date, start_hm), to_dt(dt_date, end_hm)
+    if start_hm and times["duration"]:
+        dh, dm = times["duration"]; start_dt = to_dt(dt_date, start_hm)
+        return start_dt, start_dt + timedelta(hours=dh, minutes=dm)
+    return None
+
+def parse_panel(panel: Dict[str, Any], year: int) -> Optional[Lesson]:
     header = panel.get("header","")
     matiere = re.sub(r'\s+', ' ', (panel.get("matiere","") or "").strip())
     salle   = re.sub(r'\s+', ' ', (panel.get("salle","") or "").strip())
@@ -435,18 +689,59 @@ def parse_panel(panel: Dict[str, Any], year: int) -> Optional[Dict[str, Any]]:
     if not (times["start"] or times["end"]): return None
     dt_date = parse_date_from_text(header, fallback_year=year)
     if not dt_date: return None
-    start_hm = times["start"]; end_hm = times["end"]
-    if start_hm and end_hm:
-        start_dt = to_dt(dt_date, start_hm); end_dt = to_dt(dt_date, end_hm)
-    elif start_hm and times["duration"]:
-        dh, dm = times["duration"]; start_dt = to_dt(dt_date, start_hm); end_dt = start_dt + timedelta(hours=dh, minutes=dm)
-    else:
-        return None
+    rng = _times_to_range(times, dt_date)
+    if not rng: return None
     summary = matiere or "Cours"
-    if not salle:
-        m = re.search(r'(?:Salle[s]?\s+)(.+)$', header, re.IGNORECASE)
-        if m: salle = m.group(1).strip()
-    return {"summary": summary, "room": salle, "start_dt": start_dt, "end_dt": end_dt}
+    return Lesson(summary, salle or _salle(header), rng[0], rng[1], status=canonical_status(header, panel.get("raw","")))
+
+_JOURS = ['lundi','mardi','mercredi','jeudi','vendredi','samedi','dimanche']
+_SALLE_RE = re.compile(r'(?:Salle[s]?\s+)(.+)$', re.IGNORECASE)
+
+def _salle(text: str) -> str:
+    m = _SALLE_RE.search(text or "")
+    return m.group(1).strip() if m else ""
+
+def _tile_range(aria: str, year: int, monday: Optional[datetime]) -> Tuple[Optional[Tuple[datetime, datetime]], str]:
+    """
+    Début/fin d'une case de la grille depuis son aria-label -> ((début, fin), "") ou (None, raison).
+    Date lue dans le texte, sinon jour de la semaine + lundi affiché.
+    """
+    times = parse_times(aria)
+    if not times["start"]: return None, "times"
+    dt_date = parse_date_from_text(aria, fallback_year=year)
+    if not dt_date and monday:
+        found = next((i for i, n in enumerate(_JOURS) if n in (aria or '').lower()), None)
+        if found is not None: dt_date = monday + timedelta(days=found)
+    if not dt_date: return None, "date"
+    rng = _times_to_range(times, dt_date)
+    return (rng, "") if rng else (None, "times")
+
+def parse_grid_tile(aria: str, cont: str, year: int, monday: Optional[datetime]) -> Optional[Lesson]:
+    """Case de la grille (aria-label + texte du _cont), sans ouvrir le panneau."""
+    rng, _ = _tile_range(aria, year, monday)
+    if not rng: return None
+    summary = (re.sub(r'\s+',' ', cont).strip() or "Cours")
+    return Lesson(summary, _salle(cont), rng[0], rng[1], status=canonical_status(aria, cont))
+
+def parse_static_tile(tile: Dict[str, Any], year: int, monday: Optional[datetime]) -> Tuple[Optional[Lesson], str]:
+    """
+    Case de la grille lue sans clic (aria-label + lignes du _cont) -> (cours, "") ou
+    (None, raison) quand le panneau doit être ouvert : date, horaires ou matière
+    introuvables, ou statut signalé (le panneau fait foi pour le statut).
+    Salle : la ligne "Salle ...", sinon la dernière ligne après la matière (ordre PRONOTE
+    matière / professeur / salle), comme le champ salle du panneau.
+    """
+    aria  = tile.get("aria", "") or ""
+    lines = [l for l in (tile.get("lines") or []) if l]
+    if canonical_status(aria, " ".join(lines)): return None, "status"
+    rng, why = _tile_range(aria, year, monday)
+    if not rng: return None, why
+    rest = [l for l in lines if not parse_times(l)["start"]]
+    subject = next((l for l in rest if not _SALLE_RE.match(l)), "")
+    if not subject: return None, "subject"
+    others = [l for l in rest if l is not subject]
+    room = next((_salle(l) for l in others if _SALLE_RE.match(l)), others[-1] if others else "")
+    return Lesson(subject, room, rng[0], rng[1]), ""
 
 # ===================== Playwright helpers =====================
 def _iter_contexts(page: Page):
@@ -502,7 +797,7 @@ def _frame_has_dom_grid_js() -> str:
     """
 
 def find_timetable_ctx(page: Page, timeout_ms: int = TIMEOUT_MS) -> Union[Page, Frame]:
-    deadline = time.time() + timeout_ms/1000.0
+    deadline = time.time() + BUDGET.timeout_ms(timeout_ms)/1000.0
     while time.time() < deadline:
         if TIMETABLE_FRAME:
             for fr in page.frames:
@@ -524,6 +819,7 @@ def find_timetable_ctx(page: Page, timeout_ms: int = TIMEOUT_MS) -> Union[Page,
         except Exception:
             pass
         page.wait_for_timeout(250)
+    BUDGET.check("contexte emploi du temps")
     raise TimeoutError("Timetable context not found")
 
 def find_dom_grid_ctx(page: Page, prefer: Optional[Union[Page, Frame]] = None, timeout_ms: int = 5000) -> Optional[Union[Page, Frame]]:
@@ -542,7 +838,8 @@ def find_dom_grid_ctx(page: Page, prefer: Optional[Union[Page, Frame]] = None, t
         page.wait_for_timeout(250)
     return None
 
-def click_css_any(page_or_frame: Union[Page, Frame], css: str, screenshot_tag: str = "") -> bool:
+def click_css_any(page_or_frame: Union[Page, Frame], css: str, screenshot_tag: str = "",
+                  settle_ms: Optional[int] = None) -> bool:
     if not css: return False
     ctx = page_or_frame
     try:
@@ -557,17 +854,169 @@ def click_css_any(page_or_frame: Union[Page, Frame], css: str, screenshot_tag: s
                     if el: el.evaluate("(n)=>{ n.click(); n.dispatchEvent(new MouseEvent('mousedown',{bubbles:true})); n.dispatchEvent(new MouseEvent('mouseup',{bubbles:true})); n.dispatchEvent(new MouseEvent('click',{bubbles:true})); }")
                     else: return False
                 except Exception: return False
-            (ctx.page if isinstance(ctx, Frame) else ctx).wait_for_timeout(WAIT_AFTER_NAV_MS)
+            settle = WAIT_AFTER_NAV_MS if settle_ms is None else settle_ms
+            if settle: (ctx.page if isinstance(ctx, Frame) else ctx).wait_for_timeout(settle)
             if screenshot_tag: _safe_shot(ctx, f"08-clicked-{screenshot_tag}")
             return True
     except Exception as e:
         log(f"[NAV] click_css_any fail: {e}")
     return False
 
+# ===================== Profil navigateur / cache =====================
+_CACHE_SUBDIRS = ("Cache", "Code Cache", "GPUCache", os.path.join("Service Worker", "CacheStorage"))
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for f in files:
+            try: total += os.path.getsize(os.path.join(root, f))
+            except OSError: pass
+    return total
+
+def prune_profile_cache(profile_dir: str, max_mb: int) -> None:
+    """Plafond de taille : au-delà de max_mb, on vide les caches (HTTP, code, GPU) du profil."""
+    if not os.path.isdir(profile_dir): return
+    size = _dir_size(profile_dir)
+    log(f"[PROFILE] {profile_dir}: {size / 1e6:.1f} Mo (plafond {max_mb} Mo)")
+    if size <= max_mb * 1_000_000: return
+    for base in (profile_dir, os.path.join(profile_dir, "Default")):
+        for sub in _CACHE_SUBDIRS:
+            shutil.rmtree(os.path.join(base, sub), ignore_errors=True)
+    log(f"[PROFILE] caches vidés -> {_dir_size(profile_dir) / 1e6:.1f} Mo")
+
+def clean_profile(profile_dir: str = BROWSER_PROFILE_DIR) -> None:
+    if not profile_dir:
+        log("[PROFILE] BROWSER_PROFILE_DIR non défini — rien à nettoyer."); return
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    log(f"[PROFILE] {profile_dir} supprimé.")
+
+class NetworkMeter:
+    """Octets servis par le réseau vs par le cache, via les évènements Network du protocole DevTools."""
+    def __init__(self):
+        self.network_bytes = self.cached_bytes = 0
+        self.network_requests = self.cached_requests = 0
+        self._cached: set = set()
+
+    def attach(self, context, page: Page) -> None:
+        try:
+            cdp = context.new_cdp_session(page)
+            cdp.send("Network.enable")
+        except Exception as e:
+            log(f"[NET] mesure indisponible: {e}"); return
+        cdp.on("Network.requestServedFromCache", lambda ev: self._cached.add(ev["requestId"]))
+        cdp.on("Network.responseReceived", self._on_response)
+        cdp.on("Network.dataReceived", self._on_data)
+        cdp.on("Network.loadingFinished", self._on_finished)
+
+    def _on_response(self, ev: Dict[str, Any]) -> None:
+        r = ev.get("response", {})
+        if int(r.get("status") or 0) in (429, 503):
+            PACER.observe(None, ok=False, kind="http")   # surcharge côté serveur : on ralentit
+        if r.get("fromDiskCache") or r.get("fromPrefetchCache") or r.get("fromServiceWorker"):
+            self._cached.add(ev["requestId"])
+
+    def _on_data(self, ev: Dict[str, Any]) -> None:
+        if ev["requestId"] in self._cached:
+            self.cached_bytes += int(ev.get("dataLength") or 0)
+
+    def _on_finished(self, ev: Dict[str, Any]) -> None:
+        rid = ev["requestId"]
+        if rid in self._cached:
+            self.cached_requests += 1; self._cached.discard(rid)
+        else:
+            self.network_requests += 1
+            self.network_bytes += int(ev.get("encodedDataLength") or 0)
+
+    def export(self) -> None:
+        METRICS.inc("transfer_bytes", self.network_bytes, origin="network")
+        METRICS.inc("transfer_bytes", self.cached_bytes, origin="cache")
+
+    def summary(self) -> str:
+        return (f"réseau={self.network_bytes / 1024:.0f} Ko ({self.network_requests} req), "
+                f"cache={self.cached_bytes / 1024:.0f} Ko ({self.cached_requests} req)")
+
+_PERF_KEYS = ("JSHeapUsedSize", "JSHeapTotalSize", "Nodes", "JSEventListeners", "Documents", "Frames")
+_PERF_CUMUL = ("LayoutCount", "RecalcStyleCount", "LayoutDuration", "RecalcStyleDuration",
+               "ScriptDuration", "TaskDuration", "Timestamp")
+
+_RESOURCE_TIMINGS_JS = r"""() => {
+  performance.setResourceTimingBufferSize(2000);
+  const nav = performance.getEntriesByType('navigation')[0];
+  const res = performance.getEntriesByType('resource');
+  const by = {};
+  for (const r of res) {
+    const b = by[r.initiatorType || 'other'] = by[r.initiatorType || 'other'] || {n: 0, bytes: 0, ms: 0};
+    b.n++; b.bytes += r.transferSize || 0; b.ms += Math.round(r.duration);
+  }
+  const slowest = res.slice().sort((a, b) => b.duration - a.duration).slice(0, 5)
+    .map(r => ({url: r.name.slice(0, 160), ms: Math.round(r.duration), bytes: r.transferSize || 0}));
+  performance.clearResourceTimings();   // le relevé suivant ne voit que les nouvelles ressources
+  return {
+    nav: nav ? {url: nav.name.slice(0, 160), ttfb: Math.round(nav.responseStart),
+                dcl: Math.round(nav.domContentLoadedEventEnd), load: Math.round(nav.loadEventEnd),
+                bytes: nav.transferSize || 0} : null,
+    resources: by, slowest
+  };
+}"""
+
+class BrowserPerf:
+    """
+    Ce que le navigateur fait du temps (BROWSER_PERF=1) : à chaque relevé, métriques Performance
+    du protocole DevTools (tas JS, noeuds, layouts, recalculs de style, temps de script ; les
+    cumuls en delta depuis le relevé précédent) et timings navigation / ressources du document.
+    Un enregistrement JSONL compact par phase et par semaine. Inactif : aucun coût.
+    """
+    def __init__(self, enabled: bool = BROWSER_PERF):
+        self.enabled = enabled
+        self.out: Optional[JsonlWriter] = None
+        self._cdp = None
+        self._prev: Dict[str, float] = {}
+        self._last_nav = ""
+
+    def attach(self, context, page: Page) -> None:
+        """(Re)cible la page suivie : page ENT puis page PRONOTE si c'est un popup."""
+        if not self.enabled: return
+        try:
+            cdp = context.new_cdp_session(page)
+            cdp.send("Performance.enable")
+            self._cdp = cdp
+        except Exception as e:
+            log(f"[PERF] métriques indisponibles: {e}"); self.enabled = False
+
+    def sample(self, phase: str, target: Union[Page, Frame, None] = None, **extra: Any) -> None:
+        if not (self.enabled and self._cdp): return
+        try:
+            raw = {m["name"]: m["value"] for m in self._cdp.send("Performance.getMetrics")["metrics"]}
+        except Exception as e:
+            log(f"[PERF] {phase}: {e}"); return
+        rec: Dict[str, Any] = {"phase": phase, **extra}
+        rec.update({k: int(raw[k]) for k in _PERF_KEYS if k in raw})
+        for k in _PERF_CUMUL:
+            if k not in raw: continue
+            d = raw[k] - self._prev.get(k, raw[k] if k == "Timestamp" else 0.0)
+            rec[f"d{k}"] = round(d, 3) if k.endswith(("Duration", "Timestamp")) else int(d)
+        self._prev = raw
+        if target is not None:
+            try:
+                t = target.evaluate(_RESOURCE_TIMINGS_JS)
+                if t.get("nav") and t["nav"]["url"] != self._last_nav:
+                    self._last_nav = t["nav"]["url"]; rec["nav"] = t["nav"]
+                rec["resources"] = t.get("resources"); rec["slowest"] = t.get("slowest")
+            except Exception as e:
+                rec["timings_error"] = str(e)[:200]
+        if self.out is None:
+            self.out = JsonlWriter(f"{_screen_dir()}/browser_perf.jsonl")
+        self.out.write(rec)
+
+    def close(self) -> None:
+        if self.out:
+            log(f"[PERF] {self.out.count} relevés -> {self.out.path}")
+            self.out.close()
+
 # ===================== Navigation =====================
-def login_ent(page: Page) -> None:
-    _safe_mkdir(SCREEN_DIR)
-    page.set_default_timeout(TIMEOUT_MS)
+def login_ent(page: Page, user: str = ENT_USER, password: str = ENT_PASS) -> None:
+    _safe_mkdir(_screen_dir())
+    page.set_default_timeout(BUDGET.timeout_ms(TIMEOUT_MS))
     page.goto(ENT_URL)
     page.wait_for_load_state("load")
     page.wait_for_load_state("domcontentloaded")
@@ -609,16 +1058,16 @@ def login_ent(page: Page) -> None:
         _safe_shot(page, "03-ent-no-fields")
         raise RuntimeError("Champ identifiant ENT introuvable.")
 
-    user_loc.fill(ENT_USER); pass_loc.fill(ENT_PASS)
+    user_loc.fill(user); pass_loc.fill(password)
     if not click_first_any(page, submit_candidates): user_loc.press("Enter")
     page.wait_for_load_state("domcontentloaded")
     accept_cookies_any(page)
     _safe_shot(page, "05-ent-after-submit")
 
-def open_pronote(context, page: Page):
-    page.set_default_timeout(TIMEOUT_MS)
-    if PRONOTE_URL:
-        page.goto(PRONOTE_URL)
+def open_pronote(context, page: Page, pronote_url: str = PRONOTE_URL):
+    page.set_default_timeout(BUDGET.timeout_ms(TIMEOUT_MS))
+    if pronote_url:
+        page.goto(pronote_url)
         page.wait_for_load_state("load")
         page.wait_for_load_state("domcontentloaded")
         accept_cookies_any(page)
@@ -643,7 +1092,7 @@ def open_pronote(context, page: Page):
     return pronote_page
 
 def goto_timetable(pronote_page: Page) -> Union[Page, Frame]:
-    pronote_page.set_default_timeout(TIMEOUT_MS)
+    pronote_page.set_default_timeout(BUDGET.timeout_ms(TIMEOUT_MS))
     accept_cookies_any(pronote_page)
 
     if TIMETABLE_PRE_SELECTOR:
@@ -655,7 +1104,7 @@ def goto_timetable(pronote_page: Page) -> Union[Page, Frame]:
                 ctx = find_timetable_ctx(pronote_page, timeout_ms=30_000)
             except TimeoutError:
                 ctx = pronote_page
-            grid = find_dom_grid_ctx(pronote_page, prefer=ctx, timeout_ms=5000) or ctx
+            grid = find_dom_grid_ctx(pronote_page, prefer=ctx, timeout_ms=BUDGET.timeout_ms(5000)) or ctx
             _safe_shot(grid, "08-timetable-custom-selector")
             return grid
 
@@ -663,7 +1112,7 @@ def goto_timetable(pronote_page: Page) -> Union[Page, Frame]:
         ctx = find_timetable_ctx(pronote_page, timeout_ms=10_000)
     except TimeoutError:
         ctx = pronote_page
-    grid = find_dom_grid_ctx(pronote_page, prefer=ctx, timeout_ms=5000) or ctx
+    grid = find_dom_grid_ctx(pronote_page, prefer=ctx, timeout_ms=BUDGET.timeout_ms(5000)) or ctx
     _safe_shot(grid, "08-timetable-already-here")
     return grid
 
@@ -674,28 +1123,98 @@ def ensure_all_visible(ctx: Union[Page, Frame]) -> None:
         click_css_any(ctx, '*:has-text("Tout afficher")', "tout-afficher")
         (ctx.page if isinstance(ctx, Frame) else ctx).wait_for_timeout(250)
 
-def goto_week_by_index(pronote_page: Page, current_ctx: Union[Page, Frame], n: int) -> Union[Page, Frame]:
-    if not WEEK_TAB_TEMPLATE:
-        return current_ctx
-    css = WEEK_TAB_TEMPLATE.format(n=n)
-    click_css_any(current_ctx, css, f"week-{n}")
-    grid = find_dom_grid_ctx(pronote_page, prefer=current_ctx, timeout_ms=5000) or current_ctx
-    end = time.time() + WEEK_HARD_TIMEOUT_MS/1000.0
-    while time.time() < end:
-        try:
-            cnt = grid.evaluate("""() => {
-                const a = document.querySelectorAll('[id^="id_"][id*="_coursInt_"]').length;
-                const b = document.querySelectorAll('[id^="id_"][id*="_cont"]').length;
-                const c = document.querySelectorAll('.EnteteCoursLibelle').length;
-                return a+b+c;
-            }""")
-            if int(cnt or 0) > 0:
-                break
-        except Exception:
-            pass
-        (pronote_page.page if isinstance(pronote_page, Frame) else pronote_page).wait_for_timeout(300)
-        grid = find_dom_grid_ctx(pronote_page, prefer=grid, timeout_ms=1500) or grid
-    return grid
+def _check_pronote_alert(ctx: Union[Page, Frame]) -> None:
+    """Message de suspension / surcharge affiché par PRONOTE -> arrêt propre à la prochaine requête."""
+    try: text = ctx.evaluate("() => (document.body?.innerText || '').slice(0, 20000)")
+    except Exception: return
+    if is_pronote_alert(text):
+        log("[PACING] message d'alerte PRONOTE détecté — arrêt avant suspension")
+        PACER.alert("message PRONOTE")
+
+_NEXT_WEEK_CSS = ('button[title*="suivante"]', 'button[aria-label*="suivante"]', 'a:has-text("Semaine suivante")')
+_PREV_WEEK_CSS = ('button[title*="précédente"]', 'button[aria-label*="précédente"]', 'a:has-text("Semaine précédente")')
+
+def _tab_selected(ctx: Union[Page, Frame], css: str) -> bool:
+    try:
+        return bool(ctx.evaluate("""(s) => { const n = document.querySelector(s);
+            return !!n && (n.getAttribute('aria-selected') === 'true' || /select/i.test(n.className || '')); }""", css))
+    except Exception:
+        return False
+
+class WeekNavigator:
+    """
+    Suit la semaine affichée (en-tête « du … au … », index d'onglet une fois connu) et y va en
+    une seule transition : aucune si elle est déjà affichée, suivante / précédente si elle est
+    adjacente, onglet WEEK_TAB_TEMPLATE sinon. L'arrivée est confirmée par le changement
+    d'en-tête (au lundi attendu quand il est connu), pas par le nombre de cases de la grille.
+    """
+    def __init__(self, page: Page, ctx: Union[Page, Frame]):
+        self.page = page; self.ctx = ctx
+        self.index: Optional[int] = None
+        self.header = _read_week_header(ctx)
+        self.monday = _header_monday(self.header)
+
+    def _plan(self, n: int) -> Tuple[str, Tuple[str, ...]]:
+        if self.index == n:
+            return "stay", ()
+        if self.index is not None and abs(n - self.index) == 1:
+            return ("next", _NEXT_WEEK_CSS) if n > self.index else ("prev", _PREV_WEEK_CSS)
+        if WEEK_TAB_TEMPLATE:
+            css = WEEK_TAB_TEMPLATE.format(n=n)
+            return ("stay", ()) if self.index is None and _tab_selected(self.ctx, css) else ("tab", (css,))
+        if self.index is None:
+            return "stay", ()   # sans onglets : on part de la semaine affichée
+        return ("next", _NEXT_WEEK_CSS) if n > self.index else ("prev", _PREV_WEEK_CSS)
+
+    def _await_header(self) -> str:
+        end = time.monotonic() + BUDGET.timeout_ms(WEEK_HARD_TIMEOUT_MS) / 1000
+        while time.monotonic() < end:
+            h = _read_week_header(self.ctx)
+            if h and h != self.header: return h
+            self.page.wait_for_timeout(150)
+        BUDGET.check("attente de l'en-tête de semaine")
+        return ""
+
+    def goto(self, n: int) -> Union[Page, Frame]:
+        kind, selectors = self._plan(n)
+        if kind == "stay":
+            self.index = n
+            log(f"[NAV] semaine {n} déjà affichée ({self.header or 'en-tête illisible'})")
+            return self.ctx
+        expected = self.monday + timedelta(weeks=n - self.index) if self.monday and self.index is not None else None
+        PACER.wait("nav")
+        t0 = time.monotonic()
+        clicked = any(click_css_any(self.ctx, css, f"week-{n}", settle_ms=0) for css in selectors)
+        if not clicked and kind != "tab" and WEEK_TAB_TEMPLATE:
+            kind = "tab"; clicked = click_css_any(self.ctx, WEEK_TAB_TEMPLATE.format(n=n), f"week-{n}", settle_ms=0)
+        if not clicked:
+            PACER.observe(None, ok=False, kind="nav")
+            log(f"[NAV] semaine {n}: commande '{kind}' introuvable — semaine affichée conservée")
+            self.index = None
+            return self.ctx
+        header = self._await_header()
+        if not header:
+            if self.header and kind == "tab":
+                log(f"[NAV] semaine {n}: en-tête inchangé après l'onglet — déjà affichée")
+                self.index = n
+            elif self.header:
+                PACER.observe(None, ok=False, kind="nav"); _check_pronote_alert(self.ctx)
+                log(f"[NAV] semaine {n}: en-tête inchangé après '{kind}' — position inconnue")
+                self.index = None
+            else:
+                log(f"[NAV] semaine {n}: pas d'en-tête « du … au … » lisible, arrivée non confirmée")
+                self.index = n
+            return self.ctx
+        PACER.observe(time.monotonic() - t0, kind="nav")
+        monday = _header_monday(header)
+        # onglet : position absolue ; suivante / précédente : relative, vérifiée par le lundi attendu
+        self.index = n if kind == "tab" or expected is None or monday == expected else None
+        if self.index is None:
+            log(f"[NAV] semaine {n}: lundi attendu {expected:%d/%m}, affiché '{header}' — repli sur l'onglet au prochain pas")
+        self.header, self.monday = header, monday
+        self.ctx = find_dom_grid_ctx(self.page, prefer=self.ctx, timeout_ms=BUDGET.timeout_ms(5000)) or self.ctx
+        log(f"[NAV] semaine {n} via {kind} en {time.monotonic() - t0:.1f}s : {header}")
+        return self.ctx
 
 # ===================== Extraction PRONOTE =====================
 def _list_course_ids(ctx: Union[Page, Frame]) -> List[str]:
@@ -745,33 +1264,51 @@ def _read_visible_panel(ctx: Union[Page, Frame]) -> Optional[Dict[str, Any]]:
         }""")
         if panel:
             return panel
+        METRICS.inc("panel_retries")
         time.sleep(PANEL_WAIT_MS/1000.0)
     return None
 
+_GRID_TILES_JS = r"""() => {
+  // Chaque case _coursInt_ associée à son _cont : dans un même groupe (id_<n>_), conts triés
+  // par centre vertical, recherche dichotomique puis balayage borné des voisins ;
+  // un cont qui chevauche horizontalement la case est toujours préféré.
+  const base = (s) => (s.match(/^id_(\d+)_/)||[])[1]||'';
+  const box = (e) => { const r = e.getBoundingClientRect(); return {l: r.left, r: r.right, c: (r.top + r.bottom) / 2}; };
+  const groups = {};
+  for (const e of document.querySelectorAll('[id^="id_"][id*="_cont"]')) {
+    const lines = (e.innerText||'').split('\n').map(s => s.replace(/\s+/g,' ').trim()).filter(Boolean);
+    (groups[base(e.id)] = groups[base(e.id)] || []).push(Object.assign(box(e), {lines}));
+  }
+  for (const g of Object.values(groups)) g.sort((a, b) => a.c - b.c);
+  const out = [];
+  for (const e of document.querySelectorAll('[id^="id_"][id*="_coursInt_"]')) {
+    const cu = box(e), list = groups[base(e.id)] || [];
+    let lo = 0, hi = list.length;
+    while (lo < hi) { const m = (lo + hi) >> 1; if (list[m].c < cu.c) lo = m + 1; else hi = m; }
+    let best = null, bestScore = Infinity;
+    const consider = (x) => {
+      const s = Math.abs(x.c - cu.c) + ((x.l < cu.r && x.r > cu.l) ? 0 : 1e6);
+      if (s < bestScore) { best = x; bestScore = s; }
+    };
+    for (let j = lo; j < list.length && list[j].c - cu.c < bestScore; j++) consider(list[j]);
+    for (let j = lo - 1; j >= 0 && cu.c - list[j].c < bestScore; j--) consider(list[j]);
+    out.push({id: e.id, aria: e.getAttribute('aria-label')||'', lines: best ? best.lines : []});
+  }
+  return out;
+}"""
+
+def _read_grid_tiles(ctx: Union[Page, Frame]) -> List[Dict[str, Any]]:
+    """Toutes les cases de la semaine (id, aria-label, lignes du _cont) en une seule évaluation."""
+    try: return ctx.evaluate(_GRID_TILES_JS) or []
+    except Exception: return []
+
+def _grid_fingerprint(ctx: Union[Page, Frame], header: str) -> str:
+    """Empreinte de la semaine affichée (en-tête + libellés des cases) en une évaluation, sans clic."""
+    tiles = sorted((t.get("aria", ""), t.get("lines", [])) for t in _read_grid_tiles(ctx))
+    return ChangeProbe.fingerprint([header, tiles])
+
 def _collect_pairs_by_proximity(ctx: Union[Page, Frame]) -> List[Dict[str, str]]:
-    return ctx.evaluate(r"""() => {
-      const cours = Array.from(document.querySelectorAll('[id^="id_"][id*="_coursInt_"]')).map(e=>({id:e.id, r:e.getBoundingClientRect()}));
-      const conts = Array.from(document.querySelectorAll('[id^="id_"][id*="_cont"]')).map(e=>({id:e.id, r:e.getBoundingClientRect(), text:(e.innerText||'').replace(/\s+/g,' ').trim()}));
-      const byBase = (s) => (s.match(/^id_(\d+)_/)||[])[1]||'';
-      const groupCont = {};
-      for (const c of conts) {
-        const b = byBase(c.id);
-        (groupCont[b] = groupCont[b] || []).push(c);
-      }
-      const out = [];
-      for (const cu of cours) {
-        const b = byBase(cu.id);
-        const list = (groupCont[b]||[]);
-        if (!list.length) { out.push({id:cu.id, aria:'', cont:''}); continue; }
-        let best = list[0], bestd = 1e12;
-        for (const x of list) {
-          const d = Math.abs((x.r.top + x.r.bottom)/2 - (cu.r.top + cu.r.bottom)/2);
-          if (d < bestd) { best=x; bestd=d; }
-        }
-        out.push({id:cu.id, aria:(document.getElementById(cu.id)?.getAttribute('aria-label')||''), cont: best.text});
-      }
-      return out;
-    }""")
+    return [{"id": t["id"], "aria": t["aria"], "cont": " ".join(t["lines"])} for t in _read_grid_tiles(ctx)]
 
 def _read_week_header(ctx: Union[Page, Frame]) -> str:
     try:
@@ -783,19 +1320,23 @@ def _read_week_header(ctx: Union[Page, Frame]) -> str:
     except Exception:
         return ""
 
-def extract_week_info(ctx: Union[Page, Frame]) -> Dict[str, Any]:
-    header_text = _read_week_header(ctx)
-    monday: Optional[datetime] = None
+def _header_monday(header_text: str) -> Optional[datetime]:
+    """Lundi de l'en-tête « du jj/mm[/aa] au … »."""
     try:
         m = re.search(r'du\s+(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?', header_text or '', flags=re.IGNORECASE)
         if m:
             y = int(m.group(3)) if m.group(3) else datetime.now().year
             if y < 100: y += 2000
-            monday = datetime(y, int(m.group(2)), int(m.group(1)))
+            return datetime(y, int(m.group(2)), int(m.group(1)))
     except Exception:
-        monday = None
+        pass
+    return None
 
-    tiles: List[Dict[str, Any]] = []
+def extract_week_info(ctx: Union[Page, Frame]) -> Dict[str, Any]:
+    header_text = _read_week_header(ctx)
+    monday = _header_monday(header_text)
+
+    tiles: List[Lesson] = []
     year = (monday.year if monday else datetime.now().year)
 
     counts = {}
@@ -803,36 +1344,56 @@ def extract_week_info(ctx: Union[Page, Frame]) -> Dict[str, Any]:
         try: c = ctx.evaluate("(s)=>document.querySelectorAll(s).length", sel)
         except Exception: c = 0
         counts[sel] = int(c or 0)
-    _safe_write(f"{SCREEN_DIR}/edp_selector_counts.json", json.dumps(counts, ensure_ascii=False, indent=2))
+    _safe_write(f"{_screen_dir()}/edp_selector_counts.json", json.dumps(counts, ensure_ascii=False, indent=2))
 
     click_log = []
-    ids = _list_course_ids(ctx)
+    grid = _read_grid_tiles(ctx) if STATIC_FIRST else []
+    if grid:
+        # lecture statique : seules les cases ambiguës passent par le clic + panneau
+        ids = []
+        for g in grid[:MAX_TILES_PER_WEEK]:
+            lesson, why = parse_static_tile(g, year, monday)
+            if lesson:
+                tiles.append(lesson); METRICS.inc("tiles_static")
+            else:
+                ids.append(g["id"]); METRICS.inc("tile_clicks", reason=why)
+                click_log.append({"id": g["id"], "static": why})
+        log(f"[STATIC] {len(tiles)}/{len(grid)} cases lues sans clic, {len(ids)} à ouvrir")
+        total = len(grid)
+    else:
+        ids = _list_course_ids(ctx)
+        total = len(ids)
     lim = min(len(ids), MAX_TILES_PER_WEEK)
+    truncated = ""
     for i in range(lim):
+        if BUDGET.left() <= 0:
+            truncated = f"budget épuisé après {i}/{lim} cases"; break
         el_id = ids[i]
+        PACER.wait("click")
+        t0 = time.monotonic()
         ok = _click_by_id(ctx, el_id)
         if not ok:
             click_log.append({"id": el_id, "clicked": False}); continue
         panel = _read_visible_panel(ctx)
+        PACER.observe(time.monotonic() - t0, ok=bool(panel), kind="click")
         if not panel:
+            _check_pronote_alert(ctx)
+            METRICS.inc("parse_failures", kind="no_panel")
             click_log.append({"id": el_id, "clicked": True, "panel": None}); continue
         parsed = parse_panel(panel, year)
         click_log.append({"id": el_id, "clicked": True, "panel_header": panel.get("header",""), "parsed_ok": bool(parsed)})
-        if not parsed: continue
-        tiles.append({
-            "label": f"{parsed['summary']} — {panel.get('header','')}",
-            "summary": parsed["summary"],
-            "room": parsed["room"],
-            "start_dt": parsed["start_dt"],
-            "end_dt": parsed["end_dt"],
-            "panel_header": panel.get("header",""),
-            "panel_text": panel.get("raw",""),
-        })
+        if not parsed:
+            METRICS.inc("parse_failures", kind="panel"); continue
+        tiles.append(parsed)
         try: ctx.evaluate("()=>document.body.click()")
         except Exception: pass
         if len(tiles) >= MAX_TILES_PER_WEEK: break
 
-    _safe_write(f"{SCREEN_DIR}/edp_click_log.json", json.dumps(click_log, ensure_ascii=False, indent=2))
+    _safe_write(f"{_screen_dir()}/edp_click_log.json", json.dumps(click_log, ensure_ascii=False, indent=2))
+    # semaine "complète" : chaque case cliquée a donné un cours (panneau lu ET interprété), sans troncature ;
+    # sinon pas de balayage : un panneau illisible ne doit pas supprimer l'évènement existant du cours
+    missed = sum(1 for c in click_log if "static" not in c and not c.get("parsed_ok"))
+    complete = bool(tiles) and total <= MAX_TILES_PER_WEEK and missed == 0 and not truncated
 
     if not tiles:
         panels = ctx.evaluate(r"""() => {
@@ -854,227 +1415,672 @@ def extract_week_info(ctx: Union[Page, Frame]) -> Dict[str, Any]:
         for panel in (panels or []):
             parsed = parse_panel(panel, year)
             if not parsed: continue
-            tiles.append({
-                "label": f"{parsed['summary']} — {panel.get('header','')}",
-                "summary": parsed["summary"],
-                "room": parsed["room"],
-                "start_dt": parsed["start_dt"],
-                "end_dt": parsed["end_dt"],
-                "panel_header": panel.get("header",""),
-                "panel_text": panel.get("raw",""),
-            })
+            tiles.append(parsed)
             if len(tiles) >= MAX_TILES_PER_WEEK: break
 
     if not tiles:
         pairs = _collect_pairs_by_proximity(ctx)
-        _safe_write(f"{SCREEN_DIR}/edp_pairs_preview.json", json.dumps(pairs[:20], ensure_ascii=False, indent=2))
+        _safe_write(f"{_screen_dir()}/edp_pairs_preview.json", json.dumps(pairs[:20], ensure_ascii=False, indent=2))
         for t in pairs:
-            aria = t.get("aria",""); cont = t.get("cont","")
-            times = parse_times(aria)
-            if not (times["start"] or times["end"]): continue
-            dt_date = parse_date_from_text(aria, fallback_year=year)
-            if not dt_date and monday:
-                jours = ['lundi','mardi','mercredi','jeudi','vendredi','samedi','dimanche']
-                found = next((i for i,n in enumerate(jours) if n in (aria or '').lower()), None)
-                if found is not None: dt_date = monday + timedelta(days=found)
-            if not dt_date: continue
-            start_hm = times["start"]; end_hm = times["end"]
-            if start_hm and end_hm:
-                start_dt = to_dt(dt_date, start_hm); end_dt = to_dt(dt_date, end_hm)
-            elif start_hm and times["duration"]:
-                dh, dm = times["duration"]; start_dt = to_dt(dt_date, start_hm); end_dt = start_dt + timedelta(hours=dh, minutes=dm)
-            else:
-                continue
-            summary = (re.sub(r'\s+',' ', cont).strip() or "Cours")
-            room = ""
-            m = re.search(r'(?:Salle[s]?\s+)(.+)$', cont, re.IGNORECASE)
-            if m: room = m.group(1).strip()
-            tiles.append({
-                "label": f"{summary} — {aria}",
-                "summary": summary,
-                "room": room,
-                "start_dt": start_dt,
-                "end_dt": end_dt,
-                "panel_header": aria,
-                "panel_text": aria + " " + cont,
-            })
+            parsed = parse_grid_tile(t.get("aria",""), t.get("cont",""), year, monday)
+            if not parsed:
+                METRICS.inc("parse_failures", kind="grid"); continue
+            tiles.append(parsed)
             if len(tiles) >= MAX_TILES_PER_WEEK: break
 
     if not tiles:
         try: html_full = ctx.evaluate("() => document.documentElement.outerHTML")
         except Exception: html_full = ""
-        _safe_write(f"{SCREEN_DIR}/edp_full_dom.html", html_full)
+        _safe_write(f"{_screen_dir()}/edp_full_dom.html", html_full)
         ids_dump = ctx.evaluate(r"""() => ({
           cours: Array.from(document.querySelectorAll('[id^="id_"][id*="_coursInt_"]')).map(e=>e.id),
           conts: Array.from(document.querySelectorAll('[id^="id_"][id*="_cont"]')).map(e=>e.id),
           entetes: Array.from(document.querySelectorAll('.EnteteCoursLibelle')).map(e=>e.innerText.trim()).slice(0,50)
         })""")
-        _safe_write(f"{SCREEN_DIR}/edp_candidates.json", json.dumps(ids_dump, ensure_ascii=False, indent=2))
+        _safe_write(f"{_screen_dir()}/edp_candidates.json", json.dumps(ids_dump, ensure_ascii=False, indent=2))
 
-    _safe_write(f"{SCREEN_DIR}/edp_debug_summary.json", json.dumps({
+    _safe_write(f"{_screen_dir()}/edp_debug_summary.json", json.dumps({
         "header": header_text, 
         "monday": monday.isoformat() if monday else None,
         "click_ids": ids[:lim] if ids else [],
         "total_tiles": len(tiles)
     }, ensure_ascii=False, indent=2))
 
-    return {"monday": monday, "tiles": tiles, "header": header_text}
-
-# ===================== Main =====================
-def run() -> None:
-    if not ENT_USER or not ENT_PASS:
-        raise SystemExit("PRONOTE_USER / PRONOTE_PASS manquants.")
-
-    svc = get_gcal_service()
-    try:    me_primary = svc.calendars().get(calendarId="primary").execute()
-    except: me_primary = {}
-    try:    cal_meta = svc.calendars().get(calendarId=CALENDAR_ID).execute()
-    except Exception as e: cal_meta = {"error": str(e)}
+    return {"monday": monday, "tiles": tiles, "header": header_text, "complete": complete, "truncated": truncated}
+
+# ===================== Sources =====================
+def build_event_body(t: Lesson, prefix: str = TITLE_PREFIX, color_id: str = COLOR_ID,
+                     namespace: str = "") -> DesiredEvent:
+    """Cours (toute source) -> évènement voulu. Même clé dedupe quelle que soit la source."""
+    status_tag = f" ({t.status})" if t.status else ""
+    title  = f"{prefix}{t.summary or 'Cours'}{status_tag}"
+    dedupe = namespaced_key(make_dedupe_key(t.start_dt, t.end_dt, title, t.room), namespace)
+    private = {"source": SOURCE_TAG, "dedupe": dedupe}
+    if namespace: private["ns"] = namespace
+    return DesiredEvent(
+        dedupe, title, t.room, t.start_dt.isoformat(), t.end_dt.isoformat(), TIMEZONE,
+        color_id=color_id, event_id=event_id_from_dedupe(dedupe), private=private,
+    )
+
+class PlaywrightLessonSource(LessonSource):
+    """Source lente : scraping de l'emploi du temps PRONOTE dans Chromium (via l'ENT)."""
+    name = "playwright"
+
+    def __init__(self, user: str = ENT_USER, password: str = ENT_PASS, pronote_url: str = PRONOTE_URL,
+                 cdp_endpoint: Optional[str] = None):
+        self.user, self.password, self.pronote_url = user, password, pronote_url
+        self.cdp_endpoint = cdp_endpoint   # Chromium partagé (multi-comptes) : contexte isolé dans ce navigateur
+        self._pw = self._browser = self._context = None
+        self.pronote: Optional[Page] = None
+        self.ctx: Optional[Union[Page, Frame]] = None
+        self.net = NetworkMeter()
+        self.perf = BrowserPerf()
+        self.skipped_weeks: Dict[int, str] = {}   # semaine -> raison (budget temps)
+
+    def connect(self) -> None:
+        with BUDGET.slice("connexion", share=CONNECT_BUDGET_SHARE, reserve_s=BUDGET.reserve_s):
+            with METRICS.phase("browser_start"):
+                page = self._start_browser()
+            self.perf.attach(self.context, page)
+            log("Connexion ENT...")
+            with METRICS.phase("login_ent"): PACER.call("login", login_ent, page, self.user, self.password)
+            self.perf.sample("login_ent", page)
+            log("Ouverture PRONOTE...")
+            with METRICS.phase("open_pronote"): self.pronote = open_pronote(self.context, page, self.pronote_url)
+            if self.pronote is not page:
+                self.perf.sample("open_pronote", page)   # fin de la page ENT avant de suivre le popup
+                self.perf.attach(self.context, self.pronote)
+            self.perf.sample("open_pronote", self.pronote)
+            log("Navigation vers 'Emploi du temps'...")
+            with METRICS.phase("goto_timetable"): self.ctx = goto_timetable(self.pronote)
+            self.perf.sample("goto_timetable", self.ctx)
+
+    def _start_browser(self) -> Page:
+        self._pw = sync_playwright().start()   # une instance Playwright par thread (API sync)
+        args = ["--disable-dev-shm-usage"]
+        if self.cdp_endpoint:
+            self._browser = self._pw.chromium.connect_over_cdp(self.cdp_endpoint)
+            context = self._context = self._browser.new_context(locale="fr-FR", timezone_id=TIMEZONE)
+            page = context.new_page()
+        elif BROWSER_PROFILE_DIR:
+            # profil persistant : cache disque et cache de code JS réutilisés d'un run à l'autre
+            prune_profile_cache(BROWSER_PROFILE_DIR, BROWSER_CACHE_MAX_MB)
+            args.append(f"--disk-cache-size={BROWSER_CACHE_MAX_MB * 1_000_000}")
+            context = self._context = self._pw.chromium.launch_persistent_context(
+                BROWSER_PROFILE_DIR, headless=not HEADFUL, args=args, locale="fr-FR", timezone_id=TIMEZONE)
+            context.clear_cookies()   # cache oui, session non : le login ENT reste déterministe
+            page = context.pages[0] if context.pages else context.new_page()
+        else:
+            self._browser = self._pw.chromium.launch(headless=not HEADFUL, args=args)
+            context = self._context = self._browser.new_context(locale="fr-FR", timezone_id=TIMEZONE)
+            page = context.new_page()
+        page.set_default_timeout(BUDGET.timeout_ms(TIMEOUT_MS))
+        self.net.attach(context, page)
+        context.on("page", lambda pg: self.net.attach(context, pg))
+        return page
 
-    _safe_write(f"{SCREEN_DIR}/gcal_whoami.json", json.dumps({"primary": me_primary, "target_calendar": cal_meta}, ensure_ascii=False, indent=2))
-    log(f"[GCAL] Using calendar '{cal_meta.get('summary','?')}' (id={CALENDAR_ID}) as {me_primary.get('id','?')}")
+    @property
+    def context(self):
+        return self._context
 
-    # --- PURGE optionnelle (avant import)
-    if PURGE_BEFORE_RUN:
-        now = datetime.now()
-        tmin = now - timedelta(days=PURGE_PAST_DAYS)
-        tmax = now + timedelta(days=PURGE_FUTURE_DAYS)
-        log(f"[PURGE] window {tmin.date()} -> {tmax.date()} (ONLY_SOURCE={PURGE_SOURCE_ONLY}, DUPL={PURGE_DUPLICATES}, CONTAINS='{PURGE_DELETE_IF_CONTAINS}', DRY={PURGE_DRY_RUN})")
+    def _start_trace(self) -> bool:
         try:
-            res = purge_calendar_events(
-                svc, CALENDAR_ID, tmin, tmax,
-                only_source=PURGE_SOURCE_ONLY,
-                delete_if_contains=PURGE_DELETE_IF_CONTAINS,
-                dedup=PURGE_DUPLICATES,
-                tol_min=DEDUP_TOLERANCE_MIN,
-                dry_run=PURGE_DRY_RUN,
-                clean_prefix_regex=CLEAN_PREFIX_REGEX
-            )
-            log(f"[PURGE] Scannés={res['scanned']} — Supprimés={res['deleted']}")
+            self._context.tracing.start(screenshots=True, snapshots=True)
+            return True
         except Exception as e:
-            log(f"[PURGE] Erreur: {e}")
+            log(f"[TRACE] {e}"); return False
 
-    # --- Nettoyage titres optionnel (retire [Mo])
-    if CLEAN_PREFIX_BEFORE_RUN:
-        now = datetime.now()
-        tmin = now - timedelta(days=CLEAN_PAST_DAYS)
-        tmax = now + timedelta(days=CLEAN_FUTURE_DAYS)
-        log(f"[CLEAN] Retrait prefix regex='{CLEAN_PREFIX_REGEX}' sur {tmin.date()} -> {tmax.date()} (ONLY_SOURCE={CLEAN_ONLY_SOURCE}, DRY={CLEAN_DRY_RUN})")
+    def _stop_trace(self, week_idx: int) -> None:
+        path = f"{_screen_dir()}/trace-week-{week_idx}.zip"
         try:
-            scanned, modified = strip_calendar_prefixes(
-                svc, CALENDAR_ID, tmin, tmax,
-                regex=CLEAN_PREFIX_REGEX,
-                only_source=CLEAN_ONLY_SOURCE,
-                dry_run=CLEAN_DRY_RUN
-            )
-            log(f"Scannés: {scanned} — Modifiés: {modified} — DRY_RUN={CLEAN_DRY_RUN}")
+            self._context.tracing.stop(path=path)
+            log(f"[TRACE] semaine {week_idx} -> {path} (npx playwright show-trace)")
         except Exception as e:
-            log(f"[CLEAN] Erreur nettoyage: {e}")
-
-    created = updated = 0
-    created_events_dump: List[Dict[str, Any]] = []
-    overall_min_dt: Optional[datetime] = None
-    overall_max_dt: Optional[datetime] = None
+            log(f"[TRACE] {e}")
+
+    def weeks(self, start: datetime, end: datetime):
+        nav = WeekNavigator(self.pronote, self.ctx)
+        start_idx = max(1, FETCH_WEEKS_FROM)
+        end_idx   = start_idx + max(1, WEEKS_TO_FETCH) - 1
+
+        for week_idx in range(start_idx, end_idx + 1):
+            cached = self.checkpoint.week(self.name, week_idx) if self.checkpoint else None
+            if cached:
+                log(f"[CHECKPOINT] Semaine {week_idx}: {len(cached.lessons)} cours repris du run interrompu (pas de navigation)")
+                yield cached
+                continue
+            tracing = week_idx == TRACE_WEEK and self._start_trace()
+            try:
+                if BUDGET.remaining() <= BUDGET.reserve_s:
+                    # échéance du run : les semaines restantes seront lues au prochain run
+                    for i in range(week_idx, end_idx + 1): self.skipped_weeks[i] = "échéance du run atteinte"
+                    METRICS.inc("budget_skips", end_idx - week_idx + 1, phase="week")
+                    log(f"[BUDGET] échéance du run atteinte : semaines {week_idx}..{end_idx} non lues")
+                    break
+                # part égale du temps restant entre les semaines encore à lire (hors checkpoint)
+                todo = sum(1 for i in range(week_idx, end_idx + 1) if not (self.checkpoint and self.checkpoint.has(self.name, i)))
+                log(f"-> Selection Semaine index={week_idx} via css '{WEEK_TAB_TEMPLATE.format(n=week_idx)}'")
+                try:
+                    with BUDGET.slice(f"semaine {week_idx}", share=1 / todo, reserve_s=BUDGET.reserve_s):
+                        self.pronote.set_default_timeout(BUDGET.timeout_ms(TIMEOUT_MS))
+                        with METRICS.phase("week_nav", week=week_idx):
+                            ctx = nav.goto(week_idx)
+                            accept_cookies_any(self.pronote); ensure_all_visible(ctx)
+                            _safe_shot(ctx, f"08-week-{week_idx}-after-select")
+                        self.perf.sample("week_nav", ctx, week=week_idx)
+
+                        key = nav.monday.date().isoformat() if self.probe and nav.monday else ""
+                        fp = _grid_fingerprint(ctx, nav.header) if key else ""
+                        if fp and self.probe.unchanged(key, fp):
+                            info = None
+                        else:
+                            with METRICS.phase("week_extract", week=week_idx):
+                                info  = extract_week_info(ctx)
+                except BudgetExceeded as e:
+                    # opération bloquée : semaine ignorée (jamais balayée), position de navigation à revérifier
+                    self.skipped_weeks[week_idx] = str(e); nav.index = None
+                    METRICS.inc("budget_skips", phase="week")
+                    log(f"[BUDGET] semaine {week_idx} ignorée : {e}")
+                    continue
+                except PacingStop as e:
+                    # semaine en cours abandonnée (jamais balayée) ; les suivantes au prochain run
+                    log(f"[PACING] arrêt propre à la semaine {week_idx} ({e}) — reprise au prochain run")
+                    PACER.note_checkpoint(source=self.name, resume_week=week_idx)
+                    self.paced_out = str(e)
+                    break
+                if info is None:
+                    METRICS.inc("probe_skips")
+                    log(f"[PROBE] Semaine {week_idx} ({nav.header}): grille inchangée depuis le dernier run — pas d'extraction")
+                    continue
+                tiles = info["tiles"] or []
+                METRICS.set("week_tiles", len(tiles), week=week_idx)
+                self.perf.sample("week_extract", ctx, week=week_idx, tiles=len(tiles))
+                hdr   = (info.get("header") or "").replace("\\n", " ")[:160]
+                log(f"Semaine {week_idx}: {len(tiles)} cases, header='{hdr}'")
 
-    # --- Phase Playwright (toujours exécutée)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=not HEADFUL, args=["--disable-dev-shm-usage"])
+                monday = info.get("monday")
+                week = ScrapedWeek(hdr, monday, monday + timedelta(days=7) if monday else None,
+                                   [t for t in tiles if not (t.end_dt < start or t.start_dt > end)],
+                                   complete=bool(info.get("complete") and monday))
+                if info.get("truncated"):
+                    # cases lues écrites quand même (sans balayage) ; semaine relue en entier au prochain run
+                    self.skipped_weeks[week_idx] = info["truncated"]
+                    METRICS.inc("budget_skips", phase="tiles")
+                    log(f"[BUDGET] semaine {week_idx} partielle : {info['truncated']}")
+                else:
+                    if self.checkpoint: self.checkpoint.add_week(self.name, week_idx, week)
+                    if fp and week.complete: self.probe.note(key, fp)
+            finally:
+                if tracing: self._stop_trace(week_idx)   # aussi sur continue / break / exception
+            yield week
+        self.ctx = nav.ctx
+
+    def close(self) -> None:
+        if self._context is not None:
+            log(f"[NET] {self.net.summary()}"); self.net.export()
+        self.perf.close()
         try:
-            context = browser.new_context(locale="fr-FR", timezone_id=TIMEZONE)
-            page = context.new_page(); page.set_default_timeout(TIMEOUT_MS)
+            if self.cdp_endpoint and self._context: self._context.close()   # le navigateur partagé reste ouvert
+            if self._browser: self._browser.close()   # connect_over_cdp : simple déconnexion
+            elif self._context: self._context.close()
+        except Exception: pass
+        try:
+            if self._pw: self._pw.stop()
+        except Exception: pass
+        self._browser = self._context = self._pw = None
 
-            log("Connexion ENT..."); login_ent(page)
-            log("Ouverture PRONOTE..."); pronote = open_pronote(context, page)
-            log("Navigation vers 'Emploi du temps'..."); ctx = goto_timetable(pronote)
+def _api_source(user: str = ENT_USER, password: str = ENT_PASS, pronote_url: str = PRONOTE_URL) -> Optional[LessonSource]:
+    """Source pronotepy (dépendance optionnelle) sur la même base PRONOTE que PRONOTE_URL."""
+    if not USE_API_SOURCE: return None
+    try:
+        from pronote_to_family_mo import PronotepyLessonSource, PRONOTE_BASE
+    except ImportError as e:
+        log(f"[SOURCE] pronotepy non disponible ({e})")
+        return None
+    base = pronote_url.rsplit("/", 1)[0] if pronote_url.endswith(".html") else (pronote_url or PRONOTE_BASE)
+    return PronotepyLessonSource(base=base, user=user, password=password)
 
-            start_idx = max(1, FETCH_WEEKS_FROM)
-            end_idx   = start_idx + max(1, WEEKS_TO_FETCH) - 1
+def _api_window(now: datetime) -> Tuple[datetime, datetime]:
+    """Fenêtre demandée à l'API : les WEEKS_TO_FETCH semaines à partir du lundi courant."""
+    monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return monday, monday + timedelta(weeks=max(1, WEEKS_TO_FETCH))
 
-            for week_idx in range(start_idx, end_idx + 1):
-                log(f"-> Selection Semaine index={week_idx} via css '{WEEK_TAB_TEMPLATE.format(n=week_idx)}'")
-                ctx = goto_week_by_index(pronote, ctx, week_idx)
-                accept_cookies_any(pronote); ensure_all_visible(ctx)
-                _safe_shot(ctx, f"08-week-{week_idx}-after-select")
+# ===================== Agendas cibles (sinks) =====================
+class GoogleCalendarSink(EventSink):
+    """
+    Un agenda cible, alimenté par le scrape commun : préfixe, couleur et namespace propres.
+    Sans maintenance, chaque semaine est réconciliée dès qu'elle arrive (mémoire constante) ;
+    la maintenance (PURGE / CLEAN) et le mode plan ont besoin de l'ensemble voulu complet.
+    """
+    def __init__(self, target: Dict[str, str], index: int, mode: str, now: datetime,
+                 window: Tuple[datetime, datetime], multi: bool = False,
+                 journal: Optional[WriteJournal] = None):
+        self.cal_id    = target["calendar_id"]
+        self.prefix    = target["title_prefix"]
+        self.color_id  = target["color_id"]
+        self.namespace = target["namespace"]
+        self.name   = self.namespace or f"cal{index}"
+        self.tag    = f"[{self.name}] " if multi else ""
+        self.suffix = f"-{self.name}" if index else ""   # artefacts de la 1re cible : noms inchangés
+        self.art_dir = _screen_dir()   # fixé dans le thread du compte, pas dans celui du sink
+        self.now = now; self.win_start, self.win_end = window
+        self.planning = mode == "plan"
+        self.maintenance = PURGE_BEFORE_RUN or CLEAN_PREFIX_BEFORE_RUN or self.planning
+        self.res = {"created": 0, "updated": 0, "deleted": 0, "errors": 0, "unchanged": 0}
+        self.desired: Dict[str, DesiredEvent] = {}
+        self.desired_keys: set = set()
+        self.swept: List[Tuple[datetime, datetime]] = []
+        self.verify_ranges: List[Tuple[datetime, datetime]] = []   # semaines produites par la source
+        self.legacy_seen = 0
+        self.listed: Dict[str, Dict[str, Any]] = {}   # listing de la semaine en cours : clé dedupe -> évènement
+        self.failed_weeks: set = set()   # lundis (ISO) des semaines dont une écriture a échoué
+        self.week_errors = 0
+        self.dump: Optional[JsonlWriter] = None
+        self.journal = None if self.planning else journal
+
+    def _artifact(self, name: str) -> str:
+        base, ext = os.path.splitext(name)
+        return f"{self.art_dir}/{base}{self.suffix}{ext}"
+
+    def open(self) -> None:
+        svc = self.svc = get_gcal_service()
+        try:    me_primary = svc.calendars().get(calendarId="primary").execute()
+        except: me_primary = {}
+        try:    cal_meta = svc.calendars().get(calendarId=self.cal_id).execute()
+        except Exception as e: cal_meta = {"error": str(e)}
+        _safe_write(self._artifact("gcal_whoami.json"), json.dumps({"primary": me_primary, "target_calendar": cal_meta}, ensure_ascii=False, indent=2))
+        log(f"{self.tag}[GCAL] Using calendar '{cal_meta.get('summary','?')}' (id={self.cal_id}) as {me_primary.get('id','?')}")
+
+        # Ids déterministes : existant lu dans le listing de chaque semaine ; absent -> insert (409 -> patch).
+        # La recherche par cours ne sert qu'à migrer les hérités
+        # (namespace par défaut uniquement : les autres cibles n'ont jamais eu d'id aléatoire).
+        self.marker = os.path.join(STATE_DIR, f"legacy_ids_migrated_{hashlib.sha1(self.cal_id.encode()).hexdigest()[:10]}")
+        self.migrate = not self.namespace and (LEGACY_ID_MIGRATION in ("1", "true") or
+                                               (LEGACY_ID_MIGRATION == "auto" and not os.path.exists(self.marker)))
+        self.dump = JsonlWriter(self._artifact("gcal_created_events.jsonl"))
+        self.reconciler = CalendarReconciler(svc, self.cal_id, lookup=self._lookup, on_write=self._dump, journal=self.journal)
+        todo = self.journal.unacked(self.cal_id) if self.journal else []
+        if todo:
+            # écritures envoyées par le run interrompu sans confirmation : rejeu idempotent (ids déterministes)
+            log(f"{self.tag}[JOURNAL] {len(todo)} écritures non confirmées du run précédent -> rejeu")
+            with METRICS.phase("calendar_writes", target=self.name):
+                for k, v in apply_ops_batched(svc, self.cal_id, todo, on_write=self._dump, journal=self.journal).items():
+                    self.res[k] += v
+
+    def _lookup(self, key: str, d: DesiredEvent):
+        ev = self.listed.get(key)
+        if ev is not None:
+            if ev.get("id") != d.event_id: self.legacy_seen += 1
+            return ev
+        if not self.migrate: return None   # absent du listing : insert (409 -> patch)
+        ev = _find_existing_event(self.svc, self.cal_id, d.body(), d.summary, d.location, key)
+        if ev and ev.get("extendedProperties", {}).get("private", {}).get("ns"):
+            return None   # cours d'une autre cible du même agenda, pas un hérité
+        if ev and ev.get("id") != d.event_id: self.legacy_seen += 1
+        return ev
+
+    def _dump(self, action: str, ev: Dict[str, Any]) -> None:
+        self.dump.write({
+            "action": action, "summary": ev.get("summary"),
+            "start": ev.get("start"), "end": ev.get("end"),
+            "htmlLink": ev.get("htmlLink"), "id": ev.get("id"),
+        })
 
-                info  = extract_week_info(ctx)
-                tiles = info["tiles"] or []
-                hdr   = (info.get("header") or "").replace("\\n", " ")[:160]
-                log(f"Semaine {week_idx}: {len(tiles)} cases, header='{hdr}'")
+    def consume(self, week: ScrapedWeek) -> None:
+        week_desired: Dict[str, DesiredEvent] = {}
+        for t in week.lessons:
+            d = build_event_body(t, self.prefix, self.color_id, self.namespace)
+            week_desired[d.key] = d
+        self.desired_keys.update(week_desired)
+        if week.start and week.end:
+            self.verify_ranges.append((week.start, week.end))
+        elif week.lessons:
+            self.verify_ranges.append((min(t.start_dt for t in week.lessons) - timedelta(days=1),
+                                       max(t.end_dt for t in week.lessons) + timedelta(days=1)))
+        # plage balayable : semaine complète, non vide, bornée à la fenêtre du run
+        sweep_rng = None
+        if SWEEP_MISSING and week.complete and week_desired:
+            sweep_rng = (max(week.start, self.win_start), min(week.end, self.win_end))
+        elif SWEEP_MISSING:
+            log(f"{self.tag}[SWEEP] {week.label}: semaine vide ou incomplète — pas de balayage")
+        if self.maintenance:
+            self.desired.update(week_desired)
+            if sweep_rng: self.swept.append(sweep_rng)
+        elif week_desired:
+            # un listing par semaine (celui du balayage) : cours inchangés sans écriture, patch direct sinon
+            rng = sweep_rng or (min(t.start_dt for t in week.lessons), max(t.end_dt for t in week.lessons))
+            listing = list(iter_events(self.svc, self.cal_id, timeMin=to_rfc3339_local(rng[0]),
+                                       timeMax=to_rfc3339_local(rng[1]), singleEvents=True,
+                                       showDeleted=False, privateExtendedProperty=f"source={SOURCE_TAG}"))
+            self.listed = {}
+            for ev in listing:
+                key = ev.get("extendedProperties", {}).get("private", {}).get("dedupe")
+                if key and _ev_owned(ev, self.namespace): self.listed.setdefault(key, ev)
+            with METRICS.phase("calendar_writes", target=self.name):
+                counts = self.reconciler.sync(week_desired)
+            gone = self.reconciler.deleted_ids   # déjà supprimés par le diff (hérités) : hors balayage
+            for k, v in counts.items(): self.res[k] += v
+            errors = counts["errors"]
+            if sweep_rng:
+                ops = [op for op in sweep_ops(listing, set(week_desired), SOURCE_TAG, self.namespace)
+                       if op["event_id"] not in gone]
+                if ops:
+                    log(f"{self.tag}[SWEEP] {week.label}: {len(ops)} cours disparus de PRONOTE -> suppression")
+                    with METRICS.phase("calendar_writes", target=self.name):
+                        swept = self.reconciler.apply(ops)
+                    self.res["deleted"] += swept["deleted"]; self.res["errors"] += swept["errors"]
+                    errors += swept["errors"]
+            if errors and week.start:
+                # la sonde ne gardera pas l'empreinte de cette semaine : relue au prochain run
+                self.failed_weeks.add(week.start.date().isoformat()); self.week_errors += errors
+
+    def finish(self) -> Dict[str, Any]:
+        if self.planning:
+            with METRICS.phase("plan", target=self.name):
+                ops, _ = plan_maintenance(self.svc, self.cal_id, self.desired, self.now, self.swept, self.namespace)
+            return {"ops": ops, "lessons": len(self.desired)}
+        res = self.res
+        if self.maintenance:
+            # --- Maintenance (PURGE / CLEAN) fusionnée avec l'upsert : un seul listing
+            log(f"{self.tag}[MAINT] PURGE={PURGE_BEFORE_RUN} (ONLY_SOURCE={PURGE_SOURCE_ONLY}, DUPL={PURGE_DUPLICATES}, CONTAINS='{PURGE_DELETE_IF_CONTAINS}', DRY={PURGE_DRY_RUN}) "
+                f"CLEAN={CLEAN_PREFIX_BEFORE_RUN} (regex='{CLEAN_PREFIX_REGEX}', ONLY_SOURCE={CLEAN_ONLY_SOURCE}, DRY={CLEAN_DRY_RUN})")
+            with METRICS.phase("maintenance", target=self.name):
+                maint = run_maintenance(self.svc, self.cal_id, self.desired, self.now, on_write=self._dump,
+                                        swept=self.swept, namespace=self.namespace, journal=self.journal)
+            res = dict(maint, **{k: res[k] + maint[k] for k in ("created", "updated", "deleted", "errors")})
+        if self.migrate and LEGACY_ID_MIGRATION == "auto" and not self.maintenance \
+                and self.legacy_seen == 0 and res["errors"] == 0 and self.desired_keys:
+            _safe_write(self.marker, datetime.now().isoformat())
+            log(f"{self.tag}[GCAL] Migration des ids terminée : plus de recherche par cours aux prochains runs.")
+        elif self.legacy_seen:
+            log(f"{self.tag}[GCAL] {self.legacy_seen} évènements hérités migrés vers un id déterministe.")
+        self.dump.close()
+
+        ver = {"found": 0, "extra": 0, "missing": 0}
+        if self.verify_ranges and self.desired_keys:
+            try:
+                with METRICS.phase("verify", target=self.name):
+                    ver = verify_calendar(self.svc, self.cal_id, self.verify_ranges, self.desired_keys,
+                                          self._artifact("gcal_search_after_run.jsonl"), self.namespace)
+                if ver["missing"] or ver["extra"]:
+                    log(f"{self.tag}[GCAL VERIFY] manquants={ver['missing']}, en trop={ver['extra']} "
+                        f"(détail: {os.path.basename(self._artifact('gcal_search_after_run.jsonl'))})")
+            except Exception as e:
+                log(f"{self.tag}[GCAL VERIFY] {e}")
+        return dict(res, found=ver["found"], keys=len(self.desired_keys),
+                    failed_weeks=sorted(self.failed_weeks), week_errors=self.week_errors)
+
+    def close(self) -> None:
+        if self.dump: self.dump.close()
 
-                for t in tiles:
-                    start_dt = t["start_dt"]; end_dt = t["end_dt"]
-                    summary  = t.get("summary") or "Cours"
-                    room     = t.get("room","")
-                    now = datetime.now()
-                    if end_dt < (now - timedelta(days=60)) or start_dt > (now + timedelta(days=180)): 
-                        continue
-
-                    ph = " ".join([t.get("panel_text","") or "", t.get("panel_header","") or "", t.get("label","") or ""]).lower()
-                    status_tag = ""
-                    for k, canon in _STATUS_CANON.items():
-                        if k in ph:
-                            status_tag = f" ({canon})"; break
-
-                    title    = f"{TITLE_PREFIX}{summary}{status_tag}"
-                    dedupe   = make_dedupe_key(start_dt, end_dt, title, room)
-                    body = {
-                        "summary": title,
-                        "location": room,
-                        "start": {"dateTime": start_dt.isoformat(), "timeZone": TIMEZONE},
-                        "end":   {"dateTime": end_dt.isoformat(),   "timeZone": TIMEZONE},
-                        "colorId": COLOR_ID,
-                        "extendedProperties": {"private": {"source": "pronote_playwright", "dedupe": dedupe}}
-                    }
-                    try:
-                        action, ev = upsert_event_by_dedupe(svc, CALENDAR_ID, body, dedupe)
-                        if action == "created": created += 1
-                        else: updated += 1
-                        created_events_dump.append({
-                            "action": action, "summary": ev.get("summary"),
-                            "start": ev.get("start"), "end": ev.get("end"),
-                            "htmlLink": ev.get("htmlLink"), "id": ev.get("id"),
-                        })
-                    except HttpError as e:
-                        log(f"[GCAL] {e}")
-
-                    overall_min_dt = min(overall_min_dt or start_dt, start_dt)
-                    overall_max_dt = max(overall_max_dt or end_dt,   end_dt)
-
-                if week_idx < end_idx:
-                    clicked = click_css_any(ctx, 'button[title*="suivante"]') or \
-                              click_css_any(ctx, 'button[aria-label*="suivante"]') or \
-                              click_css_any(ctx, 'a:has-text("Semaine suivante")')
-                    if clicked: _safe_shot(ctx, "09-next-week")
+# ===================== Main =====================
+def apply_plan(path: str = PLAN_FILE) -> Dict[str, int]:
+    """Exécute un plan (commande plan) sans re-scraper : batch + limiteur de débit, rejouable."""
+    plan = read_plan(path)
+    _gcal_credentials()
+    art_dir = _screen_dir()   # contexte du thread appelant (dossier du compte), pas celui des workers
+
+    def _apply(i: int, cal_id: str, ops: List[Dict[str, Any]]) -> Dict[str, int]:
+        log(f"[APPLY] {path}: {len(ops)} opérations sur {cal_id}")
+        svc = get_gcal_service()
+        with JsonlWriter(f"{art_dir}/gcal_created_events{f'-{i}' if i else ''}.jsonl") as dump:
+            counts = apply_ops_batched(svc, cal_id, ops, on_write=lambda action, ev: dump.write(
+                {"action": action, "summary": ev.get("summary"), "start": ev.get("start"), "end": ev.get("end"), "id": ev.get("id")}))
+        log(f"[APPLY] {cal_id}: crees={counts['created']}, maj={counts['updated']}, supprimes={counts['deleted']}, erreurs={counts['errors']}")
+        return counts
+
+    with ThreadPoolExecutor(max_workers=max(1, len(plan))) as ex:
+        results = list(ex.map(lambda a: _apply(*a), [(i, cal_id, ops) for i, (cal_id, ops) in enumerate(plan)]))
+    total = {k: sum(c[k] for c in results) for k in ("created", "updated", "deleted", "errors")}
+    if total["errors"]:
+        raise RuntimeError(f"{total['errors']} opérations en échec — relancer 'apply' sur le même plan")
+    return total
+
+def _resume_state(mode: str, user: str, pronote_url: str, targets: List[Dict[str, str]],
+                  now: datetime) -> Tuple[Optional[RunCheckpoint], Optional[WriteJournal]]:
+    """Checkpoint + journal du compte (mode sync) ; repart de zéro si le contexte a changé ou a expiré."""
+    if mode != "sync" or not RESUME_RUNS: return None, None
+    ident = hashlib.sha1(f"{user}|{pronote_url}".encode()).hexdigest()[:10]
+    monday = (now - timedelta(days=now.weekday())).date().isoformat()
+    checkpoint = RunCheckpoint(os.path.join(STATE_DIR, f"checkpoint-{ident}.json"),
+                               {"week_of": monday, "from": FETCH_WEEKS_FROM, "weeks": WEEKS_TO_FETCH,
+                                "targets": sorted(t["calendar_id"] for t in targets)}, CHECKPOINT_MAX_AGE_H)
+    journal = WriteJournal(os.path.join(STATE_DIR, f"journal-{ident}.jsonl"))
+    if checkpoint.stale:
+        journal.clear()   # journal d'un autre contexte : ses écritures ne sont plus voulues
+    elif checkpoint.weeks or journal.pending:
+        log(f"[CHECKPOINT] reprise d'un run interrompu : {len(checkpoint.weeks)} semaines déjà lues, "
+            f"{len(journal.pending)} écritures non confirmées")
+    return checkpoint, journal
+
+def _change_probe(mode: str, user: str, pronote_url: str, targets: List[Dict[str, str]],
+                  ics_file: str) -> Optional[ChangeProbe]:
+    """Sonde du compte ; sans objet quand tout l'ensemble voulu est nécessaire (plan, PURGE / CLEAN)."""
+    if mode != "sync" or not CHANGE_PROBE or PURGE_BEFORE_RUN or CLEAN_PREFIX_BEFORE_RUN: return None
+    ident = hashlib.sha1(f"{user}|{pronote_url}".encode()).hexdigest()[:10]
+    # une cible ou un flux ajouté / modifié doit tout recevoir : relecture complète
+    return ChangeProbe(os.path.join(STATE_DIR, f"probe-{ident}.json"),
+                       {"targets": sorted(json.dumps(t, sort_keys=True) for t in targets), "ics": ics_file,
+                        "from": FETCH_WEEKS_FROM, "weeks": WEEKS_TO_FETCH}, FORCE_FULL_SCRAPE_HOURS)
+
+def run(mode: str = "sync", user: str = ENT_USER, password: str = ENT_PASS,
+        targets: Optional[List[Dict[str, str]]] = None, pronote_url: str = PRONOTE_URL,
+        cdp_endpoint: Optional[str] = None, plan_file: str = PLAN_FILE, ics_file: str = ICS_FILE) -> Dict[str, Any]:
+    """
+    mode 'sync' : scrape + écritures ; mode 'plan' : scrape + diff, écrit plan_file sans rien modifier.
+    Un seul scrape (un seul login PRONOTE) alimente toutes les cibles de CALENDAR_TARGETS en parallèle,
+    plus le flux ICS_FILE s'il est configuré (ICS_ONLY : le flux seul, sans API Google).
+    """
+    if not user or not password:
+        raise SystemExit("PRONOTE_USER / PRONOTE_PASS manquants.")
+    targets = [] if ICS_ONLY else (load_targets() if targets is None else targets)   # [] : compte ICS seul
+    if not targets and not ics_file:
+        raise SystemExit("ICS_ONLY sans ICS_FILE." if ICS_ONLY else "ni agenda Google ni ICS_FILE.")
+    if not targets and mode == "plan":
+        raise SystemExit("plan : sans objet sans agenda Google (aucune écriture Google).")
+    if targets: _gcal_credentials()
+    why = PACER.cooling_down()
+    if why:
+        log(f"[PACING] run ignoré : {why} (PACING_COOLDOWN_MIN) — on laisse le serveur PRONOTE tranquille")
+        return {"source": None, "skipped": why}
+
+    now = datetime.now()
+    checkpoint, journal = _resume_state(mode, user, pronote_url, targets, now)
+    probe = _change_probe(mode, user, pronote_url, targets, ics_file)
+    if probe:
+        log(f"[PROBE] {'relecture complète' if probe.forced else 'semaines inchangées ignorées'} "
+            f"(dernier run complet : {probe.full_at or 'jamais'}, FORCE_FULL_SCRAPE_HOURS={FORCE_FULL_SCRAPE_HOURS:g})")
+    # --- Source : API pronotepy d'abord, Chromium seulement en repli.
+    try:
+        source = open_first_available([_api_source(user, password, pronote_url),
+                                       PlaywrightLessonSource(user, password, pronote_url, cdp_endpoint)])
+    except (PacingStop, BudgetExceeded) as e:
+        log(f"[{'BUDGET' if isinstance(e, BudgetExceeded) else 'PACING'}] arrêt propre avant le scrape ({e})")
+        if journal: journal.close()
+        return {"source": None, "skipped": str(e)}
+    source.checkpoint = checkpoint; source.probe = probe
+    try:
+        with source:
+            if source.name == "playwright":
+                window = (now - timedelta(days=60), now + timedelta(days=180))
+            else:
+                window = _api_window(now)
+            sinks: List[EventSink] = [GoogleCalendarSink(t, i, mode, now, window, multi=len(targets) > 1, journal=journal)
+                                      for i, t in enumerate(targets)]
+            if ics_file and mode != "plan":
+                sinks.append(IcsFeedSink(ics_file, build_event_body, sweep=SWEEP_MISSING))
+            results = fan_out(source.weeks(*window), sinks)
+    finally:
+        if journal: journal.close()
+
+    failed = [s.name for s, r in zip(sinks, results) if "error" in r]
+    partial = source.paced_out or getattr(source, "skipped_weeks", None)
+    # empreintes : sans les semaines dont une écriture a échoué ; erreur hors semaine (rejeu, maintenance) -> rien
+    if probe and not failed and all(r.get("errors", 0) <= r.get("week_errors", 0) for r in results):
+        probe.commit(full=probe.forced and not partial,
+                     failed={k for r in results for k in r.get("failed_weeks", ())})
+    if journal: settle_resume(checkpoint, journal, results, partial)
+    if mode == "plan":
+        if failed: raise RuntimeError(f"plan non écrit, cibles en échec: {', '.join(failed)}")
+        summary = write_plan(plan_file, [(s.cal_id, r["ops"]) for s, r in zip(sinks, results)],
+                             source=source.name, lessons=max(r["lessons"] for r in results))
+        log(f"[PLAN] {plan_file}: agendas={len(sinks)}, creations={summary['insert']}, modifs={summary['patch']}, suppressions={summary['delete']}")
+        return {"source": source.name, "plan": plan_file, **summary}
+
+    for s, res in zip(sinks, results):
+        if "error" in res: continue
+        METRICS.set("lessons", res["keys"], target=s.name)
+        for k in ("created", "updated", "deleted", "errors"):
+            METRICS.inc("events", res[k], action=k, target=s.name)
+        log(f"{s.tag}Termine. source={source.name}, crees={res['created']}, maj={res['updated']}, supprimes={res['deleted']}, "
+            f"inchanges={res['unchanged']}, verif_trouves={res['found']}/{res['keys']}")
+    if failed:
+        raise RuntimeError(f"cibles en échec: {', '.join(failed)}")
+    return {"source": source.name, "targets": {s.name: r for s, r in zip(sinks, results)}}
+
+# ===================== Multi-comptes =====================
+def load_accounts(path: str = ACCOUNTS_FILE) -> List[Dict[str, Any]]:
+    """Comptes du fichier ACCOUNTS_FILE ; mots de passe en clair ou via une variable d'env (*_env)."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    accounts, names = [], set()
+    for i, a in enumerate(items):
+        name = re.sub(r"[^\w.-]+", "_", a.get("name") or f"compte{i + 1}")
+        if name in names: raise SystemExit(f"ACCOUNTS_FILE: nom de compte en double '{name}'.")
+        names.add(name)
+        user = a.get("user") or os.getenv(a.get("user_env", ""), "")
+        password = a.get("password") or os.getenv(a.get("password_env", ""), "")
+        if not user or not password: raise SystemExit(f"ACCOUNTS_FILE[{name}]: identifiants manquants.")
+        ics_only = ICS_ONLY or (a.get("ics_file") and not (a.get("calendar_targets") or a.get("calendar_id")))
+        accounts.append({"name": name, "user": user, "password": password,
+                         "pronote_url": a.get("pronote_url", PRONOTE_URL), "ics_file": a.get("ics_file", ""),
+                         "targets": [] if ics_only else parse_targets(a.get("calendar_targets") or [a])})
+    if not accounts: raise SystemExit("ACCOUNTS_FILE vide.")
+    return accounts
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class SharedBrowser:
+    """
+    Un seul Chromium pour tous les comptes, exposé en CDP sur localhost : chaque thread
+    s'y connecte avec sa propre instance Playwright (l'API sync n'est pas partageable
+    entre threads) et y ouvre un contexte isolé (cookies, stockage).
+    """
+    def __enter__(self) -> "SharedBrowser":
+        port = _free_port()
+        self._pw = sync_playwright().start()
+        self._browser = self._pw.chromium.launch(
+            headless=not HEADFUL, args=["--disable-dev-shm-usage", f"--remote-debugging-port={port}"])
+        self.endpoint = f"http://127.0.0.1:{port}"
+        log(f"[ACCOUNTS] Chromium partagé sur {self.endpoint}")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        try: self._browser.close()
+        except Exception: pass
+        try: self._pw.stop()
+        except Exception: pass
 
+def run_accounts(mode: str = "sync") -> None:
+    """Tous les comptes de ACCOUNTS_FILE avec un seul navigateur, ACCOUNTS_PARALLEL à la fois."""
+    accounts = load_accounts()
+    if any(acc["targets"] for acc in accounts):   # comptes ICS seuls / ICS_ONLY : ni token ni OAuth
+        _gcal_credentials()
+    if BROWSER_PROFILE_DIR:
+        log("[ACCOUNTS] BROWSER_PROFILE_DIR ignoré : un contexte isolé par compte dans le Chromium partagé")
+    stem, ext = os.path.splitext(PLAN_FILE)
+
+    def _one(acc: Dict[str, Any], endpoint: str) -> Dict[str, Any]:
+        LOG_CTX.tag = f"<{acc['name']}> "
+        LOG_CTX.screen_dir = os.path.join(SCREEN_DIR, acc["name"])
+        LOG_CTX.metric_labels = {"account": acc["name"]}
+        t0 = time.monotonic()
+        try:
+            out = run(mode, acc["user"], acc["password"], acc["targets"], acc["pronote_url"], endpoint,
+                      plan_file=f"{stem}-{acc['name']}{ext}", ics_file=acc["ics_file"])
+            out["status"] = "ok"
+        except (Exception, SystemExit) as e:   # un compte KO n'arrête pas les autres
+            log(f"[FATAL] {e}")
+            _safe_write(f"{_screen_dir()}/fatal_error.txt", f"{e}")
+            out = {"status": "error", "error": str(e)}
         finally:
-            try: browser.close()
-            except Exception: pass
-
-    _safe_write(f"{SCREEN_DIR}/gcal_created_events.json", json.dumps(created_events_dump, ensure_ascii=False, indent=2))
-
-    verified_count = 0
-    if overall_min_dt and overall_max_dt:
+            LOG_CTX.tag = ""; LOG_CTX.screen_dir = SCREEN_DIR; LOG_CTX.metric_labels = {}
+        out["duration_s"] = round(time.monotonic() - t0, 1)
+        return out
+
+    with SharedBrowser() as shared:
+        with ThreadPoolExecutor(max_workers=max(1, ACCOUNTS_PARALLEL), thread_name_prefix="account") as ex:
+            results = list(ex.map(lambda acc: _one(acc, shared.endpoint), accounts))
+
+    summary = {acc["name"]: res for acc, res in zip(accounts, results)}
+    _safe_write(f"{SCREEN_DIR}/accounts_summary.json", json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+    log("[ACCOUNTS] Résumé :")
+    for name, res in summary.items():
+        if res["status"] != "ok":
+            log(f"  - {name}: ERREUR {res['error']} ({res['duration_s']}s)"); continue
+        if "plan" in res:
+            log(f"  - {name}: plan {res['plan']} creations={res['insert']}, modifs={res['patch']}, suppressions={res['delete']} ({res['duration_s']}s)")
+            continue
+        tot = {k: sum(r.get(k, 0) for r in res["targets"].values()) for k in ("created", "updated", "deleted", "unchanged", "found", "keys")}
+        log(f"  - {name}: source={res['source']}, agendas={len(res['targets'])}, crees={tot['created']}, maj={tot['updated']}, "
+            f"supprimes={tot['deleted']}, inchanges={tot['unchanged']}, verif_trouves={tot['found']}/{tot['keys']} ({res['duration_s']}s)")
+    failed = [n for n, r in summary.items() if r["status"] != "ok"]
+    if failed:
+        raise RuntimeError(f"comptes en échec: {', '.join(failed)}")
+
+def apply_accounts(path: str = PLAN_FILE) -> None:
+    """apply multi-comptes : le plan de chaque compte ({stem}-{nom}{ext}, écrit par plan), un compte après l'autre."""
+    stem, ext = os.path.splitext(path)
+    summary: Dict[str, Dict[str, Any]] = {}
+    for acc in load_accounts():
+        if not acc["targets"]: continue   # compte ICS seul : pas de plan Google
+        LOG_CTX.tag = f"<{acc['name']}> "
+        LOG_CTX.screen_dir = os.path.join(SCREEN_DIR, acc["name"])
+        plan_file = f"{stem}-{acc['name']}{ext}"
         try:
-            ver = svc.events().list(
-                calendarId=CALENDAR_ID,
-                timeMin=to_rfc3339_local(overall_min_dt - timedelta(days=1)),
-                timeMax=to_rfc3339_local(overall_max_dt + timedelta(days=1)),
-                singleEvents=True, showDeleted=False,
-                maxResults=2500, privateExtendedProperty="source=pronote_playwright"
-            ).execute()
-            verified_count = len(ver.get("items", []))
-            _safe_write(f"{SCREEN_DIR}/gcal_search_after_run.json", json.dumps(ver, ensure_ascii=False, indent=2))
-        except Exception as e:
-            log(f"[GCAL VERIFY] {e}")
-
-    log(f"Termine. crees={created}, maj={updated}, verif_trouves={verified_count}")
+            summary[acc["name"]] = dict(apply_plan(plan_file), plan=plan_file, status="ok")
+        except (Exception, SystemExit) as e:   # un compte KO n'arrête pas les autres
+            log(f"[FATAL] {e}")
+            summary[acc["name"]] = {"plan": plan_file, "status": "error", "error": str(e)}
+        finally:
+            LOG_CTX.tag = ""; LOG_CTX.screen_dir = SCREEN_DIR
+    _safe_write(f"{SCREEN_DIR}/accounts_summary.json", json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+    log("[ACCOUNTS] Résumé apply :")
+    for name, res in summary.items():
+        if res["status"] != "ok": log(f"  - {name}: {res['plan']} ERREUR {res['error']}"); continue
+        log(f"  - {name}: {res['plan']} crees={res['created']}, maj={res['updated']}, supprimes={res['deleted']}")
+    failed = [n for n, r in summary.items() if r["status"] != "ok"]
+    if failed:
+        raise RuntimeError(f"comptes en échec: {', '.join(failed)}")
 
 if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if cmd == "clean-profile":
+        clean_profile(); sys.exit(0)
+    if cmd == "serve-ics":
+        serve_ics(sys.argv[2] if len(sys.argv) > 2 else (ICS_FILE or "pronote.ics"), ICS_HOST, ICS_PORT); sys.exit(0)
+    if cmd in ("plan", "apply") and len(sys.argv) > 2:
+        PLAN_FILE = sys.argv[2]
+    ok = False
     try:
         _safe_mkdir(SCREEN_DIR)
-        run()
+        with METRICS.phase("total", command=cmd):
+            if cmd == "apply" and ACCOUNTS_FILE: apply_accounts(PLAN_FILE)
+            elif cmd == "apply": apply_plan(PLAN_FILE)
+            elif ACCOUNTS_FILE: run_accounts("plan" if cmd == "plan" else "sync")
+            else: run("plan" if cmd == "plan" else "sync", plan_file=PLAN_FILE)
+        ok = True
     except Exception as ex:
         _safe_mkdir(SCREEN_DIR)
         _safe_write(f"{SCREEN_DIR}/fatal_error.txt", f"{ex}")
         log(f"[FATAL] {ex}")
-        sys.exit(1)
+    finally:
+        METRICS.set("run_success", int(ok))
+        try: PACER.save()   # délai appris + points de reprise pour le prochain run
+        except Exception as e: log(f"[PACING] {e}")
+        try: METRICS.write(METRICS_FILE)
+        except Exception as e: log(f"[METRICS] {e}")
+    sys.exit(0 if ok else 1)
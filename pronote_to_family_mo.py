@@ -8,6 +8,11 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
+from sync_engine import (LessonSource, SourceUnavailable, CalendarReconciler, Lesson, DesiredEvent, ScrapedWeek,
+                         canonical_status, PACER, PacingStop, log, iter_events, apply_ops_batched, STATE_DIR,
+                         RunCheckpoint, WriteJournal, ChangeProbe, compress_weekly, series_ops, settle_resume)
+from run_metrics import METRICS
+
 # ===== CONFIG =====
 PRONOTE_BASE = "https://0771342r.index-education.net/pronote"  # <- base commune
 PRONOTE_USER = os.getenv("PRONOTE_USER") or ""
@@ -16,12 +21,26 @@ PRONOTE_PASS = os.getenv("PRONOTE_PASS") or ""
 GOOGLE_CAL_ID = "family15066434840617961429@group.calendar.google.com"  # agenda Famille
 TITLE_PREFIX  = "[Mo] "
 COLOR_ID      = "6"   # 6=orange
+SOURCE_TAG    = "pronote_api"   # extendedProperties.private.source : évènements possédés par ce script
 LOOK_BACK_DAYS  = 14
 LOOK_AHEAD_DAYS = 540
 TZ = "Europe/Paris"
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+METRICS_FILE = os.getenv("METRICS_FILE", "pronote_api_metrics.prom")   # OpenMetrics, un fichier par run
+GCAL_STANDIN_URL = os.getenv("GCAL_STANDIN_URL", "")   # doublure locale (gcal_standin.py) au lieu de Google
+RESUME_RUNS          = os.getenv("RESUME_RUNS", "1") == "1"   # reprise d'un run interrompu (semaines lues + journal)
+CHECKPOINT_MAX_AGE_H = float(os.getenv("CHECKPOINT_MAX_AGE_H", "12"))
+CHANGE_PROBE            = os.getenv("CHANGE_PROBE", "1") == "1"   # cours identiques au dernier run : pas de passe Calendar
+FORCE_FULL_SCRAPE_HOURS = float(os.getenv("FORCE_FULL_SCRAPE_HOURS", "24"))
+# Cours réguliers en séries hebdomadaires (RRULE + EXDATE, exceptions de salle) au lieu d'un évènement par cours
+RECURRING_EVENTS        = os.getenv("RECURRING_EVENTS", "0") == "1"
+RECURRING_MIN_WEEKS     = int(os.getenv("RECURRING_MIN_WEEKS", "3"))       # occurrences minimum d'une série
+RECURRING_MAX_GAP_WEEKS = int(os.getenv("RECURRING_MAX_GAP_WEEKS", "3"))   # semaines sans cours (vacances) gardées en EXDATE
 
 def gcal_service():
+    if GCAL_STANDIN_URL:
+        from gcal_standin import standin_service
+        return standin_service(GCAL_STANDIN_URL)
     creds = None
     if os.path.exists("token.json"):
         creds = Credentials.from_authorized_user_file("token.json", SCOPES)
@@ -50,96 +69,234 @@ def list_existing_prefixed(svc, start_iso, end_iso):
         if not page: break
     return items
 
-def get_pronote_client():
+def list_owned(svc, start_iso, end_iso, expand: bool = True):
+    """
+    Évènements de ce script seulement : filtre côté serveur sur la propriété privée source.
+    expand=False : séries non développées (maîtres + exceptions), comme les écrit RECURRING_EVENTS.
+    """
+    return list(iter_events(svc, GOOGLE_CAL_ID, timeMin=start_iso, timeMax=end_iso, singleEvents=expand,
+                            showDeleted=False, privateExtendedProperty=f"source={SOURCE_TAG}"))
+
+def migrate_prefixed(svc, start_iso, end_iso):
+    """
+    Une seule fois par agenda (repère dans STATE_DIR) : les évènements préfixés créés avant le
+    marquage reçoivent source=SOURCE_TAG. Ceux d'une autre synchro (source déjà posée) sont laissés.
+    """
+    marker = os.path.join(STATE_DIR, f"pronote_api_tagged_{hashlib.sha1(GOOGLE_CAL_ID.encode()).hexdigest()[:10]}")
+    if os.path.exists(marker): return
+    legacy = [e for e in list_existing_prefixed(svc, start_iso, end_iso)
+              if "source" not in e.get("extendedProperties", {}).get("private", {})]
+    ops = [{"op": "patch", "event_id": e["id"], "body": {"extendedProperties": {"private": {"source": SOURCE_TAG}}}}
+           for e in legacy]
+    res = apply_ops_batched(svc, GOOGLE_CAL_ID, ops) if ops else {"updated": 0, "errors": 0}
+    print(f"Migration: {res['updated']}/{len(ops)} évènements '{TITLE_PREFIX}' marqués source={SOURCE_TAG}")
+    if res["errors"]: return   # on retentera au prochain run
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(marker, "w", encoding="utf-8") as f: f.write(dt.datetime.now().isoformat())
+
+def get_pronote_client(base: str = PRONOTE_BASE, user: str = PRONOTE_USER, password: str = PRONOTE_PASS):
     """Essaie parent puis élève. Retourne None si IP/compte suspendu ou login KO."""
     for path in ("/parent.html", "/eleve.html"):
-        url = f"{PRONOTE_BASE}{path}"
+        url = f"{base}{path}"
         try:
-            c = Client(url, username=PRONOTE_USER, password=PRONOTE_PASS, ent=ent77)
+            c = PACER.call("login", Client, url, username=user, password=password, ent=ent77)
             if c.logged_in:
                 print(f"Login OK sur {path}")
                 return c
         except PronoteAPIError as e:
             if "suspended" in str(e).lower():
                 print("PRONOTE: adresse IP / compte suspendu — on réessaiera au prochain run.")
+                PACER.alert("IP/compte suspendu")
                 return None
             raise
     print("Login PRONOTE impossible (parent/eleve). Vérifie identifiants ENT.")
     return None
 
+def _text(v) -> str:
+    """pronotepy renvoie selon les versions une chaîne ou un objet (Subject...)."""
+    if v is None: return ""
+    return str(getattr(v, "name", v) or "").strip()
+
+class PronotepyLessonSource(LessonSource):
+    """Source rapide : API PRONOTE via pronotepy (pas de navigateur)."""
+    name = "pronotepy"
+
+    def __init__(self, base: str = PRONOTE_BASE, user: str = PRONOTE_USER, password: str = PRONOTE_PASS):
+        self.base, self.user, self.password = base.rstrip("/"), user, password
+        self.client = None
+        self.paced_out = ""   # arrêt du rythme adaptatif : semaines restantes non lues
+
+    def connect(self) -> None:
+        try:
+            self.client = get_pronote_client(self.base, self.user, self.password)
+        except PacingStop:
+            raise
+        except Exception as e:
+            raise SourceUnavailable(f"login pronotepy: {e}")
+        if not self.client:
+            raise SourceUnavailable("login KO ou IP/compte suspendu")
+
+    def weeks(self, start, end):
+        tz = gettz(TZ)
+        d = start.date()
+        while d <= end.date():
+            cached = self.checkpoint.week(self.name, d.isoformat()) if self.checkpoint else None
+            if cached:
+                log(f"[CHECKPOINT] semaine du {d.isoformat()}: {len(cached.lessons)} cours repris du run interrompu")
+                yield cached
+                d += dt.timedelta(days=7)
+                continue
+            week = []
+            try:
+                with METRICS.phase("api_lessons"):
+                    raw = PACER.call("api", self.client.lessons, date_from=d, date_to=d + dt.timedelta(days=6))
+            except PacingStop as e:
+                self.paced_out = str(e)
+                log(f"[PACING] arrêt propre avant la semaine du {d.isoformat()} ({e}) — reprise au prochain run")
+                PACER.note_checkpoint(source=self.name, resume_week=d.isoformat())
+                return
+            for l in raw:
+                s = l.start.astimezone(tz).replace(tzinfo=None) if l.start.tzinfo else l.start
+                e = l.end.astimezone(tz).replace(tzinfo=None) if l.end.tzinfo else l.end
+                canceled = bool(getattr(l, "canceled", False))
+                status = canonical_status(_text(getattr(l, "status", None))) or ("Cours annulé" if canceled else "")
+                week.append(Lesson(
+                    _text(l.subject), _text(getattr(l, "classroom", None)), s, e,
+                    status=status, canceled=canceled,
+                    teacher=_text(getattr(l, "teacher_name", None) or getattr(l, "teacher", None)),
+                    group=_text(getattr(l, "group_name", None)),
+                    content=_text(getattr(getattr(l, "content", None), "title", None) or getattr(l, "content", None)),
+                ))
+            monday = dt.datetime.combine(d, dt.time())
+            METRICS.set("week_tiles", len(week), week=d.isoformat())
+            scraped = ScrapedWeek(d.isoformat(), monday, monday + dt.timedelta(days=7), week, complete=True)
+            if self.checkpoint: self.checkpoint.add_week(self.name, d.isoformat(), scraped)
+            fp = ChangeProbe.fingerprint([[l.summary, l.room, l.start_dt, l.end_dt, l.status, l.canceled] for l in week]) if self.probe else ""
+            if fp and self.probe.unchanged(d.isoformat(), fp):
+                METRICS.inc("probe_skips")
+                log(f"[PROBE] semaine du {d.isoformat()}: cours inchangés depuis le dernier run")
+            else:
+                if fp: self.probe.note(d.isoformat(), fp)
+                yield scraped
+            d += dt.timedelta(days=7)
+
 def main():
     tz = gettz(TZ)
     now = dt.datetime.now(tz)
     start_win = now - dt.timedelta(days=LOOK_BACK_DAYS)
     end_win   = now + dt.timedelta(days=LOOK_AHEAD_DAYS)
 
-    client = get_pronote_client()
-    if not client:
-        return  # pas d'échec dur du job
+    why = PACER.cooling_down()
+    if why:
+        print(f"PRONOTE: run ignoré, {why} — on laisse le serveur tranquille.")
+        return False
+    source = PronotepyLessonSource()
+    try:
+        with METRICS.phase("login"): source.connect()
+    except (SourceUnavailable, PacingStop):
+        PACER.save()
+        return False  # pas d'échec dur du job (mais run_success=0 dans les métriques)
 
     svc = gcal_service()
-
-    lessons, d = [], start_win.date()
-    while d <= end_win.date():
-        lessons += client.lessons(date_from=d, date_to=d + dt.timedelta(days=6))
-        d += dt.timedelta(days=7)
+    checkpoint = journal = None
+    ident = hashlib.sha1(f"{source.user}|{source.base}".encode()).hexdigest()[:10]
+    if RESUME_RUNS:
+        checkpoint = RunCheckpoint(os.path.join(STATE_DIR, f"checkpoint-{SOURCE_TAG}-{ident}.json"),
+                                   {"cal": GOOGLE_CAL_ID, "from": start_win.date().isoformat(),
+                                    "to": end_win.date().isoformat()}, CHECKPOINT_MAX_AGE_H)
+        journal = WriteJournal(os.path.join(STATE_DIR, f"journal-{SOURCE_TAG}-{ident}.jsonl"))
+        if checkpoint.stale:
+            journal.clear()
+        source.checkpoint = checkpoint
 
     desired = {}
-    for l in lessons:
-        if getattr(l, "canceled", False):
+    for l in source.lessons(start_win.replace(tzinfo=None), end_win.replace(tzinfo=None)):
+        if l.canceled:
             continue
-        start = l.start.astimezone(tz)
-        end   = l.end.astimezone(tz)
-        title = TITLE_PREFIX + (l.subject or "Cours")
+        start = l.start_dt.replace(tzinfo=tz)
+        end   = l.end_dt.replace(tzinfo=tz)
         parts = []
         if l.teacher: parts.append(f"Prof: {l.teacher}")
-        if getattr(l, "group_name", None): parts.append(f"Groupe: {l.group_name}")
-        if getattr(l, "content", None):    parts.append(f"Contenu: {l.content}")
-        desc = "\n".join(parts) if parts else ""
-        loc  = l.classroom or ""
-        key  = f"{start.isoformat()}|{(l.subject or '').strip()}|{loc}|{(l.teacher or '').strip()}"
+        if l.group:   parts.append(f"Groupe: {l.group}")
+        if l.content: parts.append(f"Contenu: {l.content}")
+        key   = f"{start.isoformat()}|{l.summary}|{l.room}|{l.teacher}"
         ev_id = stable_id(key)
-        desired[ev_id] = {
-            "id": ev_id,
-            "summary": title,
-            "location": loc,
-            "description": desc,
-            "colorId": COLOR_ID,
-            "start": {"dateTime": start.isoformat(), "timeZone": TZ},
-            "end":   {"dateTime": end.isoformat(),   "timeZone": TZ},
-        }
-
-    existing = {
-        e["id"]: e
-        for e in list_existing_prefixed(svc, start_win.isoformat(), end_win.isoformat())
-        if "id" in e
-    }
-
-    created = updated = deleted = 0
-    for ev_id, body in desired.items():
-        if ev_id in existing:
-            cur = existing[ev_id]
-            changed = (
-                cur.get("summary","") != body["summary"] or
-                cur.get("location","") != body["location"] or
-                cur.get("description","") != body["description"] or
-                cur.get("colorId","") != body["colorId"] or
-                cur.get("start",{}).get("dateTime") != body["start"]["dateTime"] or
-                cur.get("end",{}).get("dateTime")   != body["end"]["dateTime"]
-            )
-            if changed:
-                svc.events().update(calendarId=GOOGLE_CAL_ID, eventId=ev_id, body=body).execute()
-                updated += 1
-        else:
-            svc.events().insert(calendarId=GOOGLE_CAL_ID, body=body).execute()
-            created += 1
+        desired[ev_id] = DesiredEvent(
+            ev_id, TITLE_PREFIX + (l.summary or "Cours"), l.room,
+            start.isoformat(), end.isoformat(), TZ,
+            color_id=COLOR_ID, event_id=ev_id, description="\n".join(parts), private={"source": SOURCE_TAG},
+        )
+
+    total = len(desired)
+    METRICS.set("lessons", total)
+    PACER.save()
+
+    probe = None
+    if CHANGE_PROBE and not source.paced_out:
+        # les cours viennent déjà de l'API : la sonde évite le listing et le diff Calendar
+        probe = ChangeProbe(os.path.join(STATE_DIR, f"probe-{SOURCE_TAG}-{ident}.json"),
+                            {"cal": GOOGLE_CAL_ID, "prefix": TITLE_PREFIX, "color": COLOR_ID, "series": RECURRING_EVENTS},
+                            FORCE_FULL_SCRAPE_HOURS)
+        digest = ChangeProbe.fingerprint(sorted((k, d.body()) for k, d in desired.items()))
+        if probe.unchanged("desired", digest) and not (journal and journal.unacked(GOOGLE_CAL_ID)):
+            METRICS.inc("probe_skips")
+            print(f"Aucun changement depuis le dernier run ({probe.full_at}) : pas de passe Calendar.")
+            if journal: checkpoint.clear(); journal.clear()
+            return
+
+    with METRICS.phase("calendar_migration"):
+        migrate_prefixed(svc, start_win.isoformat(), end_win.isoformat())
+    todo = journal.unacked(GOOGLE_CAL_ID) if journal else []
+    replay = {"errors": 0}
+    if todo:
+        print(f"Journal: {len(todo)} écritures non confirmées du run précédent -> rejeu.")
+        with METRICS.phase("calendar_writes"):
+            replay = apply_ops_batched(svc, GOOGLE_CAL_ID, todo, journal=journal)
+    with METRICS.phase("calendar_list"):
+        listed = list_owned(svc, start_win.isoformat(), end_win.isoformat(), expand=not RECURRING_EVENTS)
+    # séries (maîtres, exceptions, instances) à part : jamais dans le diff des cours isolés
+    existing = {e["id"]: e for e in listed if "id" in e and not e.get("recurrence") and not e.get("recurringEventId")}
+    in_series = [e for e in listed if e.get("recurrence") or e.get("recurringEventId")]
 
-    for ev_id in list(existing.keys()):
-        if ev_id not in desired:
-            svc.events().delete(calendarId=GOOGLE_CAL_ID, eventId=ev_id).execute()
-            deleted += 1
+    series_res = {"created": 0, "updated": 0, "deleted": 0, "errors": 0}
+    if RECURRING_EVENTS:
+        series, desired = compress_weekly(desired, RECURRING_MIN_WEEKS, RECURRING_MAX_GAP_WEEKS)
+        print(f"Séries: {len(series)} séries hebdomadaires pour {sum(len(s.occurrences) for s in series)} cours, "
+              f"{len(desired)} cours isolés.")
+        day0 = start_win.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        masters, instances = series_ops(series, in_series, day0, RECURRING_MAX_GAP_WEEKS, sweep=not source.paced_out)
+        with METRICS.phase("calendar_writes"):
+            for ops in (masters, instances):   # une instance n'existe qu'une fois son maître écrit
+                if not ops: continue
+                for k, v in apply_ops_batched(svc, GOOGLE_CAL_ID, ops, journal=journal).items(): series_res[k] += v
+    elif in_series and not source.paced_out:
+        # RECURRING_EVENTS désactivé : les séries écrites avant sont remplacées par des cours isolés
+        ids = sorted({e.get("recurringEventId") or e["id"] for e in in_series})
+        print(f"Séries: {len(ids)} séries d'un run précédent supprimées (RECURRING_EVENTS=0).")
+        with METRICS.phase("calendar_writes"):
+            series_res = apply_ops_batched(svc, GOOGLE_CAL_ID, [{"op": "delete", "key": None, "event_id": i} for i in ids],
+                                           journal=journal)
 
-    print(f"Terminé. créés={created}, maj={updated}, supprimés={deleted}, total_source={len(desired)}")
+    rec = CalendarReconciler(svc, GOOGLE_CAL_ID, lookup=lambda k, _b: existing.get(k),
+                             owned=existing, delete_missing=not source.paced_out,   # lecture partielle : pas de suppression
+                             journal=journal)
+    with METRICS.phase("calendar_writes"):
+        res = rec.sync(desired)
+    for k in ("created", "updated", "deleted", "errors"): res[k] += series_res[k]
+    res["errors"] += replay["errors"]   # écriture rejouée encore en échec : le journal la garde
+    if journal and not settle_resume(checkpoint, journal, [res], source.paced_out):
+        journal.close()
+    if probe and res["errors"] == 0:
+        probe.note("desired", digest)   # seulement après une passe Calendar sans erreur
+        probe.commit(full=True)
+    for k in ("created", "updated", "deleted", "errors"):
+        METRICS.inc("events", res[k], action=k)
+    print(f"Terminé. créés={res['created']}, maj={res['updated']}, supprimés={res['deleted']}, total_source={total}")
 
 if __name__ == "__main__":
-    main()
+    ok = False
+    try:
+        with METRICS.phase("total"): ok = main() is not False
+    finally:
+        METRICS.set("run_success", int(ok))
+        METRICS.write(METRICS_FILE)
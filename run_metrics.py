@@ -0,0 +1,103 @@
+# run_metrics.py
+# SPDX-License-Identifier: MIT
+"""
+Statistiques d'un run exportées en texte OpenMetrics (format Prometheus), un fichier par run :
+durées des phases, cours par semaine, échecs de parsing, relectures de panneau, appels
+Calendar par méthode et statut, retries et attente de backoff, octets transférés.
+Le fichier peut être lu par node_exporter (collecteur textfile) ou archivé avec les artefacts.
+"""
+from __future__ import annotations
+
+import os, threading, time
+from contextlib import contextmanager
+from typing import Dict, Tuple, Iterator
+
+PREFIX = "pronote_sync_"
+
+# nom -> (type, aide) ; les compteurs sont exposés avec le suffixe _total
+FAMILIES: Dict[str, Tuple[str, str]] = {
+    "run_timestamp_seconds":  ("gauge",   "Début du run (epoch)."),
+    "run_success":            ("gauge",   "1 si le run s'est terminé sans erreur."),
+    "phase_duration_seconds": ("gauge",   "Durée cumulée de chaque phase du run."),
+    "week_tiles":             ("gauge",   "Cours extraits par semaine."),
+    "lessons":                ("gauge",   "Cours produits par la source."),
+    "parse_failures":         ("counter", "Panneaux ou cases de l'emploi du temps non interprétables."),
+    "panel_retries":          ("counter", "Relectures du panneau de détail d'un cours."),
+    "tiles_static":           ("counter", "Cases lues dans la grille sans ouvrir de panneau."),
+    "tile_clicks":            ("counter", "Cases ouvertes par clic en lecture statique, par raison."),
+    "pronote_requests":       ("counter", "Requêtes PRONOTE rythmées (clics, navigations, appels API)."),
+    "pacing_wait_seconds":    ("counter", "Attente imposée par le rythme adaptatif PRONOTE."),
+    "pacing_delay_seconds":   ("gauge",   "Délai entre requêtes PRONOTE en fin de run."),
+    "pacing_stops":           ("counter", "Arrêts propres du run (budget, erreurs, alerte de suspension)."),
+    "budget_skips":           ("counter", "Semaines ou phases abandonnées faute de temps (RUN_DEADLINE_S)."),
+    "probe_skips":            ("counter", "Semaines non extraites : empreinte inchangée depuis le dernier run."),
+    "gcal_requests":          ("counter", "Appels Google Calendar par méthode et statut HTTP."),
+    "gcal_retries":           ("counter", "Appels Calendar rejoués après limitation (403/429)."),
+    "gcal_backoff_seconds":   ("counter", "Attente de backoff après limitation Calendar."),
+    "gcal_throttle_seconds":  ("counter", "Attente imposée par le limiteur de débit local."),
+    "events":                 ("counter", "Écritures Calendar par action."),
+    "transfer_bytes":         ("counter", "Octets reçus par le navigateur, réseau ou cache."),
+}
+
+# Contexte par thread : tag de log, dossier d'artefacts, étiquettes ajoutées aux métriques (compte...)
+THREAD_CTX = threading.local()
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(round(v, 6))
+
+class RunMetrics:
+    """Compteurs et jauges étiquetés d'un run ; thread-safe (sinks, comptes en parallèle)."""
+    def __init__(self):
+        self._values: Dict[_Key, float] = {}
+        self._lock = threading.Lock()
+        self.set("run_timestamp_seconds", time.time())
+
+    def _key(self, name: str, labels: Dict[str, object]) -> _Key:
+        if name not in FAMILIES: raise KeyError(f"métrique inconnue: {name}")
+        merged = dict(getattr(THREAD_CTX, "metric_labels", {}), **labels)
+        return name, tuple(sorted((k, str(v)) for k, v in merged.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: object) -> None:
+        key = self._key(name, labels)
+        with self._lock: self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: object) -> None:
+        key = self._key(name, labels)
+        with self._lock: self._values[key] = float(value)
+
+    @contextmanager
+    def phase(self, name: str, **labels: object) -> Iterator[None]:
+        """Durée d'un bloc, cumulée dans phase_duration_seconds{phase=name}."""
+        t0 = time.monotonic()
+        try: yield
+        finally: self.inc("phase_duration_seconds", time.monotonic() - t0, phase=name, **labels)
+
+    def render(self) -> str:
+        with self._lock: values = dict(self._values)
+        out = []
+        for name, (kind, help_) in FAMILIES.items():
+            samples = sorted((labels, v) for (n, labels), v in values.items() if n == name)
+            if not samples: continue
+            out.append(f"# TYPE {PREFIX}{name} {kind}")
+            out.append(f"# HELP {PREFIX}{name} {help_}")
+            suffix = "_total" if kind == "counter" else ""
+            for labels, v in samples:
+                lbl = ",".join(f'{k}="{_escape(val)}"' for k, val in labels)
+                out.append(f"{PREFIX}{name}{suffix}{{{lbl}}} {_fmt(v)}" if lbl else f"{PREFIX}{name}{suffix} {_fmt(v)}")
+        out.append("# EOF")
+        return "\n".join(out) + "\n"
+
+    def write(self, path: str) -> None:
+        """Écriture atomique : un collecteur ne lit jamais un fichier à moitié écrit."""
+        if not path: return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(self.render())
+        os.replace(tmp, path)
+
+METRICS = RunMetrics()
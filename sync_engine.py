@@ -0,0 +1,1154 @@
+# sync_engine.py
+# SPDX-License-Identifier: MIT
+"""
+Moteur de synchro commun aux deux scripts :
+- sources de cours interchangeables (API pronotepy, scraping Playwright) derrière
+  une interface LessonSource, avec repli de l'une sur l'autre ;
+- un seul réconciliateur Google Calendar (diff désiré / existant puis écritures) ;
+- un scrape, plusieurs destinations (sinks) alimentées en parallèle.
+"""
+from __future__ import annotations
+
+import hashlib, json, os, queue, random, re, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Callable, Tuple
+
+from googleapiclient.errors import HttpError
+
+from run_metrics import METRICS, THREAD_CTX
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:   # Python < 3.9 : règle UE codée en dur (paris_offset_min)
+    ZoneInfo = None
+
+# Contexte par thread (tag de log du compte en cours, dossier d'artefacts, étiquettes de métriques)
+LOG_CTX = THREAD_CTX
+
+def log(msg: str) -> None:
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    msg = getattr(LOG_CTX, "tag", "") + msg
+    try: print(f"[{ts}] {msg}")
+    except UnicodeEncodeError: print(f"[{ts}] {msg}".encode("ascii","replace").decode("ascii"))
+
+# ===================== Heure de Paris =====================
+# Une seule couche de temps : les cours sont en heure murale naïve de Paris ; clés d'index et
+# tolérances comparent des minutes UTC entières depuis l'epoch (indépendantes de l'offset écrit).
+PARIS_TZ = "Europe/Paris"
+_EPOCH = datetime(1970, 1, 1)
+
+def _paris_zone():
+    if ZoneInfo is None: return None
+    try: return ZoneInfo(PARIS_TZ)
+    except Exception: return None   # Windows sans paquet tzdata
+
+PARIS = _paris_zone()
+
+def _eu_switch(year: int, month: int) -> datetime:
+    """Dernier dimanche du mois à 01:00 UTC (changement d'heure UE)."""
+    d = datetime(year, month + 1, 1) - timedelta(days=1)
+    return d - timedelta(days=(d.weekday() + 1) % 7, hours=-1)
+
+@lru_cache(maxsize=8192)
+def paris_offset_min(wall: datetime) -> int:
+    """Offset UTC (minutes) d'une heure murale de Paris ; heure ambiguë -> 1re occurrence (été),
+    heure inexistante (saut de mars) -> offset d'avant le saut (hiver), comme zoneinfo fold=0."""
+    if PARIS is not None:
+        return int(wall.replace(tzinfo=PARIS).utcoffset().total_seconds() // 60)
+    start = _eu_switch(wall.year, 3) + timedelta(hours=2)   # 03:00 murales
+    end   = _eu_switch(wall.year, 10) + timedelta(hours=2)  # 03:00 murales (heure d'été)
+    return 120 if start <= wall < end else 60
+
+def _utc_to_paris(dt: datetime) -> datetime:
+    """datetime aware -> heure murale naïve de Paris."""
+    if PARIS is not None: return dt.astimezone(PARIS).replace(tzinfo=None)
+    u = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    summer = _eu_switch(u.year, 3) <= u < _eu_switch(u.year, 10)
+    return u + timedelta(hours=2 if summer else 1)
+
+def paris_wall(v: Any) -> datetime:
+    """datetime ou RFC3339 -> heure murale naïve de Paris (naïf : déjà en heure de Paris)."""
+    dt = datetime.fromisoformat(v.replace("Z", "+00:00")) if isinstance(v, str) else v
+    return dt if dt.tzinfo is None else _utc_to_paris(dt)
+
+def epoch_min(v: Any) -> int:
+    """datetime ou RFC3339 -> minutes UTC entières depuis l'epoch (naïf : heure de Paris)."""
+    dt = datetime.fromisoformat(v.replace("Z", "+00:00")) if isinstance(v, str) else v
+    if dt.tzinfo is not None:
+        return int((dt.astimezone(timezone.utc).replace(tzinfo=None) - _EPOCH).total_seconds() // 60)
+    return int((dt - _EPOCH).total_seconds() // 60) - paris_offset_min(dt.replace(second=0, microsecond=0))
+
+def to_rfc3339_local(dt: datetime) -> str:
+    """Heure murale de Paris -> RFC3339 avec l'offset réel de cet instant."""
+    off = paris_offset_min(dt.replace(second=0, microsecond=0))
+    return dt.strftime("%Y-%m-%dT%H:%M:%S") + f"+{off // 60:02d}:{off % 60:02d}"
+
+# ===================== Modèle de données =====================
+STATUS_CANON = {
+    "prof. absent": "Prof. absent",
+    "prof absent": "Prof. absent",
+    "absence professeur": "Prof. absent",
+    "absence du professeur": "Prof. absent",
+    "cours annulé": "Cours annulé",
+    "cours annule": "Cours annulé",
+    "annulation": "Cours annulé",
+    "changement de salle": "Changement de salle",
+    "cours modifié": "Cours modifié",
+    "cours modifie": "Cours modifié",
+}
+
+def canonical_status(*texts: str) -> str:
+    """Statut canonique ('Prof. absent', 'Cours annulé'...) trouvé dans les textes, sinon ''."""
+    low = " ".join(t for t in texts if t).lower()
+    for k, canon in STATUS_CANON.items():
+        if k in low:
+            return canon
+    return ""
+
+class Lesson:
+    """
+    Cours normalisé, commun à toutes les stratégies d'extraction et aux deux scripts.
+    Heures naïves (heure de Paris) ; status = statut canonique calculé une fois à l'extraction.
+    """
+    __slots__ = ("summary", "room", "start_dt", "end_dt", "status", "canceled", "teacher", "group", "content")
+
+    def __init__(self, summary: str, room: str, start_dt: datetime, end_dt: datetime, status: str = "",
+                 canceled: bool = False, teacher: str = "", group: str = "", content: str = ""):
+        self.summary = summary; self.room = room
+        self.start_dt = start_dt; self.end_dt = end_dt
+        self.status = status; self.canceled = canceled
+        self.teacher = teacher; self.group = group; self.content = content
+
+    def __repr__(self) -> str:
+        return f"Lesson({self.summary!r}, {self.room!r}, {self.start_dt:%Y-%m-%d %H:%M}-{self.end_dt:%H:%M}, {self.status!r})"
+
+class DesiredEvent:
+    """
+    Évènement Calendar voulu. Le body (dict) n'est construit qu'au moment d'écrire ;
+    la comparaison avec l'existant se fait sur les champs.
+    """
+    __slots__ = ("key", "event_id", "summary", "location", "description", "color_id", "start", "end", "time_zone", "private")
+
+    def __init__(self, key: str, summary: str, location: str, start: str, end: str, time_zone: str,
+                 color_id: str = "", event_id: str = "", description: Optional[str] = None,
+                 private: Optional[Dict[str, str]] = None):
+        self.key = key; self.event_id = event_id
+        self.summary = summary; self.location = location; self.description = description
+        self.color_id = color_id; self.start = start; self.end = end; self.time_zone = time_zone
+        self.private = private
+
+    def body(self) -> Dict[str, Any]:
+        b: Dict[str, Any] = {
+            "summary": self.summary,
+            "location": self.location,
+            "start": {"dateTime": self.start, "timeZone": self.time_zone},
+            "end":   {"dateTime": self.end,   "timeZone": self.time_zone},
+        }
+        if self.event_id: b["id"] = self.event_id
+        if self.color_id: b["colorId"] = self.color_id
+        if self.description is not None: b["description"] = self.description
+        if self.private: b["extendedProperties"] = {"private": dict(self.private)}
+        return b
+
+    def differs(self, cur: Dict[str, Any]) -> bool:
+        if (cur.get("summary") or "") != self.summary or (cur.get("location") or "") != self.location:
+            return True
+        if self.color_id and (cur.get("colorId") or "") != self.color_id:
+            return True
+        if self.description is not None and (cur.get("description") or "") != self.description:
+            return True
+        if not (_same_time(cur.get("start", {}).get("dateTime"), self.start) and
+                _same_time(cur.get("end", {}).get("dateTime"), self.end)):
+            return True
+        if self.private:
+            have = cur.get("extendedProperties", {}).get("private", {})
+            return any(have.get(k) != v for k, v in self.private.items())
+        return False
+
+class ScrapedWeek:
+    """
+    Une semaine produite par une source. complete=True seulement si la semaine a été
+    lue entièrement (pas de case ignorée) : condition pour balayer les cours disparus.
+    """
+    __slots__ = ("label", "start", "end", "lessons", "complete")
+
+    def __init__(self, label: str, start: Optional[datetime], end: Optional[datetime],
+                 lessons: List[Lesson], complete: bool):
+        self.label = label; self.start = start; self.end = end
+        self.lessons = lessons; self.complete = complete
+
+# ===================== Sources de cours =====================
+class SourceUnavailable(RuntimeError):
+    """Login KO, IP/compte suspendu, dépendance absente : on passe à la source suivante."""
+
+class LessonSource:
+    """
+    Interface d'une source de cours (Lesson). Les semaines sont produites à la demande
+    (générateur) : une seule semaine de cours en mémoire à la fois.
+    """
+    name = "base"
+    checkpoint: Optional["RunCheckpoint"] = None   # semaines déjà lues par un run interrompu
+    paced_out = ""                                 # arrêt du rythme adaptatif : semaines restantes non lues
+    probe: Optional["ChangeProbe"] = None          # semaines inchangées depuis le dernier run : non extraites
+
+    def connect(self) -> None:
+        """Ouvre la session (login). Lève SourceUnavailable si la source est inutilisable."""
+
+    def weeks(self, start: datetime, end: datetime) -> Iterator[ScrapedWeek]:
+        """Les cours de la fenêtre, semaine par semaine."""
+        raise NotImplementedError
+
+    def lessons(self, start: datetime, end: datetime) -> Iterator[Lesson]:
+        for week in self.weeks(start, end):
+            yield from week.lessons
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+def open_first_available(sources: Iterable[Optional[LessonSource]]) -> LessonSource:
+    """Connecte la première source disponible, dans l'ordre donné (API avant scraping)."""
+    last: Optional[Exception] = None
+    for src in sources:
+        if src is None: continue
+        if last is not None and PACER.alerted:
+            # suspension signalée par la source précédente : le repli viserait le même serveur / compte
+            log(f"[SOURCE] {src.name} non tentée : PRONOTE a signalé '{PACER.alerted}' — arrêt propre, reprise au prochain run")
+            raise PacingStop(f"alert: {PACER.alerted}")
+        try:
+            src.connect()
+            log(f"[SOURCE] {src.name} connectée")
+            return src
+        except SourceUnavailable as e:
+            log(f"[SOURCE] {src.name} indisponible: {e}")
+            last = e
+            src.close()
+        except Exception:
+            src.close()
+            raise
+    raise SourceUnavailable(f"aucune source disponible ({last})")
+
+# ===================== Rythme des requêtes PRONOTE =====================
+STATE_DIR = os.getenv("STATE_DIR", ".state")
+
+class PacingStop(RuntimeError):
+    """Budget de requêtes épuisé ou signaux d'alerte : arrêt propre avant une suspension."""
+
+_ALERT_RE = ("suspendu", "suspended", "trop de requ", "trop de connexions", "réessayer ultérieurement",
+             "reessayer ulterieurement")
+
+def is_pronote_alert(text: str) -> bool:
+    low = (text or "").lower()
+    return any(k in low for k in _ALERT_RE)
+
+class PronotePacer:
+    """
+    Rythme commun des requêtes PRONOTE (clics, navigations, appels pronotepy), en AIMD :
+    réponse normale -> délai - step (on accélère doucement) ; réponse lente (> slow_factor x
+    la latence de référence de ce type de requête) ou erreur -> délai x 2. Le budget par run,
+    les erreurs consécutives et les messages de suspension arrêtent le run proprement
+    (PacingStop, levée seulement par wait()). Délai et latences appris persistés entre runs.
+    """
+    def __init__(self, path: str, budget: int, min_ms: int, max_ms: int, step_ms: int,
+                 slow_factor: float, max_errors: int, cooldown_min: int):
+        self.path = path; self.budget = budget
+        self.min = min_ms / 1000; self.max = max_ms / 1000; self.step = step_ms / 1000
+        self.slow_factor = slow_factor; self.max_errors = max_errors; self.cooldown = cooldown_min * 60
+        self.delay = self.min
+        self.baseline: Dict[str, float] = {}
+        self.used = self.errors = 0
+        self.alerted = ""
+        self.last_stop: Optional[Dict[str, Any]] = None
+        self.checkpoint: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self) -> None:
+        if self._loaded: return
+        self._loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f: st = json.load(f)
+        except (OSError, ValueError):
+            return
+        # repart un peu plus vite que la fin du run précédent : le délai se réajuste de lui-même
+        self.delay = min(self.max, max(self.min, float(st.get("delay_s", self.min)) * 0.75))
+        self.baseline = {k: float(v) for k, v in (st.get("baseline_s") or {}).items()}
+        self.last_stop = st.get("last_stop")
+
+    def save(self) -> None:
+        with self._lock:
+            st = {"delay_s": round(self.delay, 3), "baseline_s": {k: round(v, 3) for k, v in self.baseline.items()},
+                  "requests": self.used, "updated_at": datetime.now().isoformat(timespec="seconds"),
+                  "last_stop": self.last_stop, "checkpoint": self.checkpoint}
+        METRICS.set("pacing_delay_seconds", self.delay)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(st, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def cooling_down(self) -> Optional[str]:
+        """Raison de ne pas démarrer : arrêt sur alerte / erreurs il y a moins de cooldown_min."""
+        self.load()
+        st = self.last_stop or {}
+        if st.get("reason") not in ("alert", "errors"): return None
+        try: age = (datetime.now() - datetime.fromisoformat(st["at"])).total_seconds()
+        except (KeyError, ValueError): return None
+        return f"arrêt '{st['reason']}' il y a {age / 60:.0f} min" if age < self.cooldown else None
+
+    def _stop(self, reason: str) -> None:
+        self.last_stop = {"reason": reason, "at": datetime.now().isoformat(timespec="seconds")}
+        METRICS.inc("pacing_stops", reason=reason)
+        self.save()
+        raise PacingStop(reason)
+
+    def wait(self, kind: str = "request") -> None:
+        """Avant chaque requête : contrôle budget / alertes, puis attente du délai courant."""
+        self.load()
+        with self._lock:
+            stop = ("alert" if self.alerted else "errors" if self.errors >= self.max_errors
+                    else "budget" if self.used >= self.budget else "")
+            self.used += 1; delay = self.delay
+        if stop: self._stop(stop)
+        METRICS.inc("pronote_requests", kind=kind)
+        if delay > 0:
+            delay *= random.uniform(0.8, 1.2)
+            METRICS.inc("pacing_wait_seconds", delay)
+            time.sleep(delay)
+
+    def observe(self, latency: Optional[float], ok: bool = True, kind: str = "request") -> None:
+        """Résultat d'une requête ; ne lève jamais (appelable depuis un callback réseau)."""
+        with self._lock:
+            if not ok:
+                self.errors += 1
+                self.delay = min(self.max, max(self.delay * 2, self.step * 4)); return
+            self.errors = 0
+            ref = self.baseline.get(kind)
+            if latency is None: return
+            if ref is not None and latency > ref * self.slow_factor:
+                self.delay = min(self.max, max(self.delay * 2, self.step * 4))
+            else:
+                self.delay = max(self.min, self.delay - self.step)
+            self.baseline[kind] = latency if ref is None else 0.8 * ref + 0.2 * latency
+
+    def note_checkpoint(self, **info: Any) -> None:
+        """Point de reprise après un arrêt (un par compte), écrit avec l'état du rythme."""
+        who = getattr(THREAD_CTX, "metric_labels", {}).get("account", "default")
+        with self._lock: self.checkpoint[who] = dict(info, at=datetime.now().isoformat(timespec="seconds"))
+        self.save()
+
+    def alert(self, reason: str) -> None:
+        """Message de suspension / surcharge vu : la prochaine requête arrête le run."""
+        with self._lock:
+            self.alerted = reason
+            self.last_stop = {"reason": "alert", "at": datetime.now().isoformat(timespec="seconds")}
+
+    def call(self, kind: str, fn: Callable, *args, **kwargs):
+        """wait() + appel chronométré + observe() ; une exception compte comme erreur."""
+        self.wait(kind)
+        t0 = time.monotonic()
+        try:
+            res = fn(*args, **kwargs)
+        except Exception as e:
+            self.observe(None, ok=False, kind=kind)
+            if is_pronote_alert(str(e)): self.alert(str(e)[:200])
+            raise
+        self.observe(time.monotonic() - t0, kind=kind)
+        return res
+
+PACER = PronotePacer(
+    os.path.join(STATE_DIR, "pacing.json"),
+    budget=int(os.getenv("PRONOTE_REQUEST_BUDGET", "600")),
+    min_ms=int(os.getenv("PACING_MIN_MS", "0")), max_ms=int(os.getenv("PACING_MAX_MS", "8000")),
+    step_ms=int(os.getenv("PACING_STEP_MS", "50")), slow_factor=float(os.getenv("PACING_SLOW_FACTOR", "3")),
+    max_errors=int(os.getenv("PACING_MAX_ERRORS", "5")), cooldown_min=int(os.getenv("PACING_COOLDOWN_MIN", "120")),
+)
+
+# ===================== Budget temps du run =====================
+class BudgetExceeded(TimeoutError):
+    """Tranche de temps épuisée (run, phase ou semaine) : l'opération en cours est abandonnée."""
+
+class RunBudget:
+    """
+    Échéance globale du run découpée en tranches (phase, semaine). Une tranche reçoit, au moment
+    où elle commence, sa part du temps restant moins la réserve des phases suivantes : le temps
+    qu'une semaine n'a pas consommé revient donc aux suivantes. Les timeouts des opérations sont
+    pris dans la tranche courante (pile par thread : comptes en parallèle). total_s=0 : illimité.
+    """
+    def __init__(self, total_s: float, reserve_s: float):
+        self.total_s = total_s; self.reserve_s = reserve_s
+        self.t0 = time.monotonic()
+        self._local = threading.local()
+
+    def _stack(self) -> List[Tuple[str, float]]:
+        st = getattr(self._local, "stack", None)
+        if st is None: st = self._local.stack = []
+        return st
+
+    def remaining(self) -> float:
+        """Temps restant avant l'échéance du run."""
+        return self.t0 + self.total_s - time.monotonic() if self.total_s > 0 else float("inf")
+
+    def left(self) -> float:
+        """Temps restant dans la tranche courante (bornée par l'échéance du run)."""
+        st = self._stack()
+        return min(self.remaining(), st[-1][1] - time.monotonic()) if st else self.remaining()
+
+    @contextmanager
+    def slice(self, name: str, share: float = 1.0, reserve_s: float = 0.0) -> Iterator[float]:
+        """Tranche nommée : share x (temps restant - reserve_s), dans la tranche englobante."""
+        avail = self.left()
+        span = max(0.0, (avail - reserve_s) * share) if avail != float("inf") else avail
+        st = self._stack()
+        st.append((name, time.monotonic() + span))
+        try: yield span
+        finally: st.pop()
+
+    def check(self, what: str) -> None:
+        if self.left() <= 0:
+            st = self._stack()
+            raise BudgetExceeded(f"{st[-1][0] if st else 'run'}: budget épuisé ({what})")
+
+    def timeout_ms(self, cap_ms: float) -> int:
+        """Timeout d'une opération : cap_ms, ramené au temps restant dans la tranche."""
+        self.check("avant l'opération")
+        return int(max(1.0, min(cap_ms, self.left() * 1000)))
+
+BUDGET = RunBudget(float(os.getenv("RUN_DEADLINE_S", "0")), float(os.getenv("RUN_RESERVE_S", "120")))
+
+# ===================== Appels Calendar =====================
+def backoff_sleep(i: int) -> None:
+    delay = min(30, (2 ** i) + random.uniform(0, 0.5))
+    METRICS.inc("gcal_backoff_seconds", delay)
+    time.sleep(delay)
+
+class RateLimiter:
+    """Seau à jetons : au plus `qps` requêtes Calendar par seconde (0 = illimité)."""
+    def __init__(self, qps: float, burst: Optional[float] = None):
+        self.qps = qps
+        self.capacity = burst if burst is not None else max(1.0, qps)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()   # partagé par les sinks (quota par utilisateur, pas par agenda)
+
+    def acquire(self, cost: float = 1.0) -> None:
+        if self.qps <= 0: return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.qps)
+                self.stamp = now
+                if self.tokens >= min(cost, self.capacity):
+                    self.tokens -= cost   # un batch peut passer en négatif : le suivant attend d'autant
+                    return
+                wait = (min(cost, self.capacity) - self.tokens) / self.qps
+            METRICS.inc("gcal_throttle_seconds", wait)
+            time.sleep(wait)
+
+# Quota Calendar par défaut : 600 requêtes / minute / utilisateur
+RATE_LIMITER = RateLimiter(float(os.getenv("GCAL_MAX_QPS", "10")))
+
+def _is_rate_limit(e: HttpError) -> bool:
+    return bool(getattr(e, "resp", None) and e.resp.status in (403, 429))
+
+def execute_with_retry(request, tries: int = 5, cost: int = 1):
+    """Exécute une requête googleapiclient (rythmée par RATE_LIMITER) avec backoff sur 403/429."""
+    method = getattr(request, "methodId", None) or "batch"
+    for i in range(tries):
+        RATE_LIMITER.acquire(cost)
+        try:
+            resp = request.execute()
+        except HttpError as e:
+            METRICS.inc("gcal_requests", method=method, status=_http_status(e) or "error")
+            if _is_rate_limit(e) and i < tries - 1:
+                METRICS.inc("gcal_retries", method=method)
+                log("[GCAL] Rate limit — retry..."); backoff_sleep(i); continue
+            raise
+        METRICS.inc("gcal_requests", method=method, status=200)
+        return resp
+
+def iter_events(svc, cal_id: str, page_size: int = 2500, **params) -> Iterator[Dict[str, Any]]:
+    """Parcourt TOUTES les pages d'un events.list (nextPageToken), une page en mémoire à la fois."""
+    page_token = None
+    while True:
+        req = dict(params, calendarId=cal_id, maxResults=page_size)
+        if page_token: req["pageToken"] = page_token
+        resp = execute_with_retry(svc.events().list(**req))
+        yield from resp.get("items", [])
+        page_token = resp.get("nextPageToken")
+        if not page_token: break
+
+class JsonlWriter:
+    """Dump JSONL incrémental (un enregistrement par ligne) : mémoire constante."""
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._f = None
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        if self._f is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._f = open(self.path, "w", encoding="utf-8")
+        self._f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        if self._f: self._f.close(); self._f = None
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+BATCH_SIZE = 50   # max Google : 1000, mais 50 reste sous les quotas par utilisateur
+
+def _op_request(events, cal_id: str, op: Dict[str, Any]):
+    if op["op"] == "insert":
+        return events.insert(calendarId=cal_id, body=op["body"], sendUpdates="none")
+    if op["op"] == "patch":
+        return events.patch(calendarId=cal_id, eventId=op["event_id"], body=op["body"], sendUpdates="none")
+    return events.delete(calendarId=cal_id, eventId=op["event_id"], sendUpdates="none")
+
+_COUNT_KEY = {"insert": "created", "patch": "updated", "delete": "deleted"}
+
+def _http_status(e: Exception) -> Optional[int]:
+    return getattr(getattr(e, "resp", None), "status", None)
+
+def _conflict_patch(op: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insert à id déterministe en 409 (existe déjà, éventuellement annulé) -> patch du même id."""
+    ev_id = op.get("body", {}).get("id") if op["op"] == "insert" else None
+    if not ev_id: return None
+    return {"op": "patch", "key": op.get("key"), "event_id": ev_id, "body": dict(op["body"], status="confirmed"),
+            "jid": op.get("jid")}   # confirme l'entrée de journal de l'insert d'origine
+
+def apply_ops_batched(svc, cal_id: str, ops: List[Dict[str, Any]],
+                      on_write: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                      batch_size: int = BATCH_SIZE, tries: int = 5,
+                      journal: Optional[WriteJournal] = None) -> Dict[str, int]:
+    """
+    Envoie les opérations par requêtes batch. Les sous-requêtes en 403/429 sont
+    rejouées avec backoff ; un delete en 404/410 compte comme fait (déjà supprimé).
+    Avec un journal : 'pending' avant l'envoi, confirmations notées (rejeu déjà confirmé sauté).
+    """
+    counts = {"created": 0, "updated": 0, "deleted": 0, "errors": 0}
+    events = svc.events()
+    pending = journal.begin(cal_id, ops) if journal else list(ops)
+    for attempt in range(tries):
+        retry: List[Dict[str, Any]] = []
+        conflicts: List[Dict[str, Any]] = []
+        for i in range(0, len(pending), batch_size):
+            chunk = pending[i:i + batch_size]
+
+            def _cb(request_id, response, exception, chunk=chunk):
+                op = chunk[int(request_id)]
+                method = f"calendar.events.{op['op']}"
+                METRICS.inc("gcal_requests", method=method, status=(_http_status(exception) or "error") if exception else 200)
+                if exception is not None:
+                    status = _http_status(exception)
+                    if op["op"] == "delete" and status in (404, 410):
+                        counts["deleted"] += 1
+                        if journal: journal.ack(op)
+                        return
+                    if status == 409 and _conflict_patch(op):
+                        conflicts.append(_conflict_patch(op)); return
+                    if isinstance(exception, HttpError) and _is_rate_limit(exception):
+                        METRICS.inc("gcal_retries", method=method)
+                        retry.append(op); return
+                    log(f"[GCAL] {op['op']} {op.get('event_id') or op.get('key')}: {exception}")
+                    counts["errors"] += 1; return
+                counts[_COUNT_KEY[op["op"]]] += 1
+                if journal: journal.ack(op)
+                if on_write: on_write(op["op"], response or {"id": op.get("event_id")})
+
+            batch = svc.new_batch_http_request(callback=_cb)
+            for j, op in enumerate(chunk):
+                batch.add(_op_request(events, cal_id, op), request_id=str(j))
+            execute_with_retry(batch, cost=len(chunk))
+        if not (retry or conflicts):
+            break
+        pending = retry + conflicts
+        if attempt == tries - 1:
+            counts["errors"] += len(pending)
+        elif retry:
+            log(f"[GCAL] {len(retry)} requêtes batch limitées — retry..."); backoff_sleep(attempt)
+    return counts
+
+def compact_event(ev: Dict[str, Any]) -> Dict[str, Any]:
+    """Champs utiles d'un évènement existant (état "avant" d'un plan)."""
+    return {"summary": ev.get("summary", ""), "location": ev.get("location", ""),
+            "start": ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date"),
+            "end": ev.get("end", {}).get("dateTime") or ev.get("end", {}).get("date")}
+
+def sweep_ops(events: Iterable[Dict[str, Any]], seen_keys: set, source_tag: str,
+              namespace: str = "") -> List[Dict[str, Any]]:
+    """
+    Balayage (mark-and-sweep) : évènements de la source (et de l'espace de clés), dans
+    une plage entièrement relue, dont la clé dedupe n'a pas été produite -> suppression.
+    """
+    ops = []
+    for ev in events:
+        priv = ev.get("extendedProperties", {}).get("private", {})
+        if priv.get("source") != source_tag or priv.get("ns", "") != namespace: continue
+        if priv.get("dedupe") not in seen_keys:
+            ops.append({"op": "delete", "key": priv.get("dedupe"), "event_id": ev["id"], "sweep": True,
+                        "before": compact_event(ev)})
+    return ops
+
+# ===================== Plan / apply =====================
+PLAN_VERSION = 2   # v2 : plusieurs agendas par plan (v1 : un seul, toujours lisible)
+
+def _plan_entries(ops: List[Dict[str, Any]], summary: Dict[str, int]) -> List[Dict[str, Any]]:
+    entries = []
+    for op in ops:
+        summary[op["op"]] += 1
+        e = {"op": op["op"], "key": op.get("key")}
+        if op.get("event_id"): e["event_id"] = op["event_id"]
+        if op.get("before"): e["before"] = op["before"]
+        if op.get("body") is not None: e["after"] = op["body"]
+        entries.append(e)
+    return entries
+
+def write_plan(path: str, calendars: List[Tuple[str, List[Dict[str, Any]]]], **meta: Any) -> Dict[str, int]:
+    """
+    Plan sérialisé ([(agenda, opérations)]) : une entrée par opération avec l'état avant
+    (before) et le body à écrire (after). Rejouable tel quel : inserts à id déterministe,
+    deletes 404 = ok.
+    """
+    summary = {"insert": 0, "patch": 0, "delete": 0}
+    cals = [{"calendar_id": cal_id, "ops": _plan_entries(ops, summary)} for cal_id, ops in calendars]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": PLAN_VERSION, "created_at": datetime.now().isoformat(timespec="seconds"),
+                   "summary": summary, **meta, "calendars": cals}, f, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp, path)
+    return summary
+
+def read_plan(path: str) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    with open(path, encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") == 1:
+        plan["calendars"] = [{"calendar_id": plan["calendar_id"], "ops": plan["ops"]}]
+    elif plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"plan {path}: version {plan.get('version')} non supportée")
+    out = []
+    for cal in plan["calendars"]:
+        ops = []
+        for e in cal["ops"]:
+            op = {"op": e["op"], "key": e.get("key"), "event_id": e.get("event_id")}
+            if "after" in e: op["body"] = e["after"]
+            ops.append(op)
+        out.append((cal["calendar_id"], ops))
+    return out
+
+# ===================== Reprise : checkpoint + journal =====================
+def _lesson_dict(l: Lesson) -> Dict[str, Any]:
+    d = {k: getattr(l, k) for k in Lesson.__slots__}
+    d["start_dt"] = l.start_dt.isoformat(); d["end_dt"] = l.end_dt.isoformat()
+    return d
+
+def _lesson_from(d: Dict[str, Any]) -> Lesson:
+    return Lesson(**dict(d, start_dt=datetime.fromisoformat(d["start_dt"]), end_dt=datetime.fromisoformat(d["end_dt"])))
+
+class RunCheckpoint:
+    """
+    Semaines lues (cours compris) par un run qui n'est pas allé au bout : le run suivant les
+    reprend sans re-scraper. Valable pour la même identité (compte, périmètre) et max_age_h.
+    """
+    def __init__(self, path: str, identity: Dict[str, Any], max_age_h: float):
+        self.path = path; self.identity = identity
+        self.weeks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stale = False
+        try:
+            with open(path, encoding="utf-8") as f: st = json.load(f)
+        except (OSError, ValueError):
+            return
+        age = (datetime.now() - datetime.fromisoformat(st.get("updated_at", "1970-01-01T00:00:00"))).total_seconds()
+        if st.get("identity") != identity or age > max_age_h * 3600:
+            self.stale = True; return
+        self.weeks = st.get("weeks", {})
+
+    def has(self, source: str, key: Any) -> bool:
+        return f"{source}:{key}" in self.weeks
+
+    def week(self, source: str, key: Any) -> Optional[ScrapedWeek]:
+        w = self.weeks.get(f"{source}:{key}")
+        if w is None: return None
+        dt = lambda v: datetime.fromisoformat(v) if v else None
+        return ScrapedWeek(w["label"], dt(w["start"]), dt(w["end"]), [_lesson_from(l) for l in w["lessons"]], w["complete"])
+
+    def add_week(self, source: str, key: Any, week: ScrapedWeek) -> None:
+        with self._lock:
+            self.weeks[f"{source}:{key}"] = {
+                "label": week.label, "complete": week.complete,
+                "start": week.start.isoformat() if week.start else None, "end": week.end.isoformat() if week.end else None,
+                "lessons": [_lesson_dict(l) for l in week.lessons]}
+            st = {"identity": self.identity, "updated_at": datetime.now().isoformat(timespec="seconds"), "weeks": self.weeks}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(st, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.weeks = {}
+            try: os.remove(self.path)
+            except OSError: pass
+
+class WriteJournal:
+    """
+    Journal des écritures Calendar (JSONL, ajout seul) : 'pending' avant l'envoi, 'ack' une fois
+    confirmée. L'id est une empreinte (agenda, op, event_id, body). Les non confirmées du run
+    interrompu sont rejouées (insert -> 409 -> patch, delete 404/410 = fait : sans effet de bord) ;
+    une écriture nouvelle n'est jamais sautée, même si une identique a été confirmée avant.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.acked: set = set()
+        self.pending: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._f = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try: rec = json.loads(line)
+                    except ValueError: continue   # dernière ligne tronquée par un arrêt brutal
+                    if rec.get("t") == "pending":
+                        self.pending[rec["jid"]] = (rec["cal"], rec["op"]); self.acked.discard(rec["jid"])
+                    elif rec.get("t") == "ack": self.acked.add(rec["jid"]); self.pending.pop(rec["jid"], None)
+        except OSError:
+            pass
+
+    @staticmethod
+    def op_id(cal_id: str, op: Dict[str, Any]) -> str:
+        raw = json.dumps([cal_id, op["op"], op.get("event_id"), op.get("body")], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def _append(self, recs: List[Dict[str, Any]], sync: bool = False) -> None:
+        if not recs: return
+        if self._f is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs))
+        self._f.flush()
+        if sync: os.fsync(self._f.fileno())   # 'pending' sur disque avant l'envoi
+
+    def begin(self, cal_id: str, ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Note les opérations 'pending' ; renvoie les ops à envoyer (avec jid). Seul un rejeu (op déjà
+        porteuse d'un jid, lue dans le journal) est sauté s'il a été confirmé entre-temps.
+        """
+        out, recs = [], []
+        with self._lock:
+            for op in ops:
+                jid = op.get("jid") or self.op_id(cal_id, op)
+                if op.get("jid") and jid in self.acked:
+                    self.skipped += 1; continue
+                op = dict(op, jid=jid); out.append(op)
+                self.acked.discard(jid)   # nouvelle écriture : sa confirmation d'avant ne vaut plus
+                if jid not in self.pending:
+                    rec_op = {k: v for k, v in op.items() if k != "before"}
+                    self.pending[jid] = (cal_id, rec_op)
+                    recs.append({"t": "pending", "jid": jid, "cal": cal_id, "op": rec_op})
+            self._append(recs, sync=True)
+        return out
+
+    def ack(self, op: Dict[str, Any]) -> None:
+        jid = op.get("jid")
+        if not jid: return
+        with self._lock:
+            self.pending.pop(jid, None); self.acked.add(jid)
+            self._append([{"t": "ack", "jid": jid}])
+
+    def unacked(self, cal_id: str) -> List[Dict[str, Any]]:
+        with self._lock: return [op for cal, op in self.pending.values() if cal == cal_id]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f: self._f.close(); self._f = None
+
+    def clear(self) -> None:
+        self.close()
+        with self._lock:
+            self.acked.clear(); self.pending.clear()
+            try: os.remove(self.path)
+            except OSError: pass
+
+def settle_resume(checkpoint: RunCheckpoint, journal: WriteJournal, results: List[Dict[str, Any]], partial: Any) -> bool:
+    """
+    Fin de run : checkpoint et journal effacés seulement si tout a été lu ET écrit. Une écriture
+    en échec après retries (quota...) reste 'pending' et sera rejouée au prochain run.
+    """
+    if journal.skipped: log(f"[JOURNAL] {journal.skipped} écritures rejouées déjà confirmées, non renvoyées")
+    errors = sum(r.get("errors", 0) for r in results)
+    if partial or errors or any("error" in r for r in results):
+        why = f"{errors} écritures en échec" if errors else "run partiel"
+        log(f"[CHECKPOINT] {why} : {len(checkpoint.weeks)} semaines et le journal gardés pour la reprise")
+        return False
+    checkpoint.clear(); journal.clear()   # run complet : rien à reprendre
+    return True
+
+# ===================== Sonde de changement =====================
+class ChangeProbe:
+    """
+    Empreintes par semaine (grille PRONOTE, cours de l'API) du dernier run réussi : une semaine
+    dont l'empreinte n'a pas bougé n'est ni extraite ni réécrite. Tout est relu (forced) si la
+    configuration a changé ou si le dernier run complet date de plus de force_hours.
+    """
+    def __init__(self, path: str, identity: Dict[str, Any], force_hours: float):
+        self.path = path; self.identity = identity
+        self.fps: Dict[str, str] = {}
+        self.seen: Dict[str, str] = {}
+        self.forced = True
+        self.full_at: Optional[str] = None
+        try:
+            with open(path, encoding="utf-8") as f: st = json.load(f)
+        except (OSError, ValueError):
+            return
+        if st.get("identity") != identity: return
+        self.fps = st.get("fps", {})
+        self.full_at = st.get("full_at")
+        age = (datetime.now() - datetime.fromisoformat(self.full_at or "1970-01-01T00:00:00")).total_seconds()
+        self.forced = age > force_hours * 3600
+
+    @staticmethod
+    def fingerprint(obj: Any) -> str:
+        raw = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def unchanged(self, key: str, fp: str) -> bool:
+        return not self.forced and self.fps.get(key) == fp
+
+    def note(self, key: str, fp: str) -> None:
+        """Empreinte d'une semaine lue en entier ; enregistrée par commit() si ses écritures ont réussi."""
+        self.seen[key] = fp
+
+    def commit(self, full: bool, failed: Iterable[str] = ()) -> None:
+        """
+        full : toutes les semaines ont été relues (run forcé complet) -> nouvelle date de référence.
+        failed : semaines dont une écriture a échoué, sans empreinte -> relues au prochain run.
+        """
+        fps = dict(self.seen) if full else dict(self.fps, **self.seen)
+        for key in failed: fps.pop(key, None)
+        full_at = datetime.now().isoformat(timespec="seconds") if full else self.full_at
+        if not full_at: return   # jamais de run complet : pas de référence
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"identity": self.identity, "full_at": full_at, "fps": fps}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+# ===================== Destinations (sinks) =====================
+class EventSink:
+    """
+    Destination des semaines produites par une source. Chaque sink tourne dans son
+    propre thread (fan_out) : open() y est appelé, puis consume() par semaine, puis finish().
+    """
+    name = "sink"
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Toujours appelé (fin, abandon ou erreur) : fermeture des fichiers."""
+
+    def consume(self, week: ScrapedWeek) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> Dict[str, Any]:
+        return {}
+
+_END, _ABORT = object(), object()
+
+def fan_out(weeks: Iterable[ScrapedWeek], sinks: List[EventSink]) -> List[Dict[str, Any]]:
+    """
+    Un scrape, plusieurs sinks : les semaines sont lues ici (thread appelant, celui du
+    navigateur) et écrites en parallèle, une file et un thread par sink. Un sink en
+    erreur est abandonné sans bloquer les autres ; si la source échoue, finish() n'est
+    pas appelé (pas de balayage / vérification sur des données partielles).
+    """
+    queues: List[queue.Queue] = [queue.Queue() for _ in sinks]
+    results: List[Dict[str, Any]] = [{} for _ in sinks]
+    failed = [False] * len(sinks)
+    ctx = dict(vars(LOG_CTX))   # contexte du thread appelant (compte) hérité par les sinks
+
+    def _worker(i: int) -> None:
+        sink, q = sinks[i], queues[i]
+        vars(LOG_CTX).update(ctx)
+        try:
+            sink.open()
+            while True:
+                w = q.get()
+                if w is _END: results[i] = sink.finish(); return
+                if w is _ABORT: results[i] = {"aborted": True}; return
+                sink.consume(w)
+        except Exception as e:
+            failed[i] = True
+            log(f"[SINK] {sink.name}: {e}")
+            results[i] = {"error": str(e)}
+        finally:
+            try: sink.close()
+            except Exception: pass
+
+    threads = [threading.Thread(target=_worker, args=(i,), name=f"sink-{s.name}", daemon=True)
+               for i, s in enumerate(sinks)]
+    for t in threads: t.start()
+    end = _ABORT
+    try:
+        for week in weeks:
+            for i, q in enumerate(queues):
+                if not failed[i]: q.put(week)
+        end = _END
+    finally:
+        for q in queues: q.put(end)
+        for t in threads: t.join()
+    return results
+
+# ===================== Séries hebdomadaires (RRULE) =====================
+_UNTIL_RE  = re.compile(r"UNTIL=(\d{8}T\d{6})Z")
+_EXDATE_RE = re.compile(r"^EXDATE[^:]*:(.*)$")
+
+def _utc_stamp(iso: str) -> str:
+    return datetime.fromisoformat(iso.replace("Z", "+00:00")).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def _rrule_parts(recurrence: List[str]) -> Tuple[Optional[datetime], List[datetime]]:
+    """(UNTIL, EXDATE) d'une récurrence écrite par WeeklySeries, en heure murale de Paris."""
+    until, exdates = None, []
+    for line in recurrence or []:
+        m = _UNTIL_RE.search(line) if line.startswith("RRULE:") else None
+        if m: until = paris_wall(datetime.strptime(m.group(1), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc))
+        m = _EXDATE_RE.match(line)
+        if m: exdates += [datetime.strptime(v[:15], "%Y%m%dT%H%M%S") for v in m.group(1).split(",") if v]
+    return until, exdates
+
+class WeeklySeries:
+    """
+    Cours répété chaque semaine au même créneau, écrit comme un seul évènement récurrent :
+    RRULE hebdomadaire, EXDATE pour les semaines sans ce cours (annulé, vacances, déplacé),
+    exceptions (patch de l'instance) pour les occurrences dont la salle ou la description
+    diffèrent de celles de la majorité.
+    """
+    def __init__(self, slot: str, occurrences: List[DesiredEvent]):
+        self.slot = slot
+        self.occurrences = occurrences
+        first, last = occurrences[0], occurrences[-1]
+        loc  = Counter(o.location for o in occurrences).most_common(1)[0][0]
+        desc = Counter(o.description for o in occurrences).most_common(1)[0][0]
+        sid = hashlib.md5(f"series|{slot}|{first.start}".encode("utf-8")).hexdigest()
+        self.base = DesiredEvent(sid, first.summary, loc, first.start, first.end, first.time_zone,
+                                 color_id=first.color_id, event_id=sid, description=desc,
+                                 private=dict(first.private or {}, kind="series", slot=slot))
+        self.first, self.last = paris_wall(first.start), paris_wall(last.start)
+        have = {paris_wall(o.start) for o in occurrences}
+        self.exdates = [self.first + timedelta(weeks=i) for i in range((self.last - self.first).days // 7 + 1)
+                        if self.first + timedelta(weeks=i) not in have]
+        self.until = _utc_stamp(last.start)
+        self.odd = [o for o in occurrences if (o.location, o.description) != (loc, desc)]
+
+    def recurrence(self) -> List[str]:
+        rec = [f"RRULE:FREQ=WEEKLY;UNTIL={self.until}"]
+        if self.exdates:
+            rec.append(f"EXDATE;TZID={self.base.time_zone}:" + ",".join(f"{d:%Y%m%dT%H%M%S}" for d in sorted(set(self.exdates))))
+        return rec
+
+    def body(self) -> Dict[str, Any]:
+        return dict(self.base.body(), recurrence=self.recurrence())
+
+    def differs(self, cur: Dict[str, Any]) -> bool:
+        return self.base.differs(cur) or (cur.get("recurrence") or []) != self.recurrence()
+
+    def instance_id(self, occ: DesiredEvent) -> str:
+        """Id Google d'une instance : <id maître>_<début d'origine en UTC>."""
+        return f"{self.base.event_id}_{_utc_stamp(occ.start)}"
+
+    def adopt(self, master: Dict[str, Any], window_start: datetime, max_gap_weeks: int) -> bool:
+        """
+        Reprend une série existante du même créneau qui précède celle-ci sans interruption : id et
+        début conservés (historique d'avant la fenêtre intact). Ses instances de la fenêtre qui ne
+        sont plus des cours, et celles rendues par le prolongement de UNTIL, passent en EXDATE.
+        """
+        if master["id"] != self.base.event_id:
+            if ((master.get("location") or "") != self.base.location
+                    or (master.get("description") or "") != (self.base.description or "")):
+                return False
+            start = master.get("start", {}).get("dateTime")
+            until, _ = _rrule_parts(master.get("recurrence"))
+            if not start or until is None or paris_wall(start) > self.first: return False
+            if (self.first - paris_wall(start)).days % 7 or (self.first - paris_wall(start)).seconds: return False
+            if until < self.first - timedelta(weeks=max_gap_weeks + 1): return False
+        start, end = master["start"]["dateTime"], master["end"]["dateTime"]
+        until, old_ex = _rrule_parts(master.get("recurrence"))
+        extra, t = [d for d in old_ex if d < window_start], paris_wall(start)
+        while t < self.first:
+            if t >= window_start or (until and t > until): extra.append(t)
+            t += timedelta(weeks=1)
+        self.base.key = self.base.event_id = master["id"]
+        self.base.start, self.base.end = start, end
+        self.exdates = extra + self.exdates
+        return True
+
+def compress_weekly(desired: Dict[str, DesiredEvent], min_weeks: int = 3,
+                    max_gap_weeks: int = 3) -> Tuple[List[WeeklySeries], Dict[str, DesiredEvent]]:
+    """
+    Regroupe les cours d'un même créneau (titre, jour, heures, couleur) revenant chaque semaine
+    en séries ; un trou de plus de max_gap_weeks semaines coupe la série. Les séries de moins de
+    min_weeks cours et les dateTime sans offset restent des évènements isolés.
+    """
+    slots: Dict[str, List[DesiredEvent]] = {}
+    singles: Dict[str, DesiredEvent] = {}
+    for k, d in desired.items():
+        if datetime.fromisoformat(d.start.replace("Z", "+00:00")).tzinfo is None:
+            singles[k] = d; continue
+        w, e = paris_wall(d.start), paris_wall(d.end)
+        slot = hashlib.sha1(f"{d.summary}|{w:%a %H:%M}|{e:%H:%M}|{d.color_id}".encode("utf-8")).hexdigest()[:16]
+        slots.setdefault(slot, []).append(d)
+    series: List[WeeklySeries] = []
+    for slot, occ in slots.items():
+        occ.sort(key=lambda d: paris_wall(d.start))
+        runs, cur = [], [occ[0]]
+        for d in occ[1:]:
+            gap = (paris_wall(d.start) - paris_wall(cur[-1].start)).days // 7
+            if 1 <= gap <= max_gap_weeks + 1: cur.append(d)
+            else: runs.append(cur); cur = [d]   # trou trop long (ou deux cours le même jour)
+        runs.append(cur)
+        for run in runs:
+            if len(run) >= min_weeks: series.append(WeeklySeries(slot, run))
+            else: singles.update((d.key, d) for d in run)
+    return series, singles
+
+def series_ops(series: List[WeeklySeries], existing: List[Dict[str, Any]], window_start: datetime,
+               max_gap_weeks: int = 3, sweep: bool = True) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Opérations des séries : (maîtres, exceptions). Les exceptions s'appliquent après les maîtres
+    (une instance n'existe qu'une fois son maître écrit). Sans sweep, les séries existantes non
+    reprises sont laissées ; sinon supprimées, ou arrêtées au début de la fenêtre si elles ont
+    un historique avant celle-ci.
+    """
+    masters = {e["id"]: e for e in existing if e.get("recurrence")}
+    exceptions = {e["id"]: e for e in existing if e.get("recurringEventId")}
+    by_slot: Dict[str, List[Dict[str, Any]]] = {}
+    for m in sorted(masters.values(), key=lambda m: m.get("start", {}).get("dateTime", "")):
+        by_slot.setdefault(m.get("extendedProperties", {}).get("private", {}).get("slot", ""), []).append(m)
+    used: set = set()
+    ops, inst = [], []
+    for s in series:
+        cand = [m for m in by_slot.get(s.slot, []) if m["id"] not in used]
+        cand.sort(key=lambda m: m["id"] != s.base.event_id)   # même id d'abord : simple mise à jour
+        for m in cand:
+            if s.adopt(m, window_start, max_gap_weeks):
+                used.add(m["id"]); break
+        cur = masters.get(s.base.event_id)
+        if cur is None:
+            ops.append({"op": "insert", "key": s.base.key, "body": s.body()})
+        elif s.differs(cur):
+            ops.append({"op": "patch", "key": s.base.key, "event_id": cur["id"], "body": s.body(), "before": compact_event(cur)})
+        odd = {s.instance_id(o): o for o in s.odd}
+        for o in s.occurrences:
+            iid = s.instance_id(o)
+            want = odd.get(iid, s.base)   # exception retirée : retour aux valeurs de la série
+            have = exceptions.get(iid)
+            if have is None and iid not in odd: continue
+            if have is not None and (have.get("location") or "") == want.location \
+                    and (have.get("description") or "") == (want.description or ""):
+                continue
+            inst.append({"op": "patch", "key": o.key, "event_id": iid,
+                         "body": {"location": want.location, "description": want.description}})
+    if sweep:
+        kept = used | {s.base.event_id for s in series}
+        for m in masters.values():
+            if m["id"] in kept: continue
+            start = paris_wall(m.get("start", {}).get("dateTime") or "1970-01-01T00:00:00")
+            if start >= window_start:
+                ops.append({"op": "delete", "key": None, "event_id": m["id"], "before": compact_event(m)})
+                continue
+            until, _ = _rrule_parts(m.get("recurrence"))
+            if until is None or until > window_start:
+                stop = _utc_stamp(to_rfc3339_local(window_start - timedelta(seconds=1)))
+                rec = [f"RRULE:FREQ=WEEKLY;UNTIL={stop}" if r.startswith("RRULE:") else r for r in m["recurrence"]]
+                ops.append({"op": "patch", "key": None, "event_id": m["id"], "body": {"recurrence": rec}})
+    return ops, inst
+
+# ===================== Réconciliation =====================
+def _same_time(a: Optional[str], b: Optional[str]) -> bool:
+    """Compare deux dateTime RFC3339 à la minute UTC ; sans offset : heure de Paris."""
+    if a == b: return True
+    if not (a and b): return False
+    try: return epoch_min(a) == epoch_min(b)
+    except ValueError: return False
+
+class CalendarReconciler:
+    """
+    Réconciliateur unique : `desired` (clé -> DesiredEvent) est comparé à l'existant puis
+    transformé en opérations insert / patch / delete.
+    - lookup(key, desired) -> évènement existant ou None (index pré-listé ou recherche) ;
+      avec un event_id déterministe, insert puis patch sur 409 : aucune lecture nécessaire
+    - owned : évènements possédés par la synchro (clé -> évènement), pour les suppressions
+    """
+    def __init__(self, svc, cal_id: str,
+                 lookup: Callable[[str, DesiredEvent], Optional[Dict[str, Any]]],
+                 owned: Optional[Dict[str, Dict[str, Any]]] = None,
+                 delete_missing: bool = False,
+                 on_write: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 journal: Optional[WriteJournal] = None):
+        self.svc = svc
+        self.journal = journal
+        self.cal_id = cal_id
+        self.lookup = lookup
+        self.owned = owned or {}
+        self.delete_missing = delete_missing
+        self.on_write = on_write
+        self.deleted_ids: set = set()   # ids supprimés par le dernier sync() (à exclure d'un balayage)
+
+    def diff(self, desired: Dict[str, DesiredEvent]) -> List[Dict[str, Any]]:
+        ops: List[Dict[str, Any]] = []
+        for key, d in desired.items():
+            cur = self.lookup(key, d)
+            if cur is None:
+                ops.append({"op": "insert", "key": key, "body": d.body()})
+            elif d.event_id and cur["id"] != d.event_id:
+                # évènement hérité (id aléatoire) : un id ne se renomme pas -> remplacement
+                ops.append({"op": "delete", "key": key, "event_id": cur["id"], "legacy": True, "before": compact_event(cur)})
+                ops.append({"op": "insert", "key": key, "body": d.body()})
+            elif d.differs(cur):
+                ops.append({"op": "patch", "key": key, "event_id": cur["id"], "body": d.body(), "before": compact_event(cur)})
+        if self.delete_missing:
+            for key, ev in self.owned.items():
+                if key not in desired:
+                    ops.append({"op": "delete", "key": key, "event_id": ev["id"], "before": compact_event(ev)})
+        return ops
+
+    def apply(self, ops: List[Dict[str, Any]], batch: bool = False) -> Dict[str, int]:
+        if batch:
+            return apply_ops_batched(self.svc, self.cal_id, ops, on_write=self.on_write, journal=self.journal)
+        counts = {"created": 0, "updated": 0, "deleted": 0, "errors": 0}
+        events = self.svc.events()
+        for op in (self.journal.begin(self.cal_id, ops) if self.journal else ops):
+            try:
+                try:
+                    ev = execute_with_retry(_op_request(events, self.cal_id, op))
+                except HttpError as e:
+                    if _http_status(e) != 409 or not _conflict_patch(op): raise
+                    op = _conflict_patch(op)
+                    ev = execute_with_retry(_op_request(events, self.cal_id, op))
+            except HttpError as e:
+                if op["op"] == "delete" and _http_status(e) in (404, 410):
+                    ev = None   # déjà supprimé : fait, comme dans apply_ops_batched
+                else:
+                    log(f"[GCAL] {op['op']} {op.get('event_id') or op.get('key')}: {e}")
+                    counts["errors"] += 1
+                    continue
+            counts[_COUNT_KEY[op["op"]]] += 1
+            if self.journal: self.journal.ack(op)
+            if self.on_write: self.on_write(op["op"], ev or {"id": op.get("event_id")})
+        return counts
+
+    def sync(self, desired: Dict[str, DesiredEvent]) -> Dict[str, int]:
+        ops = self.diff(desired)
+        self.deleted_ids = {op["event_id"] for op in ops if op["op"] == "delete"}
+        counts = self.apply(ops)
+        counts["unchanged"] = len(desired) - sum(1 for op in ops if op["op"] != "delete")
+        return counts
@@ -0,0 +1,79 @@
+# test_resume.py
+# SPDX-License-Identifier: MIT
+"""
+Reprise d'un run : une écriture Calendar en échec après retries reste dans le journal
+et est rejouée au run suivant ; un run complet efface checkpoint et journal.
+    python -m pytest -q test_resume.py
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from gcal_standin import GcalStandin, standin_service
+from sync_engine import (CalendarReconciler, DesiredEvent, Lesson, RunCheckpoint, ScrapedWeek, WriteJournal,
+                         apply_ops_batched, settle_resume)
+
+CAL = "resume@group.calendar.google.com"
+SOURCE_TAG = "pronote_playwright"
+MONDAY = datetime(2025, 9, 8)
+
+def _state(tmp_path):
+    cp = RunCheckpoint(os.path.join(tmp_path, "checkpoint.json"), {"t": 1}, 12)
+    lesson = Lesson("MATHEMATIQUES", "S101", MONDAY + timedelta(hours=8), MONDAY + timedelta(hours=9))
+    cp.add_week("playwright", 1, ScrapedWeek("S1", MONDAY, MONDAY + timedelta(days=7), [lesson], complete=True))
+    return cp, WriteJournal(os.path.join(tmp_path, "journal.jsonl"))
+
+def _desired(event_id: str) -> DesiredEvent:
+    return DesiredEvent(event_id, "MATHEMATIQUES", "S101", "2025-09-08T08:00:00+02:00", "2025-09-08T09:00:00+02:00",
+                        "Europe/Paris", event_id=event_id, private={"source": SOURCE_TAG, "dedupe": event_id})
+
+def test_failed_write_is_kept_for_next_run(tmp_path):
+    with GcalStandin() as standin:
+        standin.seed(CAL, [])
+        svc = standin_service(standin.url)
+        cp, journal = _state(tmp_path)
+        ok = _desired("a0000000000000000001")
+        # patch d'un évènement absent : 404, échec définitif pour ce run
+        lost = {"op": "patch", "key": "b", "event_id": "b0000000000000000002", "body": _desired("b0000000000000000002").body()}
+        rec = CalendarReconciler(svc, CAL, lookup=lambda k, d: None, journal=journal)
+        res = rec.apply(rec.diff({ok.key: ok}) + [lost])
+        assert res["created"] == 1 and res["errors"] == 1
+
+        assert settle_resume(cp, journal, [dict(res, unchanged=0)], partial=None) is False
+        journal.close()
+
+        nxt = WriteJournal(journal.path)
+        assert [op["event_id"] for op in nxt.unacked(CAL)] == [lost["event_id"]]
+        assert RunCheckpoint(cp.path, {"t": 1}, 12).weeks
+
+        # run suivant : l'évènement existe désormais, le rejeu passe et tout est effacé
+        standin.seed(CAL, [_desired("b0000000000000000002").body()])
+        replay = apply_ops_batched(svc, CAL, nxt.unacked(CAL), journal=nxt)
+        assert replay["errors"] == 0 and not nxt.unacked(CAL)
+        assert settle_resume(RunCheckpoint(cp.path, {"t": 1}, 12), nxt, [replay], partial=None) is True
+        assert not os.path.exists(nxt.path) and not os.path.exists(cp.path)
+
+def test_confirmed_write_does_not_hide_a_later_identical_one(tmp_path):
+    with GcalStandin() as standin:
+        standin.seed(CAL, [])
+        svc = standin_service(standin.url)
+        path = os.path.join(tmp_path, "journal.jsonl")
+        d = _desired("c0000000000000000003")
+        insert = {"op": "insert", "key": d.key, "body": d.body()}
+        delete = {"op": "delete", "key": d.key, "event_id": d.event_id}
+        first = WriteJournal(path)
+        assert apply_ops_batched(svc, CAL, [insert], journal=first)["created"] == 1
+        assert apply_ops_batched(svc, CAL, [delete], journal=first)["deleted"] == 1
+        first.close()
+
+        # run suivant, journal gardé : le cours revient avec le même body, l'insert part quand même
+        nxt = WriteJournal(path)
+        res = apply_ops_batched(svc, CAL, [insert], journal=nxt)   # 409 sur l'id annulé -> patch status=confirmed
+        assert res["created"] + res["updated"] == 1 and nxt.skipped == 0
+        nxt.close()
+        assert svc.events().get(calendarId=CAL, eventId=d.event_id).execute()["status"] == "confirmed"
@@ -0,0 +1,94 @@
+# test_sync_engine.py
+# SPDX-License-Identifier: MIT
+"""
+Logique pure du moteur (sans navigateur ni compte Google) : écritures du réconciliateur
+contre la doublure locale, séries hebdomadaires (RRULE) et heure de Paris aux changements d'heure.
+    python -m pytest -q test_sync_engine.py
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from gcal_standin import GcalStandin, standin_service
+import sync_engine
+from sync_engine import (CalendarReconciler, DesiredEvent, apply_ops_batched, compress_weekly, iter_events,
+                         paris_offset_min, series_ops, to_rfc3339_local)
+
+CAL = "engine@group.calendar.google.com"
+MONDAY = datetime(2025, 9, 1)   # début de fenêtre des séries
+
+def _maths(weeks, rooms=None):
+    """Lundi 8h-8h55 heure de Paris sur les semaines données (offset de la date, comme le scrape)."""
+    rooms = rooms or {}; out = {}
+    for w in weeks:
+        s = MONDAY + timedelta(weeks=w, hours=8)
+        k = f"m{w:02d}".ljust(20, "0")
+        out[k] = DesiredEvent(k, "MATHEMATIQUES", rooms.get(w, "S101"), to_rfc3339_local(s),
+                              to_rfc3339_local(s + timedelta(minutes=55)), "Europe/Paris",
+                              event_id=k, private={"source": "engine"})
+    return out
+
+def test_delete_of_missing_event_counts_as_done():
+    with GcalStandin() as standin:
+        standin.seed(CAL, [])
+        rec = CalendarReconciler(standin_service(standin.url), CAL, lookup=lambda k, d: None)
+        res = rec.apply([{"op": "delete", "key": "k", "event_id": "d0000000000000000004"}])
+        assert res["deleted"] == 1 and res["errors"] == 0
+
+# ===== Séries hebdomadaires =====
+def test_short_gap_becomes_exdate():
+    series, singles = compress_weekly(_maths([0, 1, 3, 4]))
+    assert len(series) == 1 and not singles
+    assert series[0].recurrence() == ["RRULE:FREQ=WEEKLY;UNTIL=20250929T060000Z",
+                                      "EXDATE;TZID=Europe/Paris:20250915T080000"]
+
+def test_long_gap_breaks_the_series():
+    series, singles = compress_weekly(_maths([0, 1, 2, 9, 10]), min_weeks=3, max_gap_weeks=3)
+    assert [len(s.occurrences) for s in series] == [3]
+    assert sorted(singles) == ["m09".ljust(20, "0"), "m10".ljust(20, "0")]   # reste trop court pour une série
+
+def test_room_change_is_an_instance_patch():
+    series, _ = compress_weekly(_maths(range(6), rooms={2: "S202"}))
+    masters, instances = series_ops(series, [], MONDAY)
+    assert [op["op"] for op in masters] == ["insert"]
+    assert masters[0]["body"]["location"] == "S101"
+    assert [(op["op"], op["event_id"], op["body"]["location"]) for op in instances] == \
+        [("patch", f"{series[0].base.event_id}_20250915T060000Z", "S202")]
+
+def test_second_run_writes_nothing():
+    with GcalStandin() as standin:
+        standin.seed(CAL, [])
+        svc = standin_service(standin.url)
+
+        def plan():
+            # objets neufs à chaque run : adopt() réécrit le cours de base de la série
+            series, singles = compress_weekly(_maths([0, 1, 3, 4, 5, 6], rooms={4: "S202"}))
+            existing = list(iter_events(svc, CAL, singleEvents=False, privateExtendedProperty="source=engine"))
+            return series_ops(series, existing, MONDAY), singles
+
+        (masters, instances), singles = plan()
+        assert masters and instances and not singles
+        for ops in (masters, instances):
+            assert apply_ops_batched(svc, CAL, ops)["errors"] == 0
+        assert plan()[0] == ([], [])
+
+# ===== Heure de Paris =====
+@pytest.mark.parametrize("wall, offset", [
+    (datetime(2025, 3, 30, 1, 59), 60), (datetime(2025, 3, 30, 2, 30), 60), (datetime(2025, 3, 30, 3, 0), 120),
+    (datetime(2025, 10, 26, 1, 59), 120), (datetime(2025, 10, 26, 2, 30), 120), (datetime(2025, 10, 26, 3, 0), 60),
+])
+def test_offset_on_last_sundays(wall, offset, monkeypatch):
+    assert paris_offset_min(wall) == offset
+    monkeypatch.setattr(sync_engine, "PARIS", None)   # repli sans zoneinfo : même règle UE
+    paris_offset_min.cache_clear()
+    try: assert paris_offset_min(wall) == offset
+    finally: paris_offset_min.cache_clear()
+
+def test_rfc3339_around_dst():
+    assert to_rfc3339_local(datetime(2025, 3, 30, 1, 30)) == "2025-03-30T01:30:00+01:00"
+    assert to_rfc3339_local(datetime(2025, 3, 30, 3, 0)) == "2025-03-30T03:00:00+02:00"
+    assert to_rfc3339_local(datetime(2025, 10, 26, 3, 0)) == "2025-10-26T03:00:00+01:00"